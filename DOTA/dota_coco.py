@@ -1,20 +1,26 @@
 import os
+import numpy as np
 from tqdm import tqdm
-from matplotlib import pyplot as plt
-import json
+from coco_utils.columnar import columnar_path, open_coco_writer
+from coco_utils.file_cache import cached_ordered_map
+from coco_utils.geometry import min_area_rects, polygon_areas
+from coco_utils.image_size import get_image_size
+from coco_utils.metrics import add_count, stage, timed_iter
+from coco_utils.registry import Registry
 
 
-def dota_coco_images(image_folder):
-    images = os.listdir(image_folder)
-    images.sort()
+def dota_coco_images(image_folder, workers = 1, cache_path = None):
+    with stage('listing'):
+        images = os.listdir(image_folder)
+        images.sort()
+    add_count('images', len(images))
     coco_images = []
     image_count = 0
-    for i in tqdm(images):
-        im_path = image_folder + i
-        img = plt.imread(im_path)
-        h = img.shape[0]
-        w = img.shape[1]
-        id = int(i.split('.')[0].replace('P',''))
+    # Read image sizes across a thread pool, results come back in sorted order
+    im_paths = [image_folder + i for i in images]
+    sizes = cached_ordered_map(get_image_size, im_paths, workers, threads = True, cache_path = cache_path)
+    for i, (w, h, _) in tqdm(zip(images, timed_iter('image probing', sizes)), total = len(images)):
+        id = dota_im_id(i)
         coco = {"id": id, 
                 "width": w, 
                 "height": h, 
@@ -29,129 +35,236 @@ def dota_coco_images(image_folder):
 def get_im_from_id(im_id, coco_images):
     '''
     Given list of COCO image descriptions and an id return the COCO image description with that ID
+    This scans the whole list, for repeated lookups use coco_utils.dataset.CocoDataset.get_image
     '''
     for i in coco_images:
         if i['id'] == im_id:
             return i
     return None
 
-def get_make_coco_cat(cat_tag, cat_id, coco_categories):
+def dota_im_id(file_name):
     '''
-    cat_tag: string name of current category
-    cat_id: int id of highest category in current categories
-    coco_categories: partially populated coco style categories list
+    IN: DOTA image or label file name, e.g. P0001.png
+    OUT: int image id, e.g. 1
+    '''
+    return int(file_name.split('.')[0].replace('P',''))
 
-    purpose: return categrory id for current tag, creating it if necessary
+def parse_dota_header(line, header, label_fp = None):
+    '''
+    IN:
+        - line: a line of a DOTA label file
+        - header: dict to put the imagesource and gsd in if it's a header line
+        - label_fp: path of the file, printed if its gsd can't be read
+    OUT: True if the line was an imagesource or gsd header line
     '''
-    # First, check to see if the category is already in the list
-    for c in coco_categories:
-        if c['name'] == cat_tag:
-            ann_cat_id = c['id']
-            return ann_cat_id, cat_id, coco_categories
+    if line.startswith('imagesource:'):
+        header['imagesource'] = line[len('imagesource:'):]
+    elif line.startswith('gsd:'):
+        im_gsd = line[len('gsd:'):]
+        try:
+            header['gsd'] = None if im_gsd == 'null' else float(im_gsd)
+        except ValueError:
+            # One bad label file shouldn't stop the whole conversion
+            print('Bad gsd {!r} in {}'.format(im_gsd, label_fp))
+            header['gsd'] = None
+    else:
+        return False
+    return True
 
-    # If not, make a new category
-    new_cat = {
-              "id": cat_id, 
-               "name": cat_tag, 
-               "supercategory": "None"
-              }
-    coco_categories.append(new_cat) # add it to the full list
-    ann_cat_id = cat_id
-    cat_id += 1
+def read_dota_header(label_fp):
+    '''
+    IN: path to a DOTA label .txt file
+    OUT: dict of the imagesource and gsd from its header, either None if the file doesn't have it.
+         Reading stops at the first object line
+    '''
+    header = {'imagesource': None, 'gsd': None}
+    with open(label_fp, 'r') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.strip() and not parse_dota_header(line, header, label_fp):
+                break
+    return header
 
-    return ann_cat_id, cat_id, coco_categories
+def read_dota_labels(label_fp):
+    '''
+    IN: path to a DOTA label .txt file, with or without the imagesource/gsd header lines
+    OUT: dict of columnar data for the file:
+        - polygons: (N, 8) float array of x1,y1, x2, y2, x3, y3, x4, y4 per object
+        - categories: (N,) array of category tags
+        - difficult: (N,) int array
+        - imagesource: image source from the header, None if there is no header
+        - gsd: float gsd from the header, None if there is no header or it is null
+    '''
+    with open(label_fp, 'r') as f:
+        text = f.read().splitlines()
 
-def coco_anns_categories(coco_images, ann_folder):
+    header = {'imagesource': None, 'gsd': None}
+    rows = []
+    for line in text:
+        # Header lines
+        if not parse_dota_header(line, header, label_fp):
+            # Object lines, skipping blanks and anything else too short to be one
+            data = line.split()
+            if len(data) >= 9:
+                rows.append(data)
 
-    # list all the files in the annotations folder
+    # Convert all the coordinates at once
+    polygons = np.array([r[:8] for r in rows], dtype = np.float64).reshape(-1, 8)
+    categories = np.array([r[8] for r in rows], dtype = object)
+    difficult = np.array([int(r[9]) if len(r) > 9 else 0 for r in rows], dtype = np.int64)
+
+    return {'polygons': polygons,
+            'categories': categories,
+            'difficult': difficult,
+            'imagesource': header['imagesource'],
+            'gsd': header['gsd']}
+
+def dota_bboxes(polygons):
+    '''
+    IN: (N, 8) array of DOTA polygons
+    OUT: (N, 4) array of axis aligned [xmin, ymin, w, h] boxes, (N,) array of box areas
+    '''
+    xs = polygons[:, 0::2]
+    ys = polygons[:, 1::2]
+    xmin = xs.min(axis = 1)
+    ymin = ys.min(axis = 1)
+    w = xs.max(axis = 1) - xmin
+    h = ys.max(axis = 1) - ymin
+    bboxes = np.stack([xmin, ymin, w, h], axis = 1)
+    return bboxes, w * h
+
+def read_dota_folder(ann_folder, workers = 1, cache_path = None):
+    '''
+    PURPOSE: load a whole folder of DOTA labels into columnar arrays, for statistics, chipping etc.
+    IN:
+        - ann_folder: folder of DOTA label .txt files
+        - workers: number of processes to parse label files with
+        - cache_path: sqlite file to cache parsed label files in between runs, None to disable
+    OUT: dict of arrays with one row per object, in sorted label file order:
+        - image_ids: (N,) int image id
+        - polygons: (N, 8) float polygons
+        - bboxes: (N, 4) float [xmin, ymin, w, h]
+        - areas: (N,) float polygon areas
+        - rboxes: (N, 5) float [cx, cy, w, h, angle] minimum area rotated boxes
+        - category_idx: (N,) int index into category_names
+        - category_names: list of category tags, in first-seen order
+        - difficult: (N,) int
+    '''
     dota_anns = os.listdir(ann_folder)
+    dota_anns.sort()
+    label_fps = [ann_folder + a for a in dota_anns]
+
+    image_ids = []
+    polygons = []
+    categories = []
+    difficult = []
+    for a, labels in zip(dota_anns, cached_ordered_map(read_dota_labels, label_fps, workers, cache_path = cache_path)):
+        image_ids.append(np.full(len(labels['polygons']), dota_im_id(a), dtype = np.int64))
+        polygons.append(labels['polygons'])
+        categories.append(labels['categories'])
+        difficult.append(labels['difficult'])
+
+    polygons = np.concatenate(polygons) if polygons else np.zeros((0, 8))
+    categories = np.concatenate(categories) if categories else np.zeros(0, dtype = object)
+
+    # Index categories in first-seen order, to match the ids dota_to_coco hands out
+    category_names, first, category_idx = np.unique(categories, return_index = True, return_inverse = True)
+    order = np.argsort(first)
+    rank = np.empty(len(order), dtype = np.int64)
+    rank[order] = np.arange(len(order))
+
+    bboxes, _ = dota_bboxes(polygons)
+    corners = polygons.reshape(-1, 4, 2)
+
+    return {'image_ids': np.concatenate(image_ids) if image_ids else np.zeros(0, dtype = np.int64),
+            'polygons': polygons,
+            'bboxes': bboxes,
+            'areas': polygon_areas(corners),
+            'rboxes': min_area_rects(corners),
+            'category_idx': rank[category_idx.reshape(-1)],
+            'category_names': category_names[order].tolist(),
+            'difficult': np.concatenate(difficult) if difficult else np.zeros(0, dtype = np.int64)}
+
+def iter_coco_anns(ann_folder, categories, workers = 1, cache_path = None, rbox = False):
+    '''
+    IN:
+        - ann_folder: folder of DOTA label .txt files
+        - categories: category Registry, new categories are added to it as they are found
+        - workers: number of processes to parse label files with
+        - cache_path: sqlite file to cache parsed label files in between runs, None to disable
+        - rbox: also give each annotation its minimum area rotated box, [cx, cy, w, h, angle]
+    OUT: generator of coco annotations, in label file order, keeping each object's polygon as its segmentation
+    '''
+
+    # list all the files in the annotations folder
+    with stage('listing'):
+        dota_anns = os.listdir(ann_folder)
+        dota_anns.sort()
+    add_count('label files', len(dota_anns))
 
     # initialize key variables
     ann_id = 0
-    coco_anns = []
-    cat_id = 1
-    coco_categories = []
+
+    # Parse the label files across a process pool, results come back in sorted order
+    # so ids are assigned the same way no matter how many workers are used
+    label_fps = [ann_folder + a for a in dota_anns]
+    parsed = timed_iter('label parsing', cached_ordered_map(read_dota_labels, label_fps, workers, cache_path = cache_path))
 
     # Process each image's annotation file
-    for a in tqdm(dota_anns):
-        # read annotation file
-        with open(ann_folder + a, 'r') as f:
-            text = f.readlines()
+    for a, labels in tqdm(zip(dota_anns, parsed), total = len(dota_anns)):
         
-        im_id = int(a.split('.')[0].replace('P',''))
+        im_id = dota_im_id(a)
+
+        # Create bboxes, polygon areas and rotated boxes for the whole file at once
+        bboxes, _ = dota_bboxes(labels['polygons'])
+        corners = labels['polygons'].reshape(-1, 4, 2)
+        areas = polygon_areas(corners)
+        rboxes = min_area_rects(corners).tolist() if rbox else None
+        add_count('annotations', len(corners))
 
         # Process all the object labels
-        for data in text:
-            if len(data) > 30:
-                [x1,y1, x2, y2, x3, y3, x4, y4, c, difficult] = data.replace('\n','').split(' ')
-                coords = [x1,y1, x2, y2, x3, y3, x4, y4]
-                coords = [float(c) for c in coords]
-                [x1,y1, x2, y2, x3, y3, x4, y4] = coords
-                # Create bbox
-                xmin = min([x1,x2,x3,x4])
-                xmax = max([x1,x2,x3,x4])
-                w = xmax-xmin
-                ymin = min([y1,y2,y3,y4])
-                ymax = max([y1,y2,y3,y4])
-                h = ymax-ymin
-                bbox = [xmin, ymin, w, h]
-                # calculate area of annotation box
-                area = float(w*h)
-
-                # process category
-                ann_cat_id, cat_id, coco_categories = get_make_coco_cat(c, cat_id, coco_categories)
-
-                coco_ann = {"id": ann_id, 
-                            "image_id": im_id, 
-                            "category_id": ann_cat_id,  
-                            "area": area, 
-                            "bbox": bbox, 
-                            "difficult": int(difficult)
-                            }
-                coco_anns.append(coco_ann)
-                ann_id += 1
-
-    return coco_anns, coco_categories
+        for k, (polygon, bbox, area, c, difficult) in enumerate(zip(labels['polygons'].tolist(), bboxes.tolist(), areas.tolist(),
+                                                                    labels['categories'], labels['difficult'].tolist())):
+
+            # process category, creating it if necessary
+            ann_cat_id = categories.get_id(c)
+
+            coco_ann = {"id": ann_id, 
+                        "image_id": im_id, 
+                        "category_id": ann_cat_id,  
+                        "area": area, 
+                        "bbox": bbox, 
+                        "segmentation": [polygon],
+                        "difficult": difficult
+                        }
+            if rbox:
+                coco_ann["rbox"] = rboxes[k]
+            yield coco_ann
+            ann_id += 1
+
+def coco_anns_categories(coco_images, ann_folder, workers = 1):
+    categories = Registry(start_id = 1, defaults = {"supercategory": "None"})
+    coco_anns = list(iter_coco_anns(ann_folder, categories, workers))
+    return coco_anns, categories.to_list()
 
 def get_coco_license_update_images(coco_images, ann_folder_full):
     new_coco_images = []
-    licenses = []
-    license_id = 0
+    licenses = Registry(start_id = 0, defaults = {"url": None})
 
     for i in coco_images:
         # Get name of annotation file with gsd and image source information
         im_anns = ann_folder_full + i['file_name'].replace('.png', '.txt')
-        # Open this file
-        with open(im_anns, 'r') as f:
-            data = f.readlines()
-        data = [d.replace('\n', '') for d in data]
-
-        # Get current image's gsd
-        try:
-            im_gsd = data[1].split(':')[1]
-            if im_gsd != 'null':
-                i['gsd'] = float(im_gsd)
-            else:
-                i['gsd'] = None
-        except:
-            print(im_anns)
-        license_tag = data[0].replace('imagesource:','')
-        for l in licenses:
-            if l['name'] == license_tag:
-                i['license'] = l['id']
-        if i['license'] == False:
-            i['license'] = license_id
-            new_license = {
-            "id": license_id, 
-            "name": license_tag, 
-            "url": None,
-            }
-            licenses.append(new_license)
-            license_id += 1
+        header = read_dota_header(im_anns)
+        i['gsd'] = header['gsd']
+        if header['imagesource'] is None:
+            print('No imagesource header in {}'.format(im_anns))
+        else:
+            i['license'] = licenses.get_id(header['imagesource'])
         new_coco_images.append(i)
-    return licenses, new_coco_images
+    return licenses.to_list(), new_coco_images
 
-def dota_to_coco(im_folder, ann_folder, ann_folder_full, version = '1.0'):
+def dota_to_coco(im_folder, ann_folder, ann_folder_full, version = '1.0', workers = 1, cache = False, output_format = 'json',
+                 rbox = False):
     coco_info = {
                 "year": 2018, 
                  "version": version, 
@@ -159,24 +272,24 @@ def dota_to_coco(im_folder, ann_folder, ann_folder_full, version = '1.0'):
                  "contributor": 'Gui-Song Xia, Xiang Bai, Jian Ding, Zhen Zhu, Serge Belongie, Jiebo Luo, Mihai Datcu, Marcello Pelillo, Liangpei Zhang.', 
                  "url": 'https://captain-whu.github.io/DOTA/index.html'
                 }
-    coco_images = dota_coco_images(im_folder)
-    coco_anns, coco_categories = coco_anns_categories(coco_images, ann_folder)
-    coco_licenses, coco_images = get_coco_license_update_images(coco_images, ann_folder_full)
-
-    full_coco = {
-        'info' : coco_info,
-        'licenses': coco_licenses,
-        'images': coco_images,
-        'annotations': coco_anns,
-        'categories': coco_categories
-    }
-
     parent_folder = '/'.join(im_folder.split('/')[:-2]) + '/'
 
     output_json = parent_folder + 'COCO.json'
 
-    with open(output_json, 'w') as f:
-        json.dump(full_coco, f)
+    # Optionally keep parsed files next to the output, so re-runs only parse new or changed files
+    cache_path = output_json + '.cache' if cache else None
 
-    return output_json
+    coco_images = dota_coco_images(im_folder, workers, cache_path)
+    with stage('license update'):
+        coco_licenses, coco_images = get_coco_license_update_images(coco_images, ann_folder_full)
 
+    # Stream the annotations straight to disk, categories are only known once they've all been read
+    categories = Registry(start_id = 1, defaults = {"supercategory": "None"})
+    with stage('serialization'), open_coco_writer(output_json, output_format, info = coco_info, licenses = coco_licenses) as writer:
+        writer.add_images(coco_images)
+        writer.add_annotations(iter_coco_anns(ann_folder, categories, workers, cache_path, rbox))
+        writer.close(categories = categories.to_list())
+
+    if output_format == 'columnar':
+        return columnar_path(output_json)
+    return output_json
@@ -1,9 +1,14 @@
 import os
-import json
+import numpy as np
 from tqdm import tqdm
-import bs4
-import lxml
+import time
+from lxml import etree
 from bs4 import BeautifulSoup as bs
+from coco_utils.columnar import columnar_path, open_coco_writer
+from coco_utils.file_cache import cached_ordered_map
+from coco_utils.metrics import add_count, stage, timed_iter
+from coco_utils.registry import Registry
+from coco_utils.stats import AIRPLANE_LENGTHS_M
 
 
 def fair1m_cats():
@@ -56,37 +61,237 @@ def fair1m_cats():
                   {'id': 37, 'name': 'Bridge', 'supercategory': 'Road'}]
     return categories
 
-def fair1m_coco_ims_cats_anns(xml_fp):
+def fair1m_object_lengths():
+    '''
+    Typical lengths in meters of the FAIR1M categories whose real world size is well known,
+    used to estimate the gsd of each image
+    '''
+    lengths = dict(AIRPLANE_LENGTHS_M)
+    lengths.update({'Small Car': 4.5,
+                    'Bus': 12.0})
+    return lengths
+
+def object_lengths_px(annotations):
+    '''
+    IN: list of FAIR1M coco annotations
+    OUT: (N,) array of each object's length in pixels - the longest side of its rotated rectangle,
+         or the longest side of its bbox when it doesn't have a 4 point polygon
+    '''
+    bboxes = np.array([a['bbox'] for a in annotations], dtype = np.float64).reshape(-1, 4)
+    lengths = np.maximum(bboxes[:, 2], bboxes[:, 3])
+
+    # FAIR1M rectangles are 4 corners, usually with the first repeated to close them
+    rect = [i for i, a in enumerate(annotations) if len(a.get('segmentation') or []) in (4, 5)]
+    if rect:
+        corners = np.array([annotations[i]['segmentation'][:4] for i in rect], dtype = np.float64)
+        edges = np.linalg.norm(corners - np.roll(corners, -1, axis = 1), axis = 2)
+        lengths[rect] = edges.max(axis = 1)
+
+    return lengths
+
+def estimate_image_gsds(images, ann_image_ids, ann_category_ids, ann_lengths_px, categories, prior_weight = 3):
+    '''
+    PURPOSE: estimate the gsd of every image from the pixel lengths of objects of known size on it,
+             and write it into the image records
+    IN:
+        - images: coco 'images' section, updated in place with 'gsd', 'gsd_confidence' and 'gsd_objects'
+        - ann_image_ids, ann_category_ids, ann_lengths_px: (N,) arrays, one entry per annotation
+        - categories: coco 'categories' section
+        - prior_weight: how many objects' worth of weight the dataset wide estimate gets; images with few
+          objects of known size lean towards it, images with none get it outright (confidence 0)
+    OUT: the dataset wide gsd estimate
+    '''
+    known = fair1m_object_lengths()
+    # Meters per object, by category id
+    cat_lengths = {c['id']: known[c['name']] for c in categories if c['name'] in known}
+
+    ann_image_ids = np.asarray(ann_image_ids, dtype = np.int64)
+    ann_lengths_px = np.asarray(ann_lengths_px, dtype = np.float64)
+    meters = np.array([cat_lengths.get(c, 0.0) for c in np.asarray(ann_category_ids).tolist()], dtype = np.float64)
+    use = (meters > 0) & (ann_lengths_px > 0)
+    object_gsds = meters[use] / ann_lengths_px[use]
+
+    # Dataset wide fallback, the median is robust to the odd mislabelled box
+    dataset_gsd = float(np.median(object_gsds)) if len(object_gsds) else None
+
+    # Median object gsd per image, all images at once: sort by (image, gsd) and take the middle of each run
+    im_ids = np.array([i['id'] for i in images], dtype = np.int64)
+    im_order = np.argsort(im_ids)
+    pos = np.clip(np.searchsorted(im_ids[im_order], ann_image_ids[use]), 0, max(len(im_ids) - 1, 0))
+    im_idx = im_order[pos] if len(im_ids) else pos
+    keep = im_ids[im_idx] == ann_image_ids[use] if len(im_ids) else np.zeros(0, dtype = bool)
+    im_idx = im_idx[keep]
+    object_gsds = object_gsds[keep]
+
+    counts = np.bincount(im_idx, minlength = len(images))
+    medians = np.full(len(images), np.nan)
+    if len(im_idx):
+        order = np.lexsort((object_gsds, im_idx))
+        g = im_idx[order]
+        v = object_gsds[order]
+        starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+        n = counts[g[starts]]
+        lo = v[starts + (n - 1) // 2]
+        hi = v[starts + n // 2]
+        medians[g[starts]] = (lo + hi) / 2
+
+    # Blend each image's estimate with the dataset one, weighted by how many objects it has
+    for i, image in enumerate(images):
+        n = int(counts[i])
+        if dataset_gsd is None:
+            gsd = medians[i] if n else None
+        elif n:
+            gsd = (n * medians[i] + prior_weight * dataset_gsd) / (n + prior_weight)
+        else:
+            gsd = dataset_gsd
+        image['gsd'] = None if gsd is None else float(gsd)
+        image['gsd_confidence'] = n / (n + prior_weight) if n + prior_weight > 0 else 0.0
+        image['gsd_objects'] = n
+
+    return dataset_gsd
+
+def add_image_gsds(images, annotations, categories = None, prior_weight = 3):
+    '''
+    PURPOSE: estimate_image_gsds, for already converted images and annotations
+    IN:
+        - images, annotations: coco sections from fair1m_json
+        - categories: coco 'categories' section, defaults to fair1m_cats()
+        - prior_weight: see estimate_image_gsds
+    OUT: the dataset wide gsd estimate
+    '''
+    if categories is None:
+        categories = fair1m_cats()
+    ann_image_ids = [a['image_id'] for a in annotations]
+    ann_category_ids = [a['category_id'] for a in annotations]
+    return estimate_image_gsds(images, ann_image_ids, ann_category_ids, object_lengths_px(annotations),
+                               categories, prior_weight)
+
+def read_fair1m_xml(label_fp):
+    '''
+    IN: path to a FAIR1M label .xml file
+    OUT: image file name, image width, image height, and a list of (name, coordinate type, points) for each object
+    '''
+    im_name = None
+    im_w = None
+    im_h = None
+    obs = []
+
+    # Walk the file element by element, pulling out only the fields we need
+    for _, el in etree.iterparse(label_fp, events = ('end',)):
+        tag = el.tag
+        if tag == 'filename':
+            im_name = el.text
+        elif tag == 'size':
+            im_w = int(el.findtext('width'))
+            im_h = int(el.findtext('height'))
+        elif tag == 'object':
+            ob_n = el.findtext('possibleresult/name')
+            coord_type = el.findtext('coordinate')
+
+            pts = []
+            for p in el.iterfind('points/point'):
+                (x,y) = p.text.split(',')
+                x = int(float(x))
+                y = int(float(y))
+                pts.append((x,y))
+
+            obs.append((ob_n, coord_type, pts))
+            # Done with this object, free it
+            el.clear()
+
+    return im_name, im_w, im_h, obs
+
+def read_fair1m_xml_bs4(label_fp):
+    '''
+    Original BeautifulSoup version of read_fair1m_xml, kept for benchmarking against
+    IN: path to a FAIR1M label .xml file
+    OUT: image file name, image width, image height, and a list of (name, coordinate type, points) for each object
+    '''
+    # Get content with beautiful soup, as xml so tag names keep their case and no html warnings are raised
+    with open(label_fp, "r") as file:
+        bs_content = bs(file.read(), features = "xml")
+
+    # pull out image info
+    im_name = bs_content.find('filename').text
+    im_w = int(bs_content.find('size').find('width').text)
+    im_h = int(bs_content.find('size').find('height').text)
+
+    # process objects on image
+    obs = []
+    for o in bs_content.find('objects').find_all('object'):
+        # get object name
+        ob_n = o.find('possibleresult').find('name').text
+
+        coord_type = o.find('coordinate').text
+
+        # get points
+        pts = []
+        for p in o.find('points').find_all('point'):
+            (x,y) = p.text.split(',')
+            x = int(float(x))
+            y = int(float(y))
+            pts.append((x,y))
+
+        obs.append((ob_n, coord_type, pts))
+
+    return im_name, im_w, im_h, obs
+
+def benchmark_xml_parsers(xml_fp, n_files = None):
+    '''
+    PURPOSE: time the lxml label parser against the original BeautifulSoup one, and check they agree
+    IN:
+        - xml_fp: folder of FAIR1M label .xml files
+        - n_files: number of files to time, defaults to all of them
+    OUT: dict of files per second for each parser
+    '''
+    label_files = os.listdir(xml_fp)
+    label_files.sort()
+    label_fps = [xml_fp + a for a in label_files][:n_files]
+
+    results = {}
+    outputs = {}
+    for name, parser in [('lxml', read_fair1m_xml), ('bs4', read_fair1m_xml_bs4)]:
+        start = time.perf_counter()
+        outputs[name] = [parser(fp) for fp in label_fps]
+        elapsed = time.perf_counter() - start
+        results[name] = len(label_fps) / elapsed if elapsed > 0 else float('inf')
+        print('{}: {:.1f} files/sec'.format(name, results[name]))
+
+    if outputs['lxml'] != outputs['bs4']:
+        print('Warning: parsers disagree')
+    print('Speedup: {:.1f}x'.format(results['lxml'] / results['bs4']))
+
+    return results
+
+def iter_fair1m_images(xml_fp, categories, workers = 1, cache_path = None):
+    '''
+    IN:
+        - xml_fp: folder of FAIR1M label .xml files
+        - categories: category Registry to look object names up in
+        - workers: number of processes to parse label files with
+        - cache_path: sqlite file to cache parsed label files in between runs, None to disable
+    OUT: generator of (coco image, list of coco annotations on that image), in label file order
+    '''
 
     # intialize key variables
-    images = []
     ann_count = 0
-    annotations = []
-    categories = fair1m_cats()
-
-    for a in tqdm(os.listdir(xml_fp)):
-        # get path to label file
-        label_fp = xml_fp + a
-        # extract data from file
-        # Get content with beautiful soup
-        content = []
-        # Read the XML file
-        with open(label_fp, "r") as file:
-            # Read each line in the file, readlines() returns a list of lines
-            content = file.readlines()
-            # Combine the lines in the list into a string
-            content = "".join(content)
-            bs_content = bs(content, "lxml")
+
+    # Parse the label files across a process pool, results come back in sorted order
+    # so ids are assigned the same way no matter how many workers are used
+    with stage('listing'):
+        label_files = os.listdir(xml_fp)
+        label_files.sort()
+    add_count('label files', len(label_files))
+    label_fps = [xml_fp + a for a in label_files]
+    parsed = timed_iter('label parsing', cached_ordered_map(read_fair1m_xml, label_fps, workers, cache_path = cache_path))
+
+    for im_name, im_w, im_h, obs in tqdm(parsed, total = len(label_fps)):
 
         ## get coco stuff ##
 
         # pull out image info
-        im_name = bs_content.find('filename').text
         im_id = int(im_name.split('.')[0])
 
-        im_w = int(bs_content.find('size').find('width').text)
-        im_h = int(bs_content.find('size').find('height').text)
-
         # construct image annotations
         im_info = {
             "id": im_id, 
@@ -95,89 +300,87 @@ def fair1m_coco_ims_cats_anns(xml_fp):
             "file_name": im_name, 
             "license": 1
         }
-        images.append(im_info)
+        annotations = []
 
         # process objects on image
-        objects = bs_content.find('objects')
-
-        for o in objects:
-            if len(o) > 1:
-                # get object name
-                ob_n = o.find('name').text
-
-                coord_type = o.find('coordinate').text
-
-                if coord_type != 'pixel':
-                    print(coord_type)
-
-                # get object category id or create it
-                cat_exists = False
-                for c in categories:
-                    if c['name'] == ob_n:
-                        ann_cat_id = c['id']
-                        cat_exists = True
-                if not cat_exists:
-                    print('Category down!', ob_n)
-              
-
-                # get points
-                points = o.find('points')
-                pt_list = []
-                for p in points:
-                    try:
-                        pt_list.append(p.text)
-                    except:
-                        continue
-                pts = []
-                for p in pt_list:
-                    (x,y) = p.split(',')
-                    x = int(float(x))
-                    y = int(float(y))
-                    pts.append((x,y))
-                
-                # get coco style bbox
-                xs = [b[0] for b in pts]
-                ys = [b[1] for b in pts]
-                xs, ys
-                x1 = min(xs)
-                y1 = min(ys)
-                w = max(xs) - x1
-                h = max(ys) - y1
-                
-                ann = {
-                      "id": ann_count, 
-                      "image_id": im_id, 
-                      "category_id": ann_cat_id, 
-                      "area": None, 
-                      "segmentation": pts,
-                      "bbox": [x1, y1, w, h],
-                      "iscrowd": 0
-                      }
-                annotations.append(ann)
-                ann_count += 1
-
-    return images, categories, annotations
-
-def fair1m_json(json_path, xml_fp):
-
-    # ensure that no duplicate content is created
-    if os.path.exists(json_path):
-        os.remove(json_path)
-    
-    # get images, categories, and annotations
-    images, categories, annotations = fair1m_coco_ims_cats_anns(xml_fp)
-
-    # load the coco json
-    coco_content = {
-        'images' : images,
-        'categories': categories,
-        'annotations': annotations,
-        'license': {"id": 1, "name": 'Creative Commons Attribution-NonCommercial-ShareAlike 3.0 License.', "url": 'https://creativecommons.org/licenses/by-nc-sa/3.0/'},
-        'info': {"year": 2021, "version": '1.0', "description": 'FAIR1M Challenge Dataset 2021', "paper": 'https://arxiv.org/abs/2103.05569v2', "url": 'http://gaofen-challenge.com/indexpage', "date_created": '2021'}
-        }
-    
-    # save the content
-    with open(json_path, 'w') as f:
-        json.dump(coco_content, f)
+        for ob_n, coord_type, pts in obs:
+
+            if coord_type != 'pixel':
+                print(coord_type)
+
+            # get object category id
+            ann_cat_id = categories.lookup(ob_n)
+            if ann_cat_id is None:
+                print('Category down!', ob_n)
+                continue
+            
+            # get coco style bbox
+            xs = [b[0] for b in pts]
+            ys = [b[1] for b in pts]
+            x1 = min(xs)
+            y1 = min(ys)
+            w = max(xs) - x1
+            h = max(ys) - y1
+            
+            ann = {
+                  "id": ann_count, 
+                  "image_id": im_id, 
+                  "category_id": ann_cat_id, 
+                  "area": None, 
+                  "segmentation": pts,
+                  "bbox": [x1, y1, w, h],
+                  "iscrowd": 0
+                  }
+            annotations.append(ann)
+            ann_count += 1
+
+        add_count('annotations', len(annotations))
+        yield im_info, annotations
+
+def fair1m_coco_ims_cats_anns(xml_fp, workers = 1, cache_path = None):
+
+    images = []
+    annotations = []
+    categories = Registry.from_list(fair1m_cats())
+
+    for im_info, im_anns in iter_fair1m_images(xml_fp, categories, workers, cache_path):
+        images.append(im_info)
+        annotations.extend(im_anns)
+
+    return images, categories.to_list(), annotations
+
+def fair1m_json(json_path, xml_fp, workers = 1, cache = False, output_format = 'json', gsd = True):
+
+    # Optionally keep parsed label files next to the output, so re-runs only parse new or changed files
+    cache_path = json_path + '.cache' if cache else None
+
+    categories = Registry.from_list(fair1m_cats())
+    license = {"id": 1, "name": 'Creative Commons Attribution-NonCommercial-ShareAlike 3.0 License.', "url": 'https://creativecommons.org/licenses/by-nc-sa/3.0/'}
+    info = {"year": 2021, "version": '1.0', "description": 'FAIR1M Challenge Dataset 2021', "paper": 'https://arxiv.org/abs/2103.05569v2', "url": 'http://gaofen-challenge.com/indexpage', "date_created": '2021'}
+
+    # Stream the annotations straight to disk, the (much smaller) images section goes last.
+    # The old json is only replaced once the new one is complete
+    images = []
+    # Just enough of each annotation to estimate image gsds at the end
+    ann_image_ids = []
+    ann_category_ids = []
+    ann_lengths_px = []
+    with stage('serialization'), open_coco_writer(json_path, output_format, info = info, license = license, categories = categories.to_list()) as writer:
+        writer.start_array('annotations')
+        for im_info, im_anns in iter_fair1m_images(xml_fp, categories, workers, cache_path):
+            images.append(im_info)
+            writer.add_annotations(im_anns)
+            if gsd:
+                with stage('gsd estimation'):
+                    ann_image_ids.extend(a['image_id'] for a in im_anns)
+                    ann_category_ids.extend(a['category_id'] for a in im_anns)
+                    ann_lengths_px.extend(object_lengths_px(im_anns).tolist())
+        if gsd:
+            with stage('gsd estimation'):
+                dataset_gsd = estimate_image_gsds(images, ann_image_ids, ann_category_ids, ann_lengths_px, categories.to_list())
+            print('Dataset gsd estimate:', dataset_gsd)
+        writer.close(images = images)
 
-    return json_path
\ No newline at end of file
+    if output_format == 'columnar':
+        return columnar_path(json_path)
+    return json_path
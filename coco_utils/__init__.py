@@ -0,0 +1,3 @@
+'''
+Helpers shared by the xView, DOTA and FAIR1M converters
+'''
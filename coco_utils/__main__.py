@@ -0,0 +1,22 @@
+import sys
+
+from coco_utils import audit, benchmark, convert, merge, split, stats
+
+# python -m coco_utils <command> ...
+COMMANDS = {'audit': audit.main,
+            'benchmark': benchmark.main,
+            'convert': convert.main,
+            'merge': merge.main,
+            'split': split.main,
+            'stats': stats.main}
+
+
+def main(args = None):
+    args = sys.argv[1:] if args is None else args
+    if not args or args[0] not in COMMANDS:
+        print('usage: python -m coco_utils {{{}}} ...'.format(','.join(COMMANDS)))
+        sys.exit(2)
+    return COMMANDS[args[0]](args[1:])
+
+if __name__ == '__main__':
+    main()
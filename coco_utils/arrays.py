@@ -0,0 +1,35 @@
+import json
+
+import numpy as np
+
+
+def load_coco(coco):
+    '''
+    IN: path to a coco json, or an already loaded coco dict
+    OUT: coco dict
+    '''
+    if isinstance(coco, dict):
+        return coco
+    with open(coco, 'r') as f:
+        return json.load(f)
+
+def annotation_arrays(annotations):
+    '''
+    PURPOSE: pull the numeric fields of coco annotations into flat arrays, for vectorized work
+    IN: coco 'annotations' section
+    OUT: dict of arrays, one row per annotation:
+        - ids, image_ids, category_ids: (N,) int
+        - bboxes: (N, 4) float [x, y, w, h]
+        - areas: (N,) float, nan where the annotation has no area
+    '''
+    n = len(annotations)
+    ids = np.fromiter((a['id'] for a in annotations), dtype = np.int64, count = n)
+    image_ids = np.fromiter((a['image_id'] for a in annotations), dtype = np.int64, count = n)
+    category_ids = np.fromiter((a['category_id'] for a in annotations), dtype = np.int64, count = n)
+    bboxes = np.array([a['bbox'] for a in annotations], dtype = np.float64).reshape(-1, 4)
+    areas = np.array([a.get('area') for a in annotations], dtype = np.float64).reshape(-1)
+    return {'ids': ids,
+            'image_ids': image_ids,
+            'category_ids': category_ids,
+            'bboxes': bboxes,
+            'areas': areas}
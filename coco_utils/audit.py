@@ -0,0 +1,253 @@
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+from coco_utils.arrays import annotation_arrays
+from coco_utils.coco_writer import CocoWriter
+from coco_utils.dataset import CocoDataset
+from coco_utils.geometry import clip_polygon, format_segmentation, min_area_rects, polygon_area, segmentation_polygons
+
+# Issues audit_annotations looks for
+ISSUES = ('unknown_image', 'unknown_category', 'degenerate', 'outside_image', 'out_of_bounds', 'missing_area', 'duplicate')
+
+
+def box_ious(a, b):
+    '''
+    IN: (K, 4) arrays of [x, y, w, h] boxes, a[k] is compared with b[k]
+    OUT: (K,) array of the pairs' intersection over union
+    '''
+    ix = np.minimum(a[:, 0] + a[:, 2], b[:, 0] + b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+    iy = np.minimum(a[:, 1] + a[:, 3], b[:, 1] + b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+    inter = np.clip(ix, 0, None) * np.clip(iy, 0, None)
+    union = a[:, 2] * a[:, 3] + b[:, 2] * b[:, 3] - inter
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return np.where(union > 0, inter / union, 0.0)
+
+def overlapping_pairs(bboxes, groups, iou_threshold):
+    '''
+    PURPOSE: find every pair of boxes in the same group (e.g. image and category) with an IoU of at least
+             iou_threshold, only computing IoUs between boxes that are near each other rather than between
+             every pair of boxes on an image
+    IN:
+        - bboxes: (N, 4) array of [x, y, w, h] boxes with positive size
+        - groups: (N,) int array, only boxes in the same group are paired
+        - iou_threshold: in (0, 1]
+    OUT: (P, 2) int array of the pairs (i, j), i < j
+    '''
+    n = len(bboxes)
+    if n < 2:
+        return np.zeros((0, 2), dtype = np.int64)
+
+    # Boxes go on a grid scaled to their size, level L has cells of 2^(L+1) pixels so a box there covers at
+    # most 2 x 2 cells. Boxes with an IoU of t have sides within a factor t of each other, so each box also
+    # goes on the next few levels up, and any two boxes that could be duplicates then share a cell somewhere
+    x1 = bboxes[:, 0]
+    y1 = bboxes[:, 1]
+    side = np.maximum(np.maximum(bboxes[:, 2], bboxes[:, 3]), 1.0)
+    base_level = np.floor(np.log2(side)).astype(np.int64)
+    extra = int(math.ceil(-math.log2(iou_threshold))) if iou_threshold < 1 else 0
+
+    keys = []
+    boxes = []
+    for k in range(extra + 1):
+        level = base_level + k
+        cell = np.exp2(level + 1)
+        cx1 = np.floor(x1 / cell).astype(np.int64)
+        cy1 = np.floor(y1 / cell).astype(np.int64)
+        cx2 = np.floor((x1 + bboxes[:, 2]) / cell).astype(np.int64)
+        cy2 = np.floor((y1 + bboxes[:, 3]) / cell).astype(np.int64)
+        for dx in (0, 1):
+            for dy in (0, 1):
+                ok = (cx1 + dx <= cx2) & (cy1 + dy <= cy2)
+                idx = np.flatnonzero(ok)
+                keys.append(np.stack([groups[idx], level[idx], cx1[idx] + dx, cy1[idx] + dy], axis = 1))
+                boxes.append(idx)
+    keys = np.concatenate(keys)
+    boxes = np.concatenate(boxes)
+
+    # Sort the (group, level, cell) keys and pair up the boxes within each run of equal keys
+    order = np.lexsort(keys.T[::-1])
+    keys = keys[order]
+    boxes = boxes[order]
+    new_run = np.r_[True, np.any(keys[1:] != keys[:-1], axis = 1)]
+    run_id = np.cumsum(new_run) - 1
+    run_start = np.flatnonzero(new_run)
+    run_len = np.diff(np.r_[run_start, len(keys)])
+    pos_in_run = np.arange(len(keys)) - run_start[run_id]
+    left_in_run = run_len[run_id] - pos_in_run - 1
+
+    pairs = []
+    offset = 1
+    candidates = np.flatnonzero(left_in_run >= 1)
+    while len(candidates):
+        # Batched IoU of each box with the one offset places after it in its cell
+        i = boxes[candidates]
+        j = boxes[candidates + offset]
+        match = (box_ious(bboxes[i], bboxes[j]) >= iou_threshold) & (i != j)
+        pairs.append(np.stack([i[match], j[match]], axis = 1))
+        offset += 1
+        candidates = candidates[left_in_run[candidates] >= offset]
+    if not pairs:
+        return np.zeros((0, 2), dtype = np.int64)
+
+    # Boxes sharing several cells match more than once, dedupe on one int64 per pair
+    pairs = np.sort(np.concatenate(pairs), axis = 1)
+    pairs = np.unique(pairs @ np.array([n, 1], dtype = np.int64))
+    return np.stack([pairs // n, pairs % n], axis = 1)
+
+def find_duplicates(bboxes, groups, iou_threshold = 0.8):
+    '''
+    IN:
+        - bboxes: (N, 4) array of [x, y, w, h] boxes
+        - groups: (N,) int array, only boxes in the same group can be duplicates
+        - iou_threshold: boxes overlapping at least this much are duplicates
+    OUT: (N,) int array of the row each box duplicates (the first of its cluster to be kept), -1 if it's not a duplicate
+    '''
+    n = len(bboxes)
+    duplicate_of = np.full(n, -1, dtype = np.int64)
+    valid = np.flatnonzero(np.isfinite(bboxes).all(axis = 1) & (bboxes[:, 2] > 0) & (bboxes[:, 3] > 0))
+    pairs = valid[overlapping_pairs(bboxes[valid], groups[valid], iou_threshold)]
+
+    # Greedy, in annotation order: a box is a duplicate if it matches an earlier box that was kept
+    for i, j in pairs[np.lexsort((pairs[:, 0], pairs[:, 1]))].tolist():
+        if duplicate_of[i] < 0 and duplicate_of[j] < 0:
+            duplicate_of[j] = i
+    return duplicate_of
+
+def audit_annotations(dataset, iou_threshold = 0.8, tolerance = 0.5):
+    '''
+    PURPOSE: check every annotation of a dataset for common problems, all at once on arrays
+    IN:
+        - dataset: CocoDataset
+        - iou_threshold: same category boxes on the same image overlapping at least this much are duplicates
+        - tolerance: pixels a box can hang off its image before it counts as out of bounds
+    OUT: dict of issue name (see ISSUES) -> (N,) bool array over dataset.annotations, plus 'duplicate_of',
+         the (N,) row of the annotation each duplicate repeats (-1 for the rest)
+    '''
+    arrays = annotation_arrays(dataset.annotations)
+    bboxes = arrays['bboxes']
+    x, y, w, h = bboxes.T
+
+    im_rows = dataset.image_rows(dataset.ann_image_ids)
+    known_image = im_rows >= 0
+    widths = np.array([i.get('width', np.nan) for i in dataset.images], dtype = np.float64)
+    heights = np.array([i.get('height', np.nan) for i in dataset.images], dtype = np.float64)
+    im_w = np.where(known_image, widths[np.maximum(im_rows, 0)] if len(widths) else np.nan, np.nan)
+    im_h = np.where(known_image, heights[np.maximum(im_rows, 0)] if len(heights) else np.nan, np.nan)
+
+    with np.errstate(invalid = 'ignore'):
+        degenerate = ~np.isfinite(bboxes).all(axis = 1) | (w <= 0) | (h <= 0)
+        outside = known_image & ~degenerate & ((x >= im_w) | (y >= im_h) | (x + w <= 0) | (y + h <= 0))
+        out_of_bounds = known_image & ~degenerate & ~outside & (
+            (x < -tolerance) | (y < -tolerance) | (x + w > im_w + tolerance) | (y + h > im_h + tolerance))
+
+    # Duplicates are only looked for within the same image and category
+    group = np.unique(np.stack([dataset.ann_image_ids, dataset.ann_category_ids], axis = 1), axis = 0, return_inverse = True)[1]
+    duplicate_of = find_duplicates(bboxes, group.reshape(-1), iou_threshold)
+
+    return {'unknown_image': ~known_image,
+            'unknown_category': dataset.category_rows(dataset.ann_category_ids) < 0,
+            'degenerate': degenerate,
+            'outside_image': outside,
+            'out_of_bounds': out_of_bounds,
+            'missing_area': np.isnan(arrays['areas']),
+            'duplicate': duplicate_of >= 0,
+            'duplicate_of': duplicate_of}
+
+def clean_annotation(a, image):
+    '''
+    IN:
+        - a: coco annotation that is being kept
+        - image: its coco image
+    OUT: copy of the annotation with its box (and any polygons and rotated box) clipped to the image, if its
+         size is known, and its area recomputed whenever it was clipped or missing
+    '''
+    a = a.copy()
+    polygons, pairs = segmentation_polygons(a.get('segmentation'))
+    polygons = [p for p in polygons if len(p) >= 3]
+    clipped = False
+    if 'width' in image and 'height' in image:
+        x, y, w, h = a['bbox']
+        x1 = min(max(x, 0), image['width'])
+        y1 = min(max(y, 0), image['height'])
+        x2 = min(max(x + w, 0), image['width'])
+        y2 = min(max(y + h, 0), image['height'])
+        clipped = [x1, y1, x2 - x1, y2 - y1] != [x, y, w, h]
+        if clipped:
+            a['bbox'] = [x1, y1, x2 - x1, y2 - y1]
+            if polygons:
+                polygons = [clip_polygon(p, [0, 0, image['width'], image['height']]) for p in polygons]
+                polygons = [p for p in polygons if len(p) >= 3]
+                a['segmentation'] = format_segmentation(polygons, pairs)
+            # Refit any rotated box to what's left of the object, as chipping does
+            if a.get('rbox') is not None and polygons:
+                a['rbox'] = min_area_rects(np.concatenate(polygons)[None])[0].tolist()
+
+    if clipped or a.get('area') is None:
+        a['area'] = sum(polygon_area(p) for p in polygons) if polygons else a['bbox'][2] * a['bbox'][3]
+    return a
+
+def audit_coco(json_path, clean_json = None, report_json = None, iou_threshold = 0.8, tolerance = 0.5):
+    '''
+    PURPOSE: audit the annotations of a coco json (from dota_to_coco, fair1m_json, make_json or merge_coco)
+             and optionally write a cleaned copy and a report
+    IN:
+        - json_path: coco json
+        - clean_json: where to write the cleaned json, None to skip. Annotations on unknown images or categories,
+                      degenerate, outside their image or duplicated are dropped; the rest are clipped to their
+                      image, with their areas recomputed, and have missing areas filled in
+        - report_json: where to write the report, None to skip
+        - iou_threshold: same category boxes on the same image overlapping at least this much are duplicates
+        - tolerance: pixels a box can hang off its image before it counts as out of bounds
+    OUT: report dict of the number of annotations with each issue, and the ids of those annotations
+    '''
+    start = time.perf_counter()
+    dataset = CocoDataset(json_path)
+    issues = audit_annotations(dataset, iou_threshold, tolerance)
+
+    report = {'annotations': len(dataset.annotations), 'iou_threshold': iou_threshold, 'counts': {}, 'ids': {}}
+    for issue in ISSUES:
+        report['counts'][issue] = int(issues[issue].sum())
+        report['ids'][issue] = dataset.ann_ids[issues[issue]].tolist()
+    dup_rows = np.flatnonzero(issues['duplicate'])
+    report['duplicate_of'] = dict(zip(dataset.ann_ids[dup_rows].tolist(),
+                                      dataset.ann_ids[issues['duplicate_of'][dup_rows]].tolist()))
+
+    for issue in ISSUES:
+        print('{:<20}{:>10}'.format(issue, report['counts'][issue]))
+    print('Audited {} annotations in {:.1f}s'.format(len(dataset.annotations), time.perf_counter() - start))
+
+    if clean_json is not None:
+        drop = (issues['unknown_image'] | issues['unknown_category'] | issues['degenerate'] |
+                issues['outside_image'] | issues['duplicate'])
+        keep = np.flatnonzero(~drop)
+        im_rows = dataset.image_rows(dataset.ann_image_ids)
+        with CocoWriter(clean_json, **dataset.sections) as writer:
+            writer.add_section('categories', dataset.categories)
+            writer.add_images(dataset.images)
+            writer.add_annotations(clean_annotation(dataset.annotations[r], dataset.images[im_rows[r]]) for r in keep)
+        report['cleaned'] = {'path': clean_json, 'kept': int(len(keep)), 'dropped': int(drop.sum())}
+        print('Wrote {} annotations ({} dropped) to {}'.format(len(keep), int(drop.sum()), clean_json))
+
+    if report_json is not None:
+        with open(report_json, 'w') as f:
+            json.dump(report, f)
+
+    return report
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = 'Audit the annotations of a coco json')
+    parser.add_argument('json_path', help = 'coco json to audit')
+    parser.add_argument('--clean', help = 'write a cleaned copy of the json here')
+    parser.add_argument('--report', help = 'write the full report, with the ids of the flagged annotations, here')
+    parser.add_argument('--iou', type = float, default = 0.8, help = 'IoU at which same class boxes are duplicates')
+    parser.add_argument('--tolerance', type = float, default = 0.5, help = 'pixels a box may hang off its image')
+    args = parser.parse_args(args)
+
+    return audit_coco(args.json_path, args.clean, args.report, args.iou, args.tolerance)
+
+if __name__ == '__main__':
+    main()
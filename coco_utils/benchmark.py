@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from coco_utils.metrics import metrics
+
+# Object classes used by the fixtures, a few from each dataset
+DOTA_CLASSES = ['plane', 'ship', 'storage-tank', 'small-vehicle', 'large-vehicle', 'harbor']
+FAIR1M_CLASSES = ['Boeing737', 'A321', 'Small Car', 'Van', 'Bus', 'Cargo Truck', 'Motorboat']
+XVIEW_CLASSES = {11: 'Fixed-wing Aircraft', 17: 'Passenger Vehicle', 18: 'Small Car', 23: 'Truck', 73: 'Building'}
+
+
+def make_dota_fixture(root, n_images = 100, n_objects = 50, image_size = 256, seed = 0):
+    '''
+    PURPOSE: write a synthetic DOTA dataset: blank images, label .txt files and header (imagesource/gsd) label files
+    IN:
+        - root: folder to create images/, labelTxt/ and labelFull/ in
+        - n_images: number of images
+        - n_objects: number of objects per image
+        - image_size: side length of the placeholder images
+        - seed: random seed, the same seed always gives the same labels
+    OUT: (im_folder, ann_folder, ann_folder_full) arguments for dota_to_coco
+    '''
+    rng = random.Random(seed)
+    folders = [os.path.join(root, f) + '/' for f in ('images', 'labelTxt', 'labelFull')]
+    for folder in folders:
+        os.makedirs(folder, exist_ok = True)
+    im_folder, ann_folder, ann_folder_full = folders
+
+    for i in range(n_images):
+        name = 'P{:04d}'.format(i)
+        Image.new('RGB', (image_size, image_size)).save(im_folder + name + '.png')
+
+        # Rotated quadrilaterals, fully inside the image
+        lines = []
+        for _ in range(n_objects):
+            s = rng.uniform(4, image_size / 8)
+            x = rng.uniform(s, image_size - 2 * s)
+            y = rng.uniform(0, image_size - 2 * s)
+            lines.append('{:.1f} {:.1f} {:.1f} {:.1f} {:.1f} {:.1f} {:.1f} {:.1f} {} {}\n'.format(
+                x, y, x + s, y + s / 4, x + s * 3 / 4, y + s * 5 / 4, x - s / 4, y + s,
+                rng.choice(DOTA_CLASSES), rng.randint(0, 1)))
+        with open(ann_folder + name + '.txt', 'w') as f:
+            f.writelines(lines)
+
+        header = ['imagesource:{}\n'.format(rng.choice(['GoogleEarth', 'GF-2', 'JL-1'])),
+                  'gsd:{}\n'.format(rng.choice(['null', '{:.4f}'.format(rng.uniform(0.1, 1.0))]))]
+        with open(ann_folder_full + name + '.txt', 'w') as f:
+            f.writelines(header + lines)
+
+    return im_folder, ann_folder, ann_folder_full
+
+def make_fair1m_fixture(root, n_images = 100, n_objects = 50, image_size = 256, seed = 0):
+    '''
+    PURPOSE: write a synthetic FAIR1M dataset: blank images and label .xml files in the challenge's layout
+    IN:
+        - root: folder to create images/ and labelXml/ in
+        - n_images: number of images
+        - n_objects: number of objects per image
+        - image_size: side length of the placeholder images
+        - seed: random seed, the same seed always gives the same labels
+    OUT: xml folder argument for fair1m_json
+    '''
+    rng = random.Random(seed)
+    im_folder = os.path.join(root, 'images') + '/'
+    xml_folder = os.path.join(root, 'labelXml') + '/'
+    os.makedirs(im_folder, exist_ok = True)
+    os.makedirs(xml_folder, exist_ok = True)
+
+    for i in range(n_images):
+        Image.new('RGB', (image_size, image_size)).save(im_folder + '{}.tif'.format(i))
+
+        objects = []
+        for _ in range(n_objects):
+            w = rng.uniform(4, image_size / 8)
+            h = rng.uniform(4, image_size / 8)
+            x = rng.uniform(0, image_size - w)
+            y = rng.uniform(0, image_size - h)
+            # FAIR1M repeats the first corner to close the rectangle
+            corners = [(x, y), (x + w, y), (x + w, y + h), (x, y + h), (x, y)]
+            points = ''.join('\n\t\t\t\t<point>{:.6f},{:.6f}</point>'.format(px, py) for px, py in corners)
+            objects.append('\n\t\t<object>\n\t\t\t<coordinate>pixel</coordinate>\n\t\t\t<type>rectangle</type>'
+                           '\n\t\t\t<description>None</description>\n\t\t\t<possibleresult>\n\t\t\t\t<name>{}</name>'
+                           '\n\t\t\t</possibleresult>\n\t\t\t<points>{}\n\t\t\t</points>\n\t\t</object>'.format(
+                               rng.choice(FAIR1M_CLASSES), points))
+
+        xml = ('<?xml version="1.0" encoding="utf-8"?>\n<annotation>\n\t<source>\n\t\t<filename>{name}</filename>'
+               '\n\t\t<origin>GF2/GF3</origin>\n\t</source>\n\t<research>\n\t\t<version>1.0</version>\n\t</research>'
+               '\n\t<size>\n\t\t<width>{size}</width>\n\t\t<height>{size}</height>\n\t\t<depth>3</depth>\n\t</size>'
+               '\n\t<objects>{objects}\n\t</objects>\n</annotation>\n').format(
+                   name = '{}.tif'.format(i), size = image_size, objects = ''.join(objects))
+        with open(xml_folder + '{}.xml'.format(i), 'w') as f:
+            f.write(xml)
+
+    return xml_folder
+
+def make_xview_fixture(root, n_images = 100, n_objects = 50, image_size = 256, seed = 0):
+    '''
+    PURPOSE: write a synthetic xView dataset: blank tifs, a geojson of features with bounds_imcoords and a classes file
+    IN:
+        - root: folder to create train_images/, xView_train.geojson and xView_classes.txt in
+        - n_images: number of images
+        - n_objects: number of objects per image, some hang off the image edge like in xView
+        - image_size: side length of the placeholder images
+        - seed: random seed, the same seed always gives the same labels
+    OUT: (geojson_path, classes_path, image_folder) arguments for make_json
+    '''
+    rng = random.Random(seed)
+    image_folder = os.path.join(root, 'train_images') + '/'
+    os.makedirs(image_folder, exist_ok = True)
+    geojson_path = os.path.join(root, 'xView_train.geojson')
+    classes_path = os.path.join(root, 'xView_classes.txt')
+
+    with open(classes_path, 'w') as f:
+        f.writelines("{}:'{}'\n".format(k, v) for k, v in XVIEW_CLASSES.items())
+
+    # Written feature by feature, so big fixtures don't need the whole geojson in memory
+    with open(geojson_path, 'w') as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        first = True
+        for i in range(n_images):
+            name = '{}.tif'.format(i + 100)
+            Image.new('RGB', (image_size, image_size)).save(image_folder + name)
+            lon0 = rng.uniform(-180, 179)
+            lat0 = rng.uniform(-80, 79)
+            for _ in range(n_objects):
+                w = rng.randint(3, max(image_size // 8, 4))
+                h = rng.randint(3, max(image_size // 8, 4))
+                x = rng.randint(-w // 2, image_size - w // 2)
+                y = rng.randint(-h // 2, image_size - h // 2)
+                lon = lon0 + x * 3e-6
+                lat = lat0 + y * 3e-6
+                feature = {"type": "Feature",
+                           "geometry": {"type": "Polygon",
+                                        "coordinates": [[[lon, lat], [lon + w * 3e-6, lat], [lon + w * 3e-6, lat + h * 3e-6],
+                                                         [lon, lat + h * 3e-6], [lon, lat]]]},
+                           "properties": {"bounds_imcoords": '{},{},{},{}'.format(x, y, x + w, y + h),
+                                          "type_id": rng.choice(list(XVIEW_CLASSES)),
+                                          "image_id": name}}
+                f.write(('' if first else ',\n') + json.dumps(feature))
+                first = False
+        f.write('\n]}\n')
+
+    return geojson_path, classes_path, image_folder
+
+def benchmark_dataset(dataset, root, n_images, n_objects, image_size, workers, output_format, seed):
+    '''
+    PURPOSE: build one dataset's fixture and time its converter
+    OUT: dict of the fixture build time and the converter's metrics summary (see coco_utils.metrics)
+    '''
+    start = time.perf_counter()
+    if dataset == 'dota':
+        from DOTA.dota_coco import dota_to_coco
+        args = make_dota_fixture(os.path.join(root, 'DOTA'), n_images, n_objects, image_size, seed)
+        convert = lambda: dota_to_coco(*args, workers = workers, output_format = output_format)
+    elif dataset == 'fair1m':
+        from FAIR1M.fair1m_coco import fair1m_json
+        xml_folder = make_fair1m_fixture(os.path.join(root, 'FAIR1M'), n_images, n_objects, image_size, seed)
+        json_path = os.path.join(root, 'FAIR1M', 'FAIR1M.json')
+        convert = lambda: fair1m_json(json_path, xml_folder, workers = workers, output_format = output_format)
+    elif dataset == 'xview':
+        from xView.xview_coco import make_json
+        args = make_xview_fixture(os.path.join(root, 'xView'), n_images, n_objects, image_size, seed)
+        convert = lambda: make_json(*args, workers = workers, output_format = output_format)
+    else:
+        raise ValueError('Unknown dataset {}'.format(dataset))
+    fixture_seconds = time.perf_counter() - start
+
+    metrics.reset()
+    convert()
+    result = metrics.summary()
+    result['fixture_seconds'] = fixture_seconds
+    return result
+
+def run_benchmarks(out_json = None, datasets = ('dota', 'fair1m', 'xview'), n_images = 100, n_objects = 50,
+                   image_size = 256, workers = 1, output_format = 'json', seed = 0, root = None):
+    '''
+    PURPOSE: time each converter, stage by stage, on synthetic fixtures so no real data (or network) is needed
+    IN:
+        - out_json: path to write the results to, None to only return them
+        - datasets: which of 'dota', 'fair1m' and 'xview' to run
+        - n_images: images per fixture
+        - n_objects: objects per image
+        - image_size: side length of the placeholder images
+        - workers: workers passed to each converter
+        - output_format: output_format passed to each converter
+        - seed: random seed for the fixtures
+        - root: folder to build the fixtures in, None for a temporary folder that is removed afterwards
+    OUT: dict of the run's parameters and environment, plus a metrics summary per dataset
+    '''
+    params = {'n_images': n_images, 'n_objects': n_objects, 'image_size': image_size,
+              'workers': workers, 'output_format': output_format, 'seed': seed}
+    results = {'params': params,
+               'environment': {'python': sys.version.split()[0], 'platform': platform.platform(),
+                               'cpu_count': os.cpu_count()},
+               'datasets': {}}
+
+    tmp_root = root is None
+    if tmp_root:
+        root = tempfile.mkdtemp(prefix = 'coco_benchmark_')
+    try:
+        for dataset in datasets:
+            results['datasets'][dataset] = benchmark_dataset(dataset, root, n_images, n_objects, image_size,
+                                                             workers, output_format, seed)
+    finally:
+        if tmp_root:
+            shutil.rmtree(root, ignore_errors = True)
+
+    if out_json is not None:
+        with open(out_json, 'w') as f:
+            json.dump(results, f, indent = 2)
+    return results
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the converters on synthetic fixtures')
+    parser.add_argument('--datasets', nargs = '+', choices = ['dota', 'fair1m', 'xview'], default = ['dota', 'fair1m', 'xview'])
+    parser.add_argument('--images', type = int, default = 100, help = 'images per fixture')
+    parser.add_argument('--objects', type = int, default = 50, help = 'objects per image')
+    parser.add_argument('--image-size', type = int, default = 256, help = 'side length of the placeholder images')
+    parser.add_argument('--workers', type = int, default = 1)
+    parser.add_argument('--output-format', default = 'json')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--root', help = 'folder to build the fixtures in (kept), defaults to a temporary folder')
+    parser.add_argument('--out', default = 'benchmark.json', help = 'json file to write the results to')
+    args = parser.parse_args(args)
+
+    results = run_benchmarks(args.out, args.datasets, args.images, args.objects, args.image_size, args.workers,
+                             args.output_format, args.seed, args.root)
+
+    print('{:<10}{:<20}{:>10}'.format('dataset', 'stage', 'seconds'))
+    for dataset, r in results['datasets'].items():
+        for name, seconds in r['stages'].items():
+            print('{:<10}{:<20}{:>10.3f}'.format(dataset, name, seconds))
+        print('{:<10}{:<20}{:>10.3f}  ({:.0f} annotations/sec)'.format(
+            dataset, 'total', r['total_seconds'], r['per_second'].get('annotations') or 0))
+    print('Results written to', args.out)
+
+if __name__ == '__main__':
+    main()
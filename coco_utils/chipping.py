@@ -0,0 +1,202 @@
+import os
+import time
+
+import numpy as np
+
+from coco_utils.coco_writer import CocoWriter
+from coco_utils.dataset import CocoDataset
+from coco_utils.geometry import clip_polygon, format_segmentation, min_area_rects, polygon_area, segmentation_polygons
+from coco_utils.image_io import open_image_array, read_window, save_image
+from coco_utils.pool import ordered_map
+
+
+def check_chip_size(chip_size, overlap):
+    '''
+    PURPOSE: raise a ValueError if chips of this size and overlap can't tile an image
+    '''
+    if chip_size <= 0:
+        raise ValueError('chip size must be positive, got {}'.format(chip_size))
+    if not 0 <= overlap < chip_size:
+        raise ValueError('overlap must be at least 0 and smaller than the chip size, got {} for a chip size of {}'.format(
+            overlap, chip_size))
+
+def chip_windows(w, h, chip_size, overlap):
+    '''
+    IN:
+        - w, h: image width and height
+        - chip_size: side length of each square chip, in pixels
+        - overlap: number of pixels neighbouring chips share
+    OUT: (M, 4) int array of [x1, y1, x2, y2] windows covering the image, the last row and column
+         pushed back to sit flush with the image edge rather than hanging off it
+    '''
+    check_chip_size(chip_size, overlap)
+    stride = chip_size - overlap
+
+    def starts(length):
+        s = list(range(0, max(length - chip_size, 0) + 1, stride))
+        if s[-1] + chip_size < length:
+            s.append(length - chip_size)
+        return s
+
+    windows = [[x, y, x + chip_size, y + chip_size] for y in starts(h) for x in starts(w)]
+    return np.array(windows, dtype = np.int64).reshape(-1, 4)
+
+def window_annotations(annotations, windows, min_visibility = 0.5):
+    '''
+    PURPOSE: work out which annotations land in each window, and their boxes/polygons within it
+    IN:
+        - annotations: coco annotations on one image
+        - windows: (M, 4) array of [x1, y1, x2, y2] windows
+        - min_visibility: fraction of a box's area that must be inside a window for it to be kept
+    OUT: list, one per window, of annotation copies with bbox (and segmentation) clipped and shifted to the window
+    '''
+    boxes = np.array([a['bbox'] for a in annotations], dtype = np.float64).reshape(-1, 4)
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = x1 + boxes[:, 2]
+    y2 = y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    # Intersect every box with every window at once, (M, N)
+    ix1 = np.maximum(x1[None, :], windows[:, 0:1])
+    iy1 = np.maximum(y1[None, :], windows[:, 1:2])
+    ix2 = np.minimum(x2[None, :], windows[:, 2:3])
+    iy2 = np.minimum(y2[None, :], windows[:, 3:4])
+    iw = ix2 - ix1
+    ih = iy2 - iy1
+    visible = np.where(areas[None, :] > 0, (iw * ih) / np.maximum(areas[None, :], 1e-12), 1.0)
+    keep = (iw > 0) & (ih > 0) & (visible >= min_visibility)
+
+    chips = []
+    for m, (wx1, wy1, wx2, wy2) in enumerate(windows.tolist()):
+        chip_anns = []
+        for n in np.flatnonzero(keep[m]):
+            a = annotations[n]
+            new_a = a.copy()
+            new_a['bbox'] = [float(ix1[m, n] - wx1), float(iy1[m, n] - wy1), float(iw[m, n]), float(ih[m, n])]
+            new_a['area'] = float(iw[m, n] * ih[m, n])
+
+            # Clip any polygons to the window too, shifting them into chip coordinates
+            if a.get('segmentation'):
+                polygons, pairs = segmentation_polygons(a['segmentation'])
+                clipped = [clip_polygon(p, [wx1, wy1, wx2, wy2]) for p in polygons]
+                clipped = [c - [wx1, wy1] for c in clipped if len(c) >= 3]
+                new_a['segmentation'] = format_segmentation(clipped, pairs)
+                if clipped:
+                    new_a['area'] = sum(polygon_area(c) for c in clipped)
+
+            # Refit any rotated box to what's left of the object on the chip
+            if a.get('rbox') is not None:
+                if a.get('segmentation') and clipped:
+                    new_a['rbox'] = min_area_rects(np.concatenate(clipped)[None])[0].tolist()
+                else:
+                    new_a['rbox'] = [a['rbox'][0] - wx1, a['rbox'][1] - wy1] + list(a['rbox'][2:])
+
+            chip_anns.append(new_a)
+        chips.append(chip_anns)
+
+    return chips
+
+def chip_one_image(task):
+    '''
+    PURPOSE: cut one source image into chips and write them out, run in a worker process
+    IN: task tuple of (image, annotations, im_folder, chip_folder, chip_size, overlap, min_visibility, keep_empty, ext)
+    OUT: list of (chip file name, [x1, y1, x2, y2] window, chip annotations, extra chip image fields) for every chip written
+    '''
+    image, annotations, im_folder, chip_folder, chip_size, overlap, min_visibility, keep_empty, ext = task
+
+    windows = chip_windows(image['width'], image['height'], chip_size, overlap)
+    chip_anns = window_annotations(annotations, windows, min_visibility)
+
+    # Open the source image once; uncompressed tiffs are memory-mapped so only each window is read
+    arr = None
+    stem = os.path.splitext(image['file_name'])[0]
+    results = []
+    for window, anns in zip(windows.tolist(), chip_anns):
+        if not anns and not keep_empty:
+            continue
+        if arr is None:
+            arr = open_image_array(im_folder + image['file_name'])
+        chip_name = '{}_{}_{}{}'.format(stem, window[0], window[1], ext)
+        save_image(read_window(arr, window), chip_folder + chip_name)
+        results.append((chip_name, window, anns, {}))
+
+    return results
+
+def write_chip_coco(out_json, sections, images, chip_results, chip_size):
+    '''
+    PURPOSE: number the chips and their annotations and stream them out as a coco json
+    IN:
+        - out_json: path for the chips' coco json
+        - sections: top level sections to carry over (info, licenses, categories...)
+        - images: the source images
+        - chip_results: for each source image, the list of chips returned by chip_one_image
+        - chip_size: side length of each chip
+    OUT: number of chips, number of annotations
+    '''
+    chip_images = []
+    chip_id = 0
+    ann_id = 0
+    with CocoWriter(out_json, **sections) as writer:
+        writer.start_array('annotations')
+        for image, chips in zip(images, chip_results):
+            for chip_name, window, anns, extra in chips:
+                chip_image = image.copy()
+                chip_image.update({"id": chip_id,
+                                   "width": chip_size,
+                                   "height": chip_size,
+                                   "file_name": chip_name,
+                                   "parent_id": image['id'],
+                                   "window": window})
+                chip_image.update(extra)
+                chip_images.append(chip_image)
+                for a in anns:
+                    a['id'] = ann_id
+                    a['image_id'] = chip_id
+                    writer.add_annotation(a)
+                    ann_id += 1
+                chip_id += 1
+        writer.close(images = chip_images)
+
+    return chip_id, ann_id
+
+def chip_coco(json_path, im_folder, chip_folder, out_json, chip_size = 512, overlap = 64,
+              min_visibility = 0.5, keep_empty = False, workers = 1, ext = '.png'):
+    '''
+    PURPOSE: chip the full sized images of a coco dataset (from dota_to_coco, fair1m_json or make_json)
+             into fixed size overlapping tiles, with a new coco json for the tiles
+    IN:
+        - json_path: coco json for the full sized images
+        - im_folder: folder of the full sized images
+        - chip_folder: folder to write the chips to
+        - out_json: path for the chips' coco json
+        - chip_size: side length of each square chip, in pixels
+        - overlap: number of pixels neighbouring chips share
+        - min_visibility: fraction of a box that must be on a chip for it to be kept there
+        - keep_empty: also write chips with no annotations on them
+        - workers: number of processes to chip images with
+        - ext: chip image format
+    OUT: path to the chips' coco json
+    '''
+    # Fail before any work rather than in the first worker
+    check_chip_size(chip_size, overlap)
+
+    start = time.perf_counter()
+    os.makedirs(chip_folder, exist_ok = True)
+
+    gt = CocoDataset(json_path)
+    tasks = [(i, anns, im_folder, chip_folder, chip_size, overlap, min_visibility, keep_empty, ext)
+             for i, anns in gt.iter_images()]
+
+    # Everything but images and annotations carries straight over
+    other_sections = dict(gt.sections, categories = gt.categories)
+    del gt
+
+    chip_id, ann_id = write_chip_coco(out_json, other_sections, [t[0] for t in tasks],
+                                      ordered_map(chip_one_image, tasks, workers), chip_size)
+
+    elapsed = time.perf_counter() - start
+    print('Wrote {} chips with {} annotations from {} images in {:.1f}s ({:.1f} chips/sec)'.format(
+        chip_id, ann_id, len(tasks), elapsed, chip_id / elapsed if elapsed > 0 else 0))
+
+    return out_json
@@ -0,0 +1,123 @@
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from coco_utils.arrays import annotation_arrays
+from coco_utils.dataset import CocoDataset
+from coco_utils.image_io import open_image_array, read_window
+from coco_utils.pool import budgeted_map
+
+
+def category_folder_name(name):
+    '''
+    IN: category name
+    OUT: name made safe to use as a folder name
+    '''
+    return name.replace('/', '-').strip()
+
+def crop_window(bbox, padding, w, h):
+    '''
+    IN:
+        - bbox: [x, y, w, h] box
+        - padding: extra context around the box, in pixels if >= 1, otherwise as a fraction of the box size
+        - w, h: image width and height
+    OUT: integer [x1, y1, x2, y2] window around the box, limited to the image
+    '''
+    x, y, bw, bh = bbox
+    if padding >= 1:
+        pad_x = pad_y = padding
+    else:
+        pad_x = padding * bw
+        pad_y = padding * bh
+    x1 = max(int(np.floor(x - pad_x)), 0)
+    y1 = max(int(np.floor(y - pad_y)), 0)
+    x2 = min(int(np.ceil(x + bw + pad_x)), w)
+    y2 = min(int(np.ceil(y + bh + pad_y)), h)
+    return [x1, y1, x2, y2]
+
+def crop_one_image(task):
+    '''
+    PURPOSE: write a crop of every annotation on one image, run in a worker process
+    IN: task tuple of (image, list of (ann id, category folder, bbox), im_folder, out_folder, padding, resize, ext)
+    OUT: number of crops written
+    '''
+    image, anns, im_folder, out_folder, padding, resize, ext = task
+
+    # One decode (or memory-map) per scene, however many objects are on it
+    arr = open_image_array(im_folder + image['file_name'])
+    h, w = arr.shape[:2]
+    stem = os.path.splitext(image['file_name'])[0]
+
+    written = 0
+    for ann_id, folder, bbox in anns:
+        window = crop_window(bbox, padding, w, h)
+        if window[2] <= window[0] or window[3] <= window[1]:
+            continue
+        crop = read_window(arr, window)
+        if crop.shape[2] == 1:
+            crop = crop[:, :, 0]
+        crop = Image.fromarray(np.ascontiguousarray(crop))
+        if resize is not None:
+            crop = crop.resize(resize)
+        crop.save(os.path.join(out_folder, folder, '{}_{}{}'.format(stem, ann_id, ext)))
+        written += 1
+
+    return written
+
+def make_classification_dataset(json_path, im_folder, out_folder, padding = 0, resize = None, min_size = 1,
+                                workers = 1, memory_budget = 4e9, ext = '.png'):
+    '''
+    PURPOSE: build a classification dataset of per-object crops from a coco json
+             (from dota_to_coco, fair1m_json or make_json), one folder per category
+    IN:
+        - json_path: coco json
+        - im_folder: folder of the images in the coco json
+        - out_folder: folder to write the category folders of crops to
+        - padding: extra context around each box, in pixels if >= 1, otherwise as a fraction of the box size
+        - resize: (w, h) to resize every crop to, None to keep crops at their native size
+        - min_size: skip objects whose box is narrower or shorter than this many pixels
+        - workers: number of processes to crop images with
+        - memory_budget: rough limit, in bytes, on the decoded images in flight across all workers
+        - ext: crop image format
+    OUT: dict of category name -> number of crops written
+    '''
+    start = time.perf_counter()
+    gt = CocoDataset(json_path)
+
+    cat_names = {c['id']: c['name'] for c in gt.categories}
+    folders = {c_id: category_folder_name(name) for c_id, name in cat_names.items()}
+    for folder in set(folders.values()):
+        os.makedirs(os.path.join(out_folder, folder), exist_ok = True)
+
+    # Each image's annotations come from the dataset's index
+    arrays = annotation_arrays(gt.annotations)
+    big_enough = (arrays['bboxes'][:, 2] >= min_size) & (arrays['bboxes'][:, 3] >= min_size)
+
+    tasks = []
+    costs = []
+    counts = {}
+    for image in gt.images:
+        rows = gt.image_annotation_rows(image['id'])
+        rows = rows[big_enough[rows]]
+        if len(rows) == 0:
+            continue
+        anns = [(int(arrays['ids'][r]), folders[int(arrays['category_ids'][r])], arrays['bboxes'][r].tolist()) for r in rows]
+        for r in rows:
+            name = cat_names[int(arrays['category_ids'][r])]
+            counts[name] = counts.get(name, 0) + 1
+        tasks.append((image, anns, im_folder, out_folder, padding, resize, ext))
+        # Decoded size of the image, 3 bytes a pixel is close enough for the budget
+        costs.append(image['width'] * image['height'] * 3)
+    del gt
+
+    total = 0
+    for written in budgeted_map(crop_one_image, tasks, costs, memory_budget, workers):
+        total += written
+
+    elapsed = time.perf_counter() - start
+    print('Wrote {} crops from {} images in {:.1f}s ({:.1f} crops/sec)'.format(
+        total, len(tasks), elapsed, total / elapsed if elapsed > 0 else 0))
+
+    return counts
@@ -0,0 +1,141 @@
+import json
+import os
+
+
+class CocoWriter:
+    '''
+    Writes a coco json to disk a piece at a time
+
+    Sections known up front (info, licenses, categories...) are written straight away,
+    then 'images' and 'annotations' entries are streamed out as they are produced, and
+    anything only known at the end (e.g. categories found while reading labels) is
+    written on close. Everything goes to a temporary file that replaces json_path only
+    once it is complete, so a crash never leaves a half-written or deleted file behind.
+
+    Usage:
+        with CocoWriter(json_path, info = info, licenses = licenses) as writer:
+            writer.add_images(images)
+            for ann in annotations:
+                writer.add_annotation(ann)
+            writer.close(categories = categories)
+    '''
+
+    def __init__(self, json_path, **sections):
+        '''
+        IN:
+            - json_path: where the finished coco json should end up
+            - sections: top level sections to write immediately, in the order given
+        '''
+        self.json_path = json_path
+        self.tmp_path = json_path + '.tmp'
+        self.f = open(self.tmp_path, 'w')
+        self.f.write('{')
+        self.written = set()
+        self.current = None
+        self.first_item = True
+        self.closed = False
+
+        for key, value in sections.items():
+            self.add_section(key, value)
+
+    def start_key(self, key):
+        '''
+        PURPOSE: write the key of a new top level section
+        '''
+        if key in self.written:
+            raise ValueError('Section {} has already been written'.format(key))
+        if self.written:
+            self.f.write(', ')
+        self.f.write(json.dumps(key) + ': ')
+        self.written.add(key)
+
+    def end_array(self):
+        '''
+        PURPOSE: close the array currently being streamed, if any
+        '''
+        if self.current is not None:
+            self.f.write(']')
+            self.current = None
+
+    def add_section(self, key, value):
+        '''
+        PURPOSE: write a whole top level section at once
+        '''
+        self.end_array()
+        self.start_key(key)
+        json.dump(value, self.f)
+
+    def start_array(self, key):
+        '''
+        PURPOSE: make sure the array key exists in the output, even if no items get added
+        '''
+        if self.current != key:
+            self.end_array()
+            self.start_key(key)
+            self.f.write('[')
+            self.current = key
+            self.first_item = True
+
+    def add_item(self, key, item):
+        '''
+        PURPOSE: append one entry to the top level array key, starting the array if needed
+        '''
+        self.start_array(key)
+        if not self.first_item:
+            self.f.write(', ')
+        json.dump(item, self.f)
+        self.first_item = False
+
+    def add_image(self, image):
+        self.add_item('images', image)
+
+    def add_images(self, images):
+        self.start_array('images')
+        for i in images:
+            self.add_item('images', i)
+
+    def add_annotation(self, annotation):
+        self.add_item('annotations', annotation)
+
+    def add_annotations(self, annotations):
+        self.start_array('annotations')
+        for a in annotations:
+            self.add_item('annotations', a)
+
+    def close(self, **sections):
+        '''
+        PURPOSE: write any remaining sections and move the finished file into place
+        IN: sections: top level sections to write last, in the order given
+        OUT: path to the finished coco json
+        '''
+        if self.closed:
+            return self.json_path
+        for key, value in sections.items():
+            self.add_section(key, value)
+        self.end_array()
+        self.f.write('}')
+        self.f.close()
+        os.replace(self.tmp_path, self.json_path)
+        self.closed = True
+        return self.json_path
+
+    def abort(self):
+        '''
+        PURPOSE: throw away the partial output, leaving whatever was at json_path untouched
+        '''
+        if self.closed:
+            return
+        self.f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,292 @@
+import json
+import os
+import shutil
+from array import array
+
+import numpy as np
+
+from coco_utils.coco_writer import CocoWriter
+from coco_utils.geometry import segmentation_polygons
+from coco_utils.json_stream import iter_json_array, read_json_sections
+
+# Output formats the converters accept
+OUTPUT_FORMATS = ('json', 'columnar', 'both')
+
+
+def columnar_path(json_path):
+    '''
+    IN: path to a coco json
+    OUT: path of the columnar store kept alongside it
+    '''
+    return os.path.splitext(json_path)[0] + '.columns'
+
+
+class ColumnarWriter:
+    '''
+    Writes coco annotations as a folder of flat numpy arrays instead of json
+
+    Has the same interface as CocoWriter, so converters can stream into either. Columns:
+        - ann_ids, image_ids, category_ids: (N,) int64
+        - bboxes: (N, 4) float32 [x, y, w, h]
+        - areas: (N,) float32, nan where the annotation has no area
+        - difficult, iscrowd: (N,) int8
+        - rboxes: (N, 5) float32 [cx, cy, w, h, angle] rotated boxes, nan where the annotation has none
+        - ring_offsets: (N + 1,) int64, annotation i's polygons are rings ring_offsets[i]:ring_offsets[i + 1]
+        - point_offsets: (R + 1,) int64, ring r's vertices are points[point_offsets[r]:point_offsets[r + 1]]
+        - points: (P, 2) float32 polygon vertices
+        - im_ids, im_widths, im_heights: (M,) int64 per image, im_gsds: (M,) float32
+    Everything else (the images list itself, categories, info...) goes in meta.json
+    '''
+
+    def __init__(self, store_dir, **sections):
+        self.store_dir = store_dir
+        self.sections = dict(sections)
+        self.images = []
+        self.closed = False
+
+        self.ann_ids = array('q')
+        self.image_ids = array('q')
+        self.category_ids = array('q')
+        self.bboxes = array('f')
+        self.areas = array('f')
+        self.difficult = array('b')
+        self.iscrowd = array('b')
+        self.rboxes = array('f')
+        self.ring_offsets = array('q', [0])
+        self.point_offsets = array('q', [0])
+        self.points = array('f')
+
+    def add_section(self, key, value):
+        if key == 'images':
+            self.add_images(value)
+        elif key == 'annotations':
+            self.add_annotations(value)
+        else:
+            self.sections[key] = value
+
+    def start_array(self, key):
+        pass
+
+    def add_item(self, key, item):
+        if key == 'images':
+            self.add_image(item)
+        elif key == 'annotations':
+            self.add_annotation(item)
+        else:
+            self.sections.setdefault(key, []).append(item)
+
+    def add_image(self, image):
+        self.images.append(image)
+
+    def add_images(self, images):
+        for i in images:
+            self.add_image(i)
+
+    def add_annotation(self, annotation):
+        self.ann_ids.append(annotation['id'])
+        self.image_ids.append(annotation['image_id'])
+        self.category_ids.append(annotation['category_id'])
+        self.bboxes.extend(annotation['bbox'])
+        area = annotation.get('area')
+        self.areas.append(float('nan') if area is None else area)
+        self.difficult.append(annotation.get('difficult', 0))
+        self.iscrowd.append(annotation.get('iscrowd', 0))
+        rbox = annotation.get('rbox')
+        self.rboxes.extend([float('nan')] * 5 if rbox is None else rbox)
+
+        polygons, _ = segmentation_polygons(annotation.get('segmentation'))
+        for p in polygons:
+            self.points.extend(p.reshape(-1).tolist())
+            self.point_offsets.append(len(self.points) // 2)
+        self.ring_offsets.append(len(self.point_offsets) - 1)
+
+    def add_annotations(self, annotations):
+        for a in annotations:
+            self.add_annotation(a)
+
+    def close(self, **sections):
+        '''
+        PURPOSE: write all the columns out, replacing any existing store only once the new one is complete
+        OUT: path to the store
+        '''
+        if self.closed:
+            return self.store_dir
+        for key, value in sections.items():
+            self.add_section(key, value)
+
+        tmp_dir = self.store_dir + '.tmp'
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+
+        columns = {
+            'ann_ids': np.frombuffer(self.ann_ids, dtype = np.int64),
+            'image_ids': np.frombuffer(self.image_ids, dtype = np.int64),
+            'category_ids': np.frombuffer(self.category_ids, dtype = np.int64),
+            'bboxes': np.frombuffer(self.bboxes, dtype = np.float32).reshape(-1, 4),
+            'areas': np.frombuffer(self.areas, dtype = np.float32),
+            'difficult': np.frombuffer(self.difficult, dtype = np.int8),
+            'iscrowd': np.frombuffer(self.iscrowd, dtype = np.int8),
+            'rboxes': np.frombuffer(self.rboxes, dtype = np.float32).reshape(-1, 5),
+            'ring_offsets': np.frombuffer(self.ring_offsets, dtype = np.int64),
+            'point_offsets': np.frombuffer(self.point_offsets, dtype = np.int64),
+            'points': np.frombuffer(self.points, dtype = np.float32).reshape(-1, 2),
+            'im_ids': np.array([i['id'] for i in self.images], dtype = np.int64),
+            'im_widths': np.array([i['width'] for i in self.images], dtype = np.int64),
+            'im_heights': np.array([i['height'] for i in self.images], dtype = np.int64),
+            'im_gsds': np.array([self.gsd_value(i) for i in self.images], dtype = np.float32),
+        }
+        for name, column in columns.items():
+            np.save(os.path.join(tmp_dir, name + '.npy'), column)
+
+        meta = dict(self.sections)
+        meta['images'] = self.images
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        # Swap the finished store into place
+        if os.path.exists(self.store_dir):
+            old_dir = self.store_dir + '.old'
+            os.replace(self.store_dir, old_dir)
+            os.replace(tmp_dir, self.store_dir)
+            shutil.rmtree(old_dir)
+        else:
+            os.replace(tmp_dir, self.store_dir)
+
+        self.closed = True
+        return self.store_dir
+
+    @staticmethod
+    def gsd_value(image):
+        '''
+        OUT: the image's gsd, nan where it has none (missing, None, or False as dota_to_coco leaves it)
+        '''
+        gsd = image.get('gsd')
+        return np.nan if gsd is None or isinstance(gsd, bool) else gsd
+
+    def abort(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class TeeWriter:
+    '''
+    Sends everything written to it on to several writers, e.g. a CocoWriter and a ColumnarWriter
+    '''
+
+    def __init__(self, *writers):
+        self.writers = writers
+
+    def __getattr__(self, name):
+        # Forward every writer method call to all the writers
+        def forward(*args, **kwargs):
+            results = [getattr(w, name)(*args, **kwargs) for w in self.writers]
+            return results[0]
+        return forward
+
+    def add_section(self, key, value):
+        # A generator section (e.g. close(images = ...)) would otherwise be used up by the first writer
+        value = self.shareable(value)
+        return [w.add_section(key, value) for w in self.writers][0]
+
+    def close(self, **sections):
+        sections = {key: self.shareable(value) for key, value in sections.items()}
+        return [w.close(**sections) for w in self.writers][0]
+
+    @staticmethod
+    def shareable(value):
+        '''
+        OUT: value as something every writer can read in turn, generators are read into a list
+        '''
+        return value if isinstance(value, (list, tuple, dict, str, int, float, type(None))) else list(value)
+
+    def add_images(self, images):
+        # Images and annotations are often generators, so hand each item to every writer as it comes.
+        # The array is started first so it's in the output even when there are no items
+        self.start_array('images')
+        for i in images:
+            self.add_image(i)
+
+    def add_annotations(self, annotations):
+        self.start_array('annotations')
+        for a in annotations:
+            self.add_annotation(a)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for w in self.writers:
+            w.__exit__(exc_type, exc, tb)
+        return False
+
+
+def open_coco_writer(json_path, output_format = 'json', **sections):
+    '''
+    IN:
+        - json_path: path for the coco json, the columnar store goes alongside it (see columnar_path)
+        - output_format: 'json', 'columnar' or 'both'
+        - sections: top level sections known up front, as for CocoWriter
+    OUT: writer with the CocoWriter interface that produces the requested output(s)
+    '''
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('output_format must be one of {}'.format(OUTPUT_FORMATS))
+    if output_format == 'json':
+        return CocoWriter(json_path, **sections)
+    if output_format == 'columnar':
+        return ColumnarWriter(columnar_path(json_path), **sections)
+    return TeeWriter(CocoWriter(json_path, **sections), ColumnarWriter(columnar_path(json_path), **sections))
+
+def coco_to_columnar(json_path, store_dir = None):
+    '''
+    PURPOSE: convert an existing coco json to a columnar store, streaming the annotations so
+             the json is never fully loaded
+    IN:
+        - json_path: coco json
+        - store_dir: where to write the store, defaults to columnar_path(json_path)
+    OUT: path to the store
+    '''
+    if store_dir is None:
+        store_dir = columnar_path(json_path)
+
+    # Small sections are read whole, skipping over the images and annotations
+    writer = ColumnarWriter(store_dir, **read_json_sections(json_path))
+    writer.add_images(iter_json_array(json_path, 'images'))
+    writer.add_annotations(iter_json_array(json_path, 'annotations'))
+    return writer.close()
+
+def load_columnar(store_dir, mmap = True):
+    '''
+    PURPOSE: open a columnar store, memory-mapping the arrays so start up is near instant
+    IN:
+        - store_dir: path to a store written by ColumnarWriter
+        - mmap: memory-map the arrays rather than reading them into memory
+    OUT: dict of every column, plus the images, categories and other sections from meta.json
+    '''
+    with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+        store = json.load(f)
+
+    for name in os.listdir(store_dir):
+        if name.endswith('.npy'):
+            store[name[:-4]] = np.load(os.path.join(store_dir, name), mmap_mode = 'r' if mmap else None)
+
+    return store
+
+def annotation_polygons(store, i):
+    '''
+    IN:
+        - store: columnar store from load_columnar
+        - i: row of the annotation
+    OUT: list of (K, 2) vertex arrays for the annotation's polygons
+    '''
+    rings = range(store['ring_offsets'][i], store['ring_offsets'][i + 1])
+    return [np.asarray(store['points'][store['point_offsets'][r]:store['point_offsets'][r + 1]]) for r in rings]
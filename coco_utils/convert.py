@@ -0,0 +1,70 @@
+import argparse
+
+from coco_utils.columnar import OUTPUT_FORMATS
+from coco_utils.metrics import metrics
+
+
+def convert_xview(args):
+    from xView.xview_coco import make_json
+    return make_json(args.geojson_path, args.classes_path, args.image_folder, args.workers, args.cache, args.output_format,
+                     args.geo_index)
+
+def convert_dota(args):
+    from DOTA.dota_coco import dota_to_coco
+    return dota_to_coco(args.im_folder, args.ann_folder, args.ann_folder_full, args.version, args.workers, args.cache,
+                        args.output_format, args.rbox)
+
+def convert_fair1m(args):
+    from FAIR1M.fair1m_coco import fair1m_json
+    return fair1m_json(args.json_path, args.xml_folder, args.workers, args.cache, args.output_format, not args.no_gsd)
+
+def build_parser(parser = None):
+    '''
+    IN: parser to add the convert arguments to, None for a new one
+    OUT: argparse parser with a sub-command per dataset
+    '''
+    if parser is None:
+        parser = argparse.ArgumentParser(description = 'Convert a dataset to coco format')
+    datasets = parser.add_subparsers(dest = 'dataset', required = True)
+
+    xview = datasets.add_parser('xview', help = 'xView geojson to coco')
+    xview.add_argument('geojson_path', help = 'xView geojson, the json is written next to it')
+    xview.add_argument('classes_path', help = '.txt file of xView class numbers and names')
+    xview.add_argument('image_folder', help = 'folder of the images')
+    xview.add_argument('--geo-index', action = 'store_true', help = 'also build a lon/lat index of the annotations')
+    xview.set_defaults(func = convert_xview)
+
+    dota = datasets.add_parser('dota', help = 'DOTA label files to coco')
+    dota.add_argument('im_folder', help = 'folder of the images, the json is written to its parent folder')
+    dota.add_argument('ann_folder', help = 'folder of label .txt files')
+    dota.add_argument('ann_folder_full', help = 'folder of label .txt files with the imagesource and gsd header')
+    dota.add_argument('--version', default = '1.0', help = 'DOTA version, for the info section')
+    dota.add_argument('--rbox', action = 'store_true', help = 'add minimum area rotated boxes to the annotations')
+    dota.set_defaults(func = convert_dota)
+
+    fair1m = datasets.add_parser('fair1m', help = 'FAIR1M xml label files to coco')
+    fair1m.add_argument('json_path', help = 'coco json to write')
+    fair1m.add_argument('xml_folder', help = 'folder of label .xml files')
+    fair1m.add_argument('--no-gsd', action = 'store_true', help = "don't estimate a gsd for each image")
+    fair1m.set_defaults(func = convert_fair1m)
+
+    for p in (xview, dota, fair1m):
+        p.add_argument('--workers', type = int, default = 1, help = 'number of processes/threads to use')
+        p.add_argument('--output-format', choices = OUTPUT_FORMATS, default = 'json', help = 'what to write')
+        p.add_argument('--cache', action = 'store_true', help = 'cache parsed files next to the output for faster re-runs')
+        p.add_argument('--metrics', help = 'write the stage timings and throughput to this json file')
+    return parser
+
+def main(args = None):
+    args = build_parser().parse_args(args)
+
+    metrics.reset()
+    out_path = args.func(args)
+    print('Wrote', out_path)
+    metrics.report()
+    if args.metrics:
+        metrics.to_json(args.metrics)
+    return out_path
+
+if __name__ == '__main__':
+    main()
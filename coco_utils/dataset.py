@@ -0,0 +1,239 @@
+import numpy as np
+
+from coco_utils.arrays import load_coco
+from coco_utils.coco_writer import CocoWriter
+
+
+def sorted_index(ids):
+    '''
+    IN: (N,) int array of ids
+    OUT: (sorted ids, order) so ids[order] == sorted ids, for binary search lookups
+    '''
+    order = np.argsort(ids, kind = 'stable')
+    return ids[order], order
+
+def find_rows(sorted_ids, order, wanted):
+    '''
+    IN:
+        - sorted_ids, order: from sorted_index
+        - wanted: (K,) int array of ids to look up
+    OUT: (K,) int array of the row holding each wanted id, -1 where it isn't there
+    '''
+    wanted = np.asarray(wanted, dtype = np.int64).reshape(-1)
+    if len(sorted_ids) == 0:
+        return np.full(len(wanted), -1, dtype = np.int64)
+    pos = np.clip(np.searchsorted(sorted_ids, wanted), 0, len(sorted_ids) - 1)
+    return np.where(sorted_ids[pos] == wanted, order[pos], -1)
+
+
+class CocoDataset:
+    '''
+    Indexed, read-only access to a coco dataset (from dota_to_coco, fair1m_json, make_json or merge_coco)
+
+    The indexes are built once, as sorted numpy arrays rather than dicts of lists, so they cost a few
+    int64s per image and annotation:
+        - image, annotation and category id -> row, by binary search
+        - image -> its annotations, as a range of an annotation ordering sorted by image
+        - category -> its annotations, as a range of an annotation ordering sorted by category
+    The coco dicts themselves are shared, not copied, so treat everything returned as read-only.
+    '''
+
+    def __init__(self, coco):
+        '''
+        IN: path to a coco json, or an already loaded coco dict
+        '''
+        coco = load_coco(coco)
+        self.images = coco.get('images', [])
+        self.annotations = coco.get('annotations', [])
+        self.categories = coco.get('categories', [])
+        # Everything else (info, licenses...) is kept as it was
+        self.sections = {k: v for k, v in coco.items() if k not in ('images', 'annotations', 'categories')}
+
+        n = len(self.annotations)
+        self.image_ids = np.fromiter((i['id'] for i in self.images), dtype = np.int64, count = len(self.images))
+        self.ann_ids = np.fromiter((a['id'] for a in self.annotations), dtype = np.int64, count = n)
+        self.ann_image_ids = np.fromiter((a['image_id'] for a in self.annotations), dtype = np.int64, count = n)
+        self.ann_category_ids = np.fromiter((a['category_id'] for a in self.annotations), dtype = np.int64, count = n)
+        self.category_ids = np.array([c['id'] for c in self.categories], dtype = np.int64)
+        self.category_names = {c['name']: c['id'] for c in self.categories}
+
+        self._sorted_image_ids, self._image_order = sorted_index(self.image_ids)
+        self._sorted_ann_ids, self._ann_order = sorted_index(self.ann_ids)
+        self._sorted_category_ids, self._category_order = sorted_index(self.category_ids)
+
+        # Annotations sorted by image, with each image's run found by searching for its id, so
+        # images without annotations get an empty run
+        self._by_image = np.argsort(self.ann_image_ids, kind = 'stable')
+        sorted_image_ids = self.ann_image_ids[self._by_image]
+        self._image_starts = np.searchsorted(sorted_image_ids, self._sorted_image_ids, side = 'left')
+        self._image_ends = np.searchsorted(sorted_image_ids, self._sorted_image_ids, side = 'right')
+
+        self._by_category = np.argsort(self.ann_category_ids, kind = 'stable')
+        sorted_category_ids = self.ann_category_ids[self._by_category]
+        self._category_starts = np.searchsorted(sorted_category_ids, self._sorted_category_ids, side = 'left')
+        self._category_ends = np.searchsorted(sorted_category_ids, self._sorted_category_ids, side = 'right')
+
+    def __len__(self):
+        return len(self.images)
+
+    def image_rows(self, image_ids):
+        '''
+        IN: image ids
+        OUT: (K,) array of each image's row in self.images, -1 if there is no such image
+        '''
+        return find_rows(self._sorted_image_ids, self._image_order, image_ids)
+
+    def annotation_rows(self, ann_ids):
+        '''
+        IN: annotation ids
+        OUT: (K,) array of each annotation's row in self.annotations, -1 if there is no such annotation
+        '''
+        return find_rows(self._sorted_ann_ids, self._ann_order, ann_ids)
+
+    def category_rows(self, category_ids):
+        '''
+        IN: category ids
+        OUT: (K,) array of each category's row in self.categories, -1 if there is no such category
+        '''
+        return find_rows(self._sorted_category_ids, self._category_order, category_ids)
+
+    def get_image(self, image_id):
+        '''
+        OUT: the coco image with this id, or None
+        '''
+        row = self.image_rows(image_id)[0]
+        return self.images[row] if row >= 0 else None
+
+    def get_annotation(self, ann_id):
+        '''
+        OUT: the coco annotation with this id, or None
+        '''
+        row = self.annotation_rows(ann_id)[0]
+        return self.annotations[row] if row >= 0 else None
+
+    def get_category(self, category_id):
+        '''
+        OUT: the coco category with this id, or None
+        '''
+        row = self.category_rows(category_id)[0]
+        return self.categories[row] if row >= 0 else None
+
+    def category_id(self, name):
+        '''
+        OUT: id of the category with this name, or None
+        '''
+        return self.category_names.get(name)
+
+    def image_annotation_rows(self, image_id):
+        '''
+        IN: image id
+        OUT: array of the rows in self.annotations of the image's annotations, in their original order
+        '''
+        k = np.searchsorted(self._sorted_image_ids, image_id)
+        if k >= len(self._sorted_image_ids) or self._sorted_image_ids[k] != image_id:
+            return np.zeros(0, dtype = np.int64)
+        return self._by_image[self._image_starts[k]:self._image_ends[k]]
+
+    def image_annotations(self, image_id):
+        '''
+        OUT: list of the coco annotations on the image
+        '''
+        return [self.annotations[r] for r in self.image_annotation_rows(image_id)]
+
+    def category_annotation_rows(self, category_id):
+        '''
+        IN: category id
+        OUT: array of the rows in self.annotations of the category's annotations, in their original order
+        '''
+        k = np.searchsorted(self._sorted_category_ids, category_id)
+        if k >= len(self._sorted_category_ids) or self._sorted_category_ids[k] != category_id:
+            return np.zeros(0, dtype = np.int64)
+        return self._by_category[self._category_starts[k]:self._category_ends[k]]
+
+    def category_annotations(self, category_id):
+        '''
+        OUT: list of the coco annotations of the category
+        '''
+        return [self.annotations[r] for r in self.category_annotation_rows(category_id)]
+
+    def images_with_category(self, category_id):
+        '''
+        OUT: sorted array of the ids of images with at least one annotation of the category
+        '''
+        return np.unique(self.ann_image_ids[self.category_annotation_rows(category_id)])
+
+    def annotation_counts(self):
+        '''
+        OUT: (M,) array of the number of annotations on each image, in self.images order
+        '''
+        counts = np.zeros(len(self.images), dtype = np.int64)
+        counts[self._image_order] = self._image_ends - self._image_starts
+        return counts
+
+    def iter_images(self):
+        '''
+        OUT: generator of (coco image, list of its coco annotations), in self.images order
+        '''
+        positions = np.empty(len(self.images), dtype = np.int64)
+        positions[self._image_order] = np.arange(len(self.images))
+        for image, k in zip(self.images, positions.tolist()):
+            rows = self._by_image[self._image_starts[k]:self._image_ends[k]]
+            yield image, [self.annotations[r] for r in rows]
+
+    def annotation_mask(self, image_ids = None, category_ids = None):
+        '''
+        IN:
+            - image_ids: only annotations on these images, None for any image
+            - category_ids: only annotations of these categories, None for any category
+        OUT: (N,) bool array over self.annotations
+        '''
+        mask = np.ones(len(self.annotations), dtype = bool)
+        if image_ids is not None:
+            mask &= np.isin(self.ann_image_ids, np.asarray(image_ids, dtype = np.int64))
+        if category_ids is not None:
+            mask &= np.isin(self.ann_category_ids, np.asarray(category_ids, dtype = np.int64))
+        return mask
+
+    def subset(self, image_ids = None, category_ids = None, keep_empty = True):
+        '''
+        PURPOSE: make a smaller dataset from some of the images and/or categories
+        IN:
+            - image_ids: images to keep, None for all of them
+            - category_ids: categories to keep, None for all of them
+            - keep_empty: keep images left with no annotations
+        OUT: new CocoDataset sharing this one's coco dicts
+        '''
+        mask = self.annotation_mask(image_ids, category_ids)
+        annotations = [self.annotations[r] for r in np.flatnonzero(mask)]
+
+        im_mask = np.ones(len(self.images), dtype = bool)
+        if image_ids is not None:
+            im_mask &= np.isin(self.image_ids, np.asarray(image_ids, dtype = np.int64))
+        if not keep_empty:
+            im_mask &= np.isin(self.image_ids, self.ann_image_ids[mask])
+        images = [self.images[r] for r in np.flatnonzero(im_mask)]
+
+        categories = self.categories
+        if category_ids is not None:
+            wanted = set(int(c) for c in np.asarray(category_ids).reshape(-1))
+            categories = [c for c in self.categories if c['id'] in wanted]
+
+        coco = dict(self.sections, images = images, annotations = annotations, categories = categories)
+        return CocoDataset(coco)
+
+    def to_dict(self):
+        '''
+        OUT: coco dict of the dataset
+        '''
+        return dict(self.sections, images = self.images, categories = self.categories, annotations = self.annotations)
+
+    def save(self, json_path):
+        '''
+        PURPOSE: write the dataset out as a coco json
+        OUT: path to the json
+        '''
+        with CocoWriter(json_path, **self.sections) as writer:
+            writer.add_section('categories', self.categories)
+            writer.add_images(self.images)
+            writer.add_annotations(self.annotations)
+        return json_path
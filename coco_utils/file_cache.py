@@ -0,0 +1,123 @@
+import os
+import pickle
+import sqlite3
+
+from coco_utils.pool import ordered_map
+
+
+class FileCache:
+    '''
+    Persistent cache of per-file parse results, stored in a small sqlite database
+
+    Entries are keyed on the parsing function and the file path, and are only
+    used while the file's size and modification time are unchanged, so
+    re-running a converter only re-parses files that have been added or edited
+    '''
+
+    def __init__(self, cache_path):
+        '''
+        IN: cache_path: path to the sqlite file, created if it doesn't exist
+        '''
+        self.cache_path = cache_path
+        self.db = sqlite3.connect(cache_path)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS entries (
+                               func TEXT, path TEXT, size INTEGER, mtime INTEGER, value BLOB,
+                               PRIMARY KEY (func, path))''')
+        self.db.commit()
+
+    def fresh_paths(self, func_name, paths):
+        '''
+        IN:
+            - func_name: name of the parsing function the entries belong to
+            - paths: file paths to check
+        OUT: set of the paths with an entry matching the file's current size and mtime
+        '''
+        stored = {}
+        for path, size, mtime in self.db.execute('SELECT path, size, mtime FROM entries WHERE func = ?', (func_name,)):
+            stored[path] = (size, mtime)
+
+        fresh = set()
+        for p in paths:
+            if p in stored:
+                st = os.stat(p)
+                if stored[p] == (st.st_size, st.st_mtime_ns):
+                    fresh.add(p)
+        return fresh
+
+    def get(self, func_name, path):
+        '''
+        OUT: the stored value for path, or None
+        '''
+        row = self.db.execute('SELECT value FROM entries WHERE func = ? AND path = ?', (func_name, path)).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0])
+
+    def put(self, func_name, path, value):
+        '''
+        PURPOSE: store the parse result for path, stamped with the file's current size and mtime
+        '''
+        st = os.stat(path)
+        self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                        (func_name, path, st.st_size, st.st_mtime_ns, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+
+    def prune(self, func_name, keep_paths):
+        '''
+        PURPOSE: drop entries for files that have been removed from the folders keep_paths are in
+        '''
+        keep_paths = set(keep_paths)
+        folders = set(os.path.dirname(p) for p in keep_paths)
+        stale = [(func_name, p) for (p,) in self.db.execute('SELECT path FROM entries WHERE func = ?', (func_name,))
+                 if p not in keep_paths and os.path.dirname(p) in folders]
+        self.db.executemany('DELETE FROM entries WHERE func = ? AND path = ?', stale)
+        self.db.commit()
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def func_key(func):
+    '''
+    OUT: name that identifies func's results in the cache
+    '''
+    return func.__module__ + '.' + func.__qualname__
+
+def cached_ordered_map(func, paths, workers = 1, threads = False, cache_path = None):
+    '''
+    PURPOSE: ordered_map over file paths that reuses cached results for files that haven't changed
+    IN:
+        - func: function of one file path (must be defined at module level when using processes)
+        - paths: list of file paths
+        - workers, threads: passed to ordered_map for the files that need (re)parsing
+        - cache_path: sqlite cache file, None to disable caching
+    OUT: generator of func(path) for each path, in input order
+    '''
+    if cache_path is None:
+        for result in ordered_map(func, paths, workers, threads):
+            yield result
+        return
+
+    cache = FileCache(cache_path)
+    name = func_key(func)
+    try:
+        fresh = cache.fresh_paths(name, paths)
+        stale = [p for p in paths if p not in fresh]
+        print('{} of {} files unchanged since last run'.format(len(fresh), len(paths)))
+
+        # Only the changed files go through the pool, everything else comes out of the cache
+        computed = ordered_map(func, stale, workers, threads)
+        for p in paths:
+            if p in fresh:
+                yield cache.get(name, p)
+            else:
+                value = next(computed)
+                cache.put(name, p, value)
+                yield value
+
+        cache.prune(name, paths)
+    finally:
+        cache.close()
@@ -0,0 +1,229 @@
+import json
+import math
+import os
+import sqlite3
+
+import numpy as np
+
+from coco_utils.json_stream import iter_json_array
+from coco_utils.pool import batched
+
+# Mean earth radius, in meters
+EARTH_RADIUS_M = 6371008.8
+
+
+def geo_index_path(json_path):
+    '''
+    IN: path to a coco json
+    OUT: path of the geospatial index kept alongside it
+    '''
+    return os.path.splitext(json_path)[0] + '.geoindex'
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    '''
+    IN: longitudes and latitudes in degrees, numbers or numpy arrays
+    OUT: great circle distance(s) in meters
+    '''
+    lon1, lat1, lon2, lat2 = [np.radians(v) for v in (lon1, lat1, lon2, lat2)]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def split_lon_range(min_lon, max_lon):
+    '''
+    IN: longitude range in degrees. min_lon > max_lon means the range crosses the antimeridian, as do
+        ranges running past -180 or 180
+    OUT: list of one or two (min_lon, max_lon) ranges within [-180, 180] covering the same longitudes
+    '''
+    if max_lon - min_lon >= 360:
+        return [(-180.0, 180.0)]
+    if min_lon > max_lon:
+        return [(min_lon, 180.0), (-180.0, max_lon)]
+    if min_lon < -180:
+        return [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return [(min_lon, max_lon)]
+
+
+class GeoIndex:
+    '''
+    Persistent geospatial index of annotation footprints, stored in a small sqlite database
+
+    Each annotation's bbox_geos ([lon, lat, w, h], as make_json writes them) goes in an sqlite R-tree,
+    next to the annotation itself, so region queries never have to load or scan the coco json. The R-tree
+    holds 32 bit floats, so its hits are checked against the exact footprints kept with the annotations.
+    Falls back to a plain indexed table when sqlite was built without R-tree support.
+    '''
+
+    def __init__(self, index_path):
+        '''
+        IN: index_path: path to the sqlite file, created if it doesn't exist
+        '''
+        self.index_path = index_path
+        self.db = sqlite3.connect(index_path)
+        try:
+            self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS boxes USING rtree(id, min_lon, max_lon, min_lat, max_lat)')
+        except sqlite3.OperationalError:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS boxes (
+                                   id INTEGER PRIMARY KEY, min_lon REAL, max_lon REAL, min_lat REAL, max_lat REAL)''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS boxes_lon ON boxes (min_lon, max_lon)')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS annotations (
+                               id INTEGER PRIMARY KEY, image_id INTEGER,
+                               min_lon REAL, max_lon REAL, min_lat REAL, max_lat REAL, value TEXT)''')
+        self.db.commit()
+
+    def add_annotations(self, annotations):
+        '''
+        PURPOSE: add a batch of annotations with bbox_geos to the index, annotations without one are skipped
+        IN: list of coco annotations
+        '''
+        annotations = [a for a in annotations if a.get('bbox_geos')]
+        if not annotations:
+            return
+        geos = np.array([a['bbox_geos'] for a in annotations], dtype = np.float64)
+        rows = np.column_stack([geos[:, 0], geos[:, 0] + geos[:, 2], geos[:, 1], geos[:, 1] + geos[:, 3]])
+        ids = [a['id'] for a in annotations]
+        self.db.executemany('INSERT OR REPLACE INTO boxes VALUES (?, ?, ?, ?, ?)',
+                            [(i,) + tuple(r) for i, r in zip(ids, rows.tolist())])
+        self.db.executemany('INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            [(a['id'], a['image_id']) + tuple(r) + (json.dumps(a),) for a, r in zip(annotations, rows.tolist())])
+
+    def query_ids(self, min_lon, min_lat, max_lon, max_lat):
+        '''
+        IN: lon/lat rectangle, in degrees. min_lon > max_lon is a rectangle crossing the antimeridian
+        OUT: sorted (N,) int64 array of the ids of annotations whose footprint intersects the rectangle
+        '''
+        ids = []
+        for lo, hi in split_lon_range(min_lon, max_lon):
+            rows = self.db.execute('''SELECT a.id FROM boxes b JOIN annotations a ON a.id = b.id
+                                      WHERE b.min_lon <= ? AND b.max_lon >= ? AND b.min_lat <= ? AND b.max_lat >= ?
+                                      AND a.min_lon <= ? AND a.max_lon >= ? AND a.min_lat <= ? AND a.max_lat >= ?''',
+                                   (hi, lo, max_lat, min_lat) * 2).fetchall()
+            ids.extend(r[0] for r in rows)
+        return np.unique(np.array(ids, dtype = np.int64))
+
+    def query_radius_ids(self, lon, lat, radius_m):
+        '''
+        IN:
+            - lon, lat: centre point, in degrees
+            - radius_m: search radius, in meters
+        OUT: sorted (N,) int64 array of the ids of annotations whose footprint comes within radius_m of the point
+        '''
+        # Find candidates with the rectangle around the circle, then measure the distance from the
+        # point to the nearest spot on each candidate's footprint
+        d_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+        cos_lat = math.cos(math.radians(lat))
+        d_lon = 180.0 if cos_lat < 1e-9 else min(math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)), 180.0)
+        rows = []
+        # Near the antimeridian the rectangle wraps round, so is searched as two
+        for lo, hi in split_lon_range(lon - d_lon, lon + d_lon):
+            rows.extend(self.db.execute('''SELECT a.id, a.min_lon, a.max_lon, a.min_lat, a.max_lat FROM boxes b JOIN annotations a ON a.id = b.id
+                                           WHERE b.min_lon <= ? AND b.max_lon >= ? AND b.min_lat <= ? AND b.max_lat >= ?''',
+                                        (hi, lo, lat + d_lat, lat - d_lat)).fetchall())
+        if not rows:
+            return np.zeros(0, dtype = np.int64)
+        rows = np.array(rows, dtype = np.float64)
+        # The nearest edge of a footprint can be across the antimeridian, so clip the point a turn
+        # either way round as well and keep the shortest distance
+        near_lat = np.clip(lat, rows[:, 3], rows[:, 4])
+        distance = np.min([haversine_m(l, lat, np.clip(l, rows[:, 1], rows[:, 2]), near_lat)
+                           for l in (lon - 360, lon, lon + 360)], axis = 0)
+        close = distance <= radius_m
+        return np.unique(rows[close, 0].astype(np.int64))
+
+    def get_annotations(self, ids):
+        '''
+        IN: annotation ids, e.g. from query_ids
+        OUT: list of the coco annotations, in the order of ids
+        '''
+        found = {}
+        ids = [int(i) for i in ids]
+        # Stay under sqlite's limit on query parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            query = 'SELECT id, value FROM annotations WHERE id IN ({})'.format(','.join('?' * len(chunk)))
+            for i, value in self.db.execute(query, chunk):
+                found[i] = json.loads(value)
+        return [found[i] for i in ids if i in found]
+
+    def image_ids(self, ids):
+        '''
+        IN: annotation ids, e.g. from query_ids
+        OUT: sorted list of the distinct images those annotations are on
+        '''
+        image_ids = set()
+        ids = [int(i) for i in ids]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            query = 'SELECT DISTINCT image_id FROM annotations WHERE id IN ({})'.format(','.join('?' * len(chunk)))
+            image_ids.update(r[0] for r in self.db.execute(query, chunk))
+        return sorted(image_ids)
+
+    def query(self, min_lon, min_lat, max_lon, max_lat):
+        '''
+        IN: lon/lat rectangle, in degrees
+        OUT: list of the coco annotations intersecting it
+        '''
+        return self.get_annotations(self.query_ids(min_lon, min_lat, max_lon, max_lat))
+
+    def query_images(self, min_lon, min_lat, max_lon, max_lat):
+        '''
+        IN: lon/lat rectangle, in degrees
+        OUT: sorted list of the ids of images with an annotation intersecting it
+        '''
+        return self.image_ids(self.query_ids(min_lon, min_lat, max_lon, max_lat))
+
+    def query_radius(self, lon, lat, radius_m):
+        '''
+        IN: centre point in degrees and radius in meters
+        OUT: list of the coco annotations within the radius
+        '''
+        return self.get_annotations(self.query_radius_ids(lon, lat, radius_m))
+
+    def query_radius_images(self, lon, lat, radius_m):
+        '''
+        IN: centre point in degrees and radius in meters
+        OUT: sorted list of the ids of images with an annotation within the radius
+        '''
+        return self.image_ids(self.query_radius_ids(lon, lat, radius_m))
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM annotations').fetchone()[0]
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def build_geo_index(json_path, index_path = None, batch_size = 100000):
+    '''
+    PURPOSE: build the geospatial index for a coco json with bbox_geos (from make_json), streaming the
+             annotations so the json is never fully loaded. The old index is only replaced once the new one is complete
+    IN:
+        - json_path: coco json
+        - index_path: where to write the index, defaults to geo_index_path(json_path)
+        - batch_size: annotations inserted per batch
+    OUT: path to the index
+    '''
+    if index_path is None:
+        index_path = geo_index_path(json_path)
+    tmp_path = index_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    with GeoIndex(tmp_path) as index:
+        for batch in batched(iter_json_array(json_path, 'annotations'), batch_size):
+            index.add_annotations(batch)
+    os.replace(tmp_path, index_path)
+
+    return index_path
@@ -0,0 +1,137 @@
+import numpy as np
+
+
+def polygon_area(points):
+    '''
+    IN: (K, 2) array of polygon vertices
+    OUT: float area of the polygon, by the shoelace formula
+    '''
+    if len(points) < 3:
+        return 0.0
+    x = points[:, 0]
+    y = points[:, 1]
+    return float(abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2)
+
+def clip_polygon(points, window):
+    '''
+    PURPOSE: clip a polygon to a rectangle (Sutherland-Hodgman)
+    IN:
+        - points: (K, 2) array of polygon vertices
+        - window: [x1, y1, x2, y2] rectangle
+    OUT: (J, 2) array of the clipped polygon's vertices, empty if it is entirely outside the window
+    '''
+    x1, y1, x2, y2 = window
+    # Each edge as (axis, limit, keep points above the limit?)
+    edges = [(0, x1, True), (0, x2, False), (1, y1, True), (1, y2, False)]
+
+    pts = np.asarray(points, dtype = np.float64).reshape(-1, 2)
+    for axis, limit, above in edges:
+        if len(pts) == 0:
+            break
+        inside = pts[:, axis] >= limit if above else pts[:, axis] <= limit
+        prev = np.roll(pts, 1, axis = 0)
+        prev_inside = np.roll(inside, 1)
+
+        out = []
+        for p, q, p_in, q_in in zip(pts, prev, inside, prev_inside):
+            # Add the crossing point whenever the edge from the previous vertex crosses the limit
+            if p_in != q_in:
+                t = (limit - q[axis]) / (p[axis] - q[axis])
+                out.append(q + t * (p - q))
+            if p_in:
+                out.append(p)
+        pts = np.array(out).reshape(-1, 2)
+
+    return pts
+
+def segmentation_polygons(segmentation):
+    '''
+    IN: an annotation's segmentation, either FAIR1M style [[x, y], ...] or coco style [[x1, y1, x2, y2, ...], ...]
+    OUT: list of (K, 2) vertex arrays, and whether the segmentation was FAIR1M style point pairs
+    '''
+    if not segmentation:
+        return [], False
+    if len(segmentation[0]) == 2 and not isinstance(segmentation[0][0], (list, tuple)):
+        return [np.asarray(segmentation, dtype = np.float64)], True
+    return [np.asarray(s, dtype = np.float64).reshape(-1, 2) for s in segmentation], False
+
+def format_segmentation(polygons, pairs):
+    '''
+    IN:
+        - polygons: list of (K, 2) vertex arrays
+        - pairs: True to output FAIR1M style point pairs, False for coco style flat lists
+    OUT: segmentation in the same style it came in as, see segmentation_polygons
+    '''
+    if pairs:
+        if not polygons:
+            return []
+        return polygons[0].tolist()
+    return [p.reshape(-1).tolist() for p in polygons]
+
+def polygon_areas(polygons):
+    '''
+    IN: (N, K, 2) array of N polygons with K vertices each
+    OUT: (N,) array of polygon areas, by the shoelace formula applied to all of them at once
+    '''
+    x = polygons[:, :, 0]
+    y = polygons[:, :, 1]
+    return np.abs(np.sum(x * np.roll(y, -1, axis = 1) - y * np.roll(x, -1, axis = 1), axis = 1)) / 2
+
+def min_area_rects(polygons):
+    '''
+    PURPOSE: fit the minimum area rotated rectangle around each of a batch of polygons
+    IN: (N, K, 2) array of N polygons with K vertices each
+    OUT: (N, 5) array of [cx, cy, w, h, angle] rectangles - w is the longer side, and angle is the
+         direction of that side in degrees, in [-90, 90), measured clockwise from the x axis in image coordinates
+    '''
+    polygons = np.asarray(polygons, dtype = np.float64)
+    n, k = polygons.shape[:2]
+    if n == 0 or k == 0:
+        return np.zeros((n, 5))
+
+    # The best rectangle has a side along one of the convex hull's edges. Every hull edge joins two of
+    # the vertices, so trying the direction between every pair of vertices is enough
+    i, j = np.triu_indices(k, 1)
+    if len(i) == 0:
+        i = j = np.zeros(1, dtype = np.int64)
+    d = polygons[:, j] - polygons[:, i]
+    theta = np.arctan2(d[:, :, 1], d[:, :, 0])
+    u = np.stack([np.cos(theta), np.sin(theta)], axis = 2)
+    v = np.stack([-u[:, :, 1], u[:, :, 0]], axis = 2)
+
+    # Project every vertex onto every candidate pair of axes, (N, P, K)
+    pu = np.einsum('nkd,npd->npk', polygons, u)
+    pv = np.einsum('nkd,npd->npk', polygons, v)
+    u_min = pu.min(axis = 2)
+    u_max = pu.max(axis = 2)
+    v_min = pv.min(axis = 2)
+    v_max = pv.max(axis = 2)
+    best = np.argmin((u_max - u_min) * (v_max - v_min), axis = 1)
+    rows = np.arange(n)
+
+    w = (u_max - u_min)[rows, best]
+    h = (v_max - v_min)[rows, best]
+    mid_u = ((u_max + u_min) / 2)[rows, best]
+    mid_v = ((v_max + v_min) / 2)[rows, best]
+    center = u[rows, best] * mid_u[:, None] + v[rows, best] * mid_v[:, None]
+    angle = np.degrees(theta[rows, best])
+
+    # Put the longer side first and bring the angle into [-90, 90)
+    swap = h > w
+    w, h = np.where(swap, h, w), np.where(swap, w, h)
+    angle = np.where(swap, angle + 90, angle)
+    angle = (angle + 90) % 180 - 90
+
+    return np.stack([center[:, 0], center[:, 1], w, h, angle], axis = 1)
+
+def rect_corners(rects):
+    '''
+    IN: (N, 5) array of [cx, cy, w, h, angle] rectangles, as from min_area_rects
+    OUT: (N, 4, 2) array of each rectangle's corners
+    '''
+    rects = np.asarray(rects, dtype = np.float64).reshape(-1, 5)
+    t = np.radians(rects[:, 4])
+    u = np.stack([np.cos(t), np.sin(t)], axis = 1) * rects[:, 2:3] / 2
+    v = np.stack([-np.sin(t), np.cos(t)], axis = 1) * rects[:, 3:4] / 2
+    c = rects[:, None, 0:2]
+    return np.stack([c[:, 0] - u - v, c[:, 0] + u - v, c[:, 0] + u + v, c[:, 0] - u + v], axis = 1)
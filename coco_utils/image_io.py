@@ -0,0 +1,94 @@
+import numpy as np
+from PIL import Image
+
+from coco_utils.image_size import read_tiff_tags
+
+# Images like xView's are far bigger than PIL's default decompression bomb limit
+Image.MAX_IMAGE_PIXELS = None
+
+
+def tiff_memmap(im_path):
+    '''
+    PURPOSE: map an uncompressed tiff straight from disk, so only the pixels actually indexed get read
+    IN: path to a tiff
+    OUT: (h, w, c) numpy memmap, or None if the tiff is compressed, tiled, planar or otherwise not a simple
+         contiguous block of 8/16 bit pixels
+    '''
+    with open(im_path, 'rb') as f:
+        try:
+            result = read_tiff_tags(f)
+        except Exception:
+            return None
+    if result is None:
+        return None
+    endian, tags = result
+
+    # Only uncompressed, stripped, interleaved images
+    if tags.get(259, [1])[0] != 1 or 322 in tags or tags.get(284, [1])[0] != 1:
+        return None
+    if 256 not in tags or 257 not in tags or 273 not in tags or 279 not in tags:
+        return None
+
+    w = tags[256][0]
+    h = tags[257][0]
+    c = tags.get(277, [1])[0]
+    bits = set(tags.get(258, [8]))
+    if bits == {8}:
+        dtype = np.dtype('u1')
+    elif bits == {16}:
+        dtype = np.dtype(endian + 'u2')
+    else:
+        return None
+
+    # The strips have to sit back to back for the image to be one block
+    offsets = tags[273]
+    counts = tags[279]
+    for o, n, next_o in zip(offsets[:-1], counts[:-1], offsets[1:]):
+        if o + n != next_o:
+            return None
+    if sum(counts) < w * h * c * dtype.itemsize:
+        return None
+
+    return np.memmap(im_path, dtype = dtype, mode = 'r', offset = offsets[0], shape = (h, w, c))
+
+def open_image_array(im_path):
+    '''
+    IN: path to an image
+    OUT: (h, w, c) array of the image - memory-mapped when the file allows it, otherwise decoded once
+    '''
+    arr = None
+    if im_path.lower().endswith(('.tif', '.tiff')):
+        arr = tiff_memmap(im_path)
+    if arr is None:
+        arr = np.asarray(Image.open(im_path))
+    if arr.ndim == 2:
+        arr = arr[:, :, None]
+    return arr
+
+def read_window(arr, window):
+    '''
+    IN:
+        - arr: (h, w, c) image array from open_image_array
+        - window: [x1, y1, x2, y2] pixel window, may run past the edge of the image
+    OUT: (y2 - y1, x2 - x1, c) array of the window, zero padded where it runs off the image
+    '''
+    x1, y1, x2, y2 = window
+    h, w, c = arr.shape
+    out = np.zeros((y2 - y1, x2 - x1, c), dtype = arr.dtype)
+    sx1 = max(x1, 0)
+    sy1 = max(y1, 0)
+    sx2 = min(x2, w)
+    sy2 = min(y2, h)
+    if sx2 > sx1 and sy2 > sy1:
+        out[sy1 - y1:sy2 - y1, sx1 - x1:sx2 - x1] = arr[sy1:sy2, sx1:sx2]
+    return out
+
+def save_image(arr, im_path):
+    '''
+    IN:
+        - arr: (h, w, c) image array
+        - im_path: where to save it, format taken from the extension
+    '''
+    if arr.shape[2] == 1:
+        arr = arr[:, :, 0]
+    Image.fromarray(np.ascontiguousarray(arr)).save(im_path)
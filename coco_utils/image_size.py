@@ -0,0 +1,147 @@
+import struct
+
+from PIL import Image
+
+# PNG colour type -> number of channels, palette images count as the RGB they expand to
+PNG_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+
+# JPEG start-of-frame markers (C4, C8 and CC are not frames)
+JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def png_size(f):
+    '''
+    IN: open binary file positioned at the start of a png
+    OUT: (w, h, c) read from the IHDR chunk, or None if this is not a png
+    '''
+    head = f.read(26)
+    if len(head) < 26 or head[:8] != b'\x89PNG\r\n\x1a\n' or head[12:16] != b'IHDR':
+        return None
+    w, h = struct.unpack('>II', head[16:24])
+    c = PNG_CHANNELS.get(head[25], 3)
+    return w, h, c
+
+def jpeg_size(f):
+    '''
+    IN: open binary file positioned at the start of a jpeg
+    OUT: (w, h, c) read from the first start-of-frame segment, or None if this is not a jpeg
+    '''
+    if f.read(2) != b'\xff\xd8':
+        return None
+
+    # Walk the segments until we hit a frame header
+    while True:
+        byte = f.read(1)
+        # Skip any fill bytes between segments
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+
+        # Markers without a length field
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            continue
+
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+
+        if marker in JPEG_SOF:
+            frame = f.read(6)
+            if len(frame) < 6:
+                return None
+            _, h, w, c = struct.unpack('>BHHB', frame)
+            return w, h, c
+
+        f.seek(length - 2, 1)
+
+# TIFF field type -> (struct code, size in bytes)
+TIFF_TYPES = {1: ('B', 1), 3: ('H', 2), 4: ('I', 4), 16: ('Q', 8)}
+
+def read_tiff_tags(f):
+    '''
+    IN: open binary file positioned at the start of a (non-Big) tiff
+    OUT: (endian, dict of tag -> list of integer values) for the first IFD, or None if this is not a tiff we can read
+    '''
+    head = f.read(8)
+    if len(head) < 8:
+        return None
+    if head[:2] == b'II':
+        endian = '<'
+    elif head[:2] == b'MM':
+        endian = '>'
+    else:
+        return None
+    magic, ifd_offset = struct.unpack(endian + 'HI', head[2:8])
+    if magic != 42:
+        return None
+
+    f.seek(ifd_offset)
+    n_entries = struct.unpack(endian + 'H', f.read(2))[0]
+    entries = f.read(12 * n_entries)
+
+    tags = {}
+    for e in range(n_entries):
+        tag, typ, count = struct.unpack(endian + 'HHI', entries[12*e:12*e + 8])
+        if typ not in TIFF_TYPES:
+            continue
+        code, size = TIFF_TYPES[typ]
+        value = entries[12*e + 8:12*e + 12]
+        # Values that don't fit in the 4 byte field are stored elsewhere, pointed to by the field
+        if count * size > 4:
+            offset = struct.unpack(endian + 'I', value)[0]
+            here = f.tell()
+            f.seek(offset)
+            value = f.read(count * size)
+            f.seek(here)
+        tags[tag] = list(struct.unpack(endian + code * count, value[:count * size]))
+
+    return endian, tags
+
+def tiff_size(f):
+    '''
+    IN: open binary file positioned at the start of a (non-Big) tiff
+    OUT: (w, h, c) read from the first IFD, or None if this is not a tiff we can read
+    '''
+    result = read_tiff_tags(f)
+    if result is None:
+        return None
+    _, tags = result
+    if 256 not in tags or 257 not in tags:
+        return None
+    w = tags[256][0]
+    h = tags[257][0]
+    c = tags.get(277, [1])[0]
+    return w, h, c
+
+def get_image_size(im_path):
+    '''
+    PURPOSE: read the dimensions of an image from its header, without decoding any pixels
+    IN: path to a png, jpeg or tiff image (other formats fall back to PIL, see pil_size)
+    OUT: (w, h, c) - width, height and number of channels
+    '''
+    with open(im_path, 'rb') as f:
+        for probe in (png_size, jpeg_size, tiff_size):
+            f.seek(0)
+            try:
+                size = probe(f)
+            except struct.error:
+                size = None
+            if size is not None:
+                return size
+
+    # Format we can't parse, let PIL read its header
+    return pil_size(im_path)
+
+def pil_size(im_path):
+    '''
+    PURPOSE: fallback for get_image_size, for formats the header parsers above don't handle
+    IN: path to any image PIL can open
+    OUT: (w, h, c), counting channels the same way as the header parsers (a palette image as 3)
+    '''
+    with Image.open(im_path) as img:
+        w, h = img.size
+        c = 3 if img.mode == 'P' else len(img.getbands())
+    return w, h, c
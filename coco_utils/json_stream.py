@@ -0,0 +1,145 @@
+import json
+
+WHITESPACE = ' \t\n\r'
+DELIMITERS = WHITESPACE + ',:]}'
+
+
+class JSONChunkReader:
+    '''
+    Buffered reader that decodes json values one at a time from a file, reading more
+    of the file only when the value under the cursor is incomplete
+    '''
+
+    def __init__(self, f, chunk_size = 1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        '''
+        PURPOSE: read another chunk of the file, dropping the part of the buffer already consumed
+        OUT: False if the file is exhausted
+        '''
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''
+        OUT: next non-whitespace character, without consuming it ('' at end of file)
+        '''
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        '''
+        PURPOSE: consume the next non-whitespace character, which must be one of chars
+        OUT: the character consumed
+        '''
+        c = self.peek()
+        if c == '' or c not in chars:
+            raise ValueError('Expected one of {} at offset {}, found {!r}'.format(list(chars), self.pos, c))
+        self.pos += 1
+        return c
+
+    def value(self):
+        '''
+        OUT: the next complete json value
+        '''
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number that isn't followed by a delimiter may have been cut short
+                if self.eof or (end < len(self.buf) and self.buf[end] in DELIMITERS):
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_json_array(json_path, key, chunk_size = 1 << 20):
+    '''
+    PURPOSE: iterate over the items of one top level array in a json file without loading the whole file
+    IN:
+        - json_path: path to a json file whose top level is an object
+        - key: key of the array to iterate over, e.g. 'features' or 'annotations'
+        - chunk_size: number of characters read from disk at a time
+    OUT: generator of the items of json[key], one at a time
+    '''
+    with open(json_path, 'r') as f:
+        reader = JSONChunkReader(f, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+
+        while True:
+            k = reader.value()
+            reader.expect(':')
+
+            if k == key:
+                reader.expect('[')
+                if reader.peek() == ']':
+                    return
+                while True:
+                    yield reader.value()
+                    if reader.expect(',]') == ']':
+                        return
+            else:
+                # Some other section, decode it and move on
+                reader.value()
+
+            if reader.expect(',}') == '}':
+                return
+
+def read_json_sections(json_path, skip_keys = ('images', 'annotations'), chunk_size = 1 << 20):
+    '''
+    PURPOSE: read every top level section of a json file except some big arrays, without loading those arrays
+    IN:
+        - json_path: path to a json file whose top level is an object
+        - skip_keys: keys of the arrays to step over, item by item
+        - chunk_size: number of characters read from disk at a time
+    OUT: dict of every other top level section
+    '''
+    sections = {}
+    with open(json_path, 'r') as f:
+        reader = JSONChunkReader(f, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return sections
+
+        while True:
+            k = reader.value()
+            reader.expect(':')
+
+            if k in skip_keys and reader.peek() == '[':
+                # Decode and drop one item at a time
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.expect(']')
+                else:
+                    while True:
+                        reader.value()
+                        if reader.expect(',]') == ']':
+                            break
+            else:
+                sections[k] = reader.value()
+
+            if reader.expect(',}') == '}':
+                return sections
@@ -0,0 +1,168 @@
+import argparse
+import csv
+import json
+import os
+
+from coco_utils.columnar import OUTPUT_FORMATS, columnar_path, open_coco_writer
+from coco_utils.json_stream import iter_json_array, read_json_sections
+from coco_utils.registry import Registry
+
+
+def load_category_mapping(mapping_path):
+    '''
+    IN: path to a category mapping table, either
+        - a .csv with a header row and columns dataset, category, target, e.g.
+              dataset,category,target
+              dota,small-vehicle,Small Car
+              fair1m,Small Car,Small Car
+              xview,Small Car,Small Car
+              xview,Building,
+          where a blank target drops the category and a dataset of * applies to every dataset, or
+        - a .json of the same as {dataset: {category: target or null}}
+    OUT: dict of dataset -> dict of source category name -> target name (None to drop)
+    '''
+    if mapping_path.lower().endswith('.json'):
+        with open(mapping_path, 'r') as f:
+            return json.load(f)
+
+    mapping = {}
+    with open(mapping_path, 'r', newline = '') as f:
+        for row in csv.DictReader(f):
+            target = (row.get('target') or '').strip()
+            mapping.setdefault(row['dataset'].strip(), {})[row['category'].strip()] = target or None
+    return mapping
+
+def map_category(mapping, dataset, name, unmapped = 'keep'):
+    '''
+    IN:
+        - mapping: from load_category_mapping, or None
+        - dataset: name of the dataset the category is from
+        - name: source category name
+        - unmapped: 'keep' to keep categories the table doesn't mention under their own name, 'drop' to drop them
+    OUT: target category name, or None if the category is dropped
+    '''
+    for key in (dataset, '*'):
+        table = (mapping or {}).get(key, {})
+        if name in table:
+            return table[name]
+    return name if unmapped == 'keep' else None
+
+def register(registry, entry):
+    '''
+    PURPOSE: add a coco category or license to a registry by name, keeping its other fields if it's new
+    OUT: the entry's id in the registry
+    '''
+    return registry.get_id(entry['name'], fields = entry)
+
+def merge_coco(inputs, out_json, mapping = None, unmapped = 'keep', image_prefixes = None, output_format = 'json'):
+    '''
+    PURPOSE: merge several coco jsons (from dota_to_coco, fair1m_json, make_json...) into one, mapping their
+             categories onto a shared taxonomy and re-numbering images, annotations, categories and licenses
+             so nothing collides. Images and annotations are streamed, one at a time, so only the small
+             sections and an old -> new image id map per input are ever held in memory
+    IN:
+        - inputs: list of (dataset name, coco json path), the dataset names are what mapping refers to
+        - out_json: path for the merged coco json
+        - mapping: dict from load_category_mapping, or a path to a mapping table, None to merge categories by name
+        - unmapped: 'keep' or 'drop' categories the mapping doesn't mention
+        - image_prefixes: dict of dataset name -> prefix added to its images' file_names (e.g. their folder),
+                          so file names from different datasets stay distinct
+        - output_format: 'json', 'columnar' or 'both'
+    OUT: path to the merged coco json (or columnar store, if only that was written)
+    '''
+    if isinstance(mapping, str):
+        mapping = load_category_mapping(mapping)
+    if unmapped not in ('keep', 'drop'):
+        raise ValueError("unmapped must be 'keep' or 'drop'")
+    image_prefixes = image_prefixes or {}
+
+    # First pass over just the small sections, to build the shared categories and licenses
+    categories = Registry(start_id = 1, defaults = {"supercategory": "None"})
+    licenses = Registry(start_id = 1)
+    cat_maps = []
+    license_maps = []
+    infos = []
+    for name, json_path in inputs:
+        sections = read_json_sections(json_path)
+        infos.append({"dataset": name, "info": sections.get('info')})
+
+        cat_map = {}
+        for c in sections.get('categories', []):
+            target = map_category(mapping, name, c['name'], unmapped)
+            if target is not None:
+                cat_map[c['id']] = register(categories, dict(c, name = target))
+        cat_maps.append(cat_map)
+
+        # FAIR1M has a single 'license' rather than a 'licenses' list
+        input_licenses = sections.get('licenses') or ([sections['license']] if sections.get('license') else [])
+        license_maps.append({l['id']: register(licenses, l) for l in input_licenses})
+
+    info = {"description": 'Merge of ' + ', '.join(name for name, _ in inputs), "datasets": infos}
+
+    image_id = 0
+    ann_id = 0
+    im_maps = []
+    with open_coco_writer(out_json, output_format, info = info, licenses = licenses.to_list(),
+                          categories = categories.to_list()) as writer:
+        writer.start_array('images')
+        for (name, json_path), license_map in zip(inputs, license_maps):
+            im_map = {}
+            for im in iter_json_array(json_path, 'images'):
+                im_map[im['id']] = image_id
+                im['source_id'] = im['id']
+                im['id'] = image_id
+                im['dataset'] = name
+                im['file_name'] = image_prefixes.get(name, '') + im['file_name']
+                # dota_to_coco leaves license False on images without one, which would otherwise match license 0
+                lic = im.get('license')
+                if not isinstance(lic, bool) and lic in license_map:
+                    im['license'] = license_map[lic]
+                writer.add_image(im)
+                image_id += 1
+            im_maps.append(im_map)
+            print('{}: {} images'.format(name, len(im_map)))
+
+        writer.start_array('annotations')
+        for (name, json_path), cat_map, im_map in zip(inputs, cat_maps, im_maps):
+            kept = 0
+            dropped = 0
+            for a in iter_json_array(json_path, 'annotations'):
+                if a['category_id'] not in cat_map or a['image_id'] not in im_map:
+                    dropped += 1
+                    continue
+                a['id'] = ann_id
+                a['image_id'] = im_map[a['image_id']]
+                a['category_id'] = cat_map[a['category_id']]
+                writer.add_annotation(a)
+                ann_id += 1
+                kept += 1
+            print('{}: {} annotations, {} dropped'.format(name, kept, dropped))
+
+    print('Merged {} images and {} annotations into {} categories'.format(image_id, ann_id, len(categories)))
+
+    if output_format == 'columnar':
+        return columnar_path(out_json)
+    return out_json
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = 'Merge coco jsons onto a shared set of categories')
+    parser.add_argument('out_json', help = 'merged coco json to write')
+    parser.add_argument('inputs', nargs = '+', help = 'inputs as name=path, e.g. dota=DOTA/COCO.json')
+    parser.add_argument('--mapping', help = 'category mapping table, .csv or .json (see load_category_mapping)')
+    parser.add_argument('--drop-unmapped', action = 'store_true', help = "drop categories the mapping doesn't mention")
+    parser.add_argument('--prefix', action = 'append', default = [],
+                        help = 'name=prefix to add to a dataset\'s image file names, e.g. dota=DOTA/images/')
+    parser.add_argument('--output-format', choices = OUTPUT_FORMATS, default = 'json')
+    args = parser.parse_args(args)
+
+    inputs = [tuple(i.split('=', 1)) for i in args.inputs]
+    for name, path in inputs:
+        if not os.path.exists(path):
+            parser.error('{} does not exist'.format(path))
+    prefixes = dict(p.split('=', 1) for p in args.prefix)
+
+    return merge_coco(inputs, args.out_json, args.mapping, 'drop' if args.drop_unmapped else 'keep', prefixes,
+                      args.output_format)
+
+if __name__ == '__main__':
+    main()
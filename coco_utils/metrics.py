@@ -0,0 +1,130 @@
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak memory just isn't reported there
+    resource = None
+
+
+class Metrics:
+    '''
+    Collects how long each stage of a conversion takes and how many files and annotations it handles
+
+    Stages can be entered more than once (e.g. once per batch), their times add up. Stages can be nested,
+    time spent in an inner stage is only counted against the inner one. Converters record into
+    the module's shared instance through stage, timed_iter and add_count below, so they don't have to pass a
+    metrics object around.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+        # [name, start time, time spent in nested stages] of each stage currently running
+        self.running = []
+
+    def enter(self, name):
+        self.running.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        name, start, nested = self.running.pop()
+        elapsed = time.perf_counter() - start
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed - nested
+        if self.running:
+            self.running[-1][2] += elapsed
+
+    def count(self, name, n = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def summary(self):
+        '''
+        OUT: dict of the stage times, counts, throughputs, total time and peak memory. The peak of this
+             process and of the largest finished worker are kept apart, they needn't have happened together
+        '''
+        total = time.perf_counter() - self.start
+        result = {'total_seconds': total,
+                  'stages': dict(self.stages),
+                  'counts': dict(self.counts),
+                  'per_second': {k: v / total if total > 0 else None for k, v in self.counts.items()},
+                  'peak_rss_mb': peak_rss_mb(),
+                  'peak_worker_rss_mb': peak_rss_mb(children = True)}
+        return result
+
+    def report(self):
+        '''
+        PURPOSE: print a table of the stage timings and throughput
+        '''
+        s = self.summary()
+        print('{:<20}{:>10}{:>8}'.format('stage', 'seconds', '%'))
+        for name, seconds in s['stages'].items():
+            print('{:<20}{:>10.2f}{:>8.1f}'.format(name, seconds, 100 * seconds / s['total_seconds'] if s['total_seconds'] else 0))
+        # Whatever isn't in a stage: imports, starting worker pools...
+        other = s['total_seconds'] - sum(s['stages'].values())
+        print('{:<20}{:>10.2f}{:>8.1f}'.format('other', other, 100 * other / s['total_seconds'] if s['total_seconds'] else 0))
+        print('{:<20}{:>10.2f}'.format('total', s['total_seconds']))
+        for name, n in s['counts'].items():
+            print('{} {} ({:.1f}/sec)'.format(n, name, s['per_second'][name] or 0))
+        if s['peak_rss_mb'] is not None:
+            print('Peak RSS {:.1f} MB, largest worker {:.1f} MB'.format(s['peak_rss_mb'], s['peak_worker_rss_mb']))
+
+    def to_json(self, json_path):
+        with open(json_path, 'w') as f:
+            json.dump(self.summary(), f, indent = 2)
+
+
+def peak_rss_mb(children = False):
+    '''
+    IN: children: report the largest finished worker process instead of this one
+    OUT: peak resident memory in MB, None if unknown
+    '''
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+# Shared instance the converters record into
+metrics = Metrics()
+
+@contextmanager
+def stage(name):
+    '''
+    PURPOSE: time a block of code as (part of) a named stage
+    '''
+    metrics.enter(name)
+    try:
+        yield
+    finally:
+        metrics.exit()
+
+def timed_iter(name, items):
+    '''
+    PURPOSE: time how long it takes to produce each item of an iterable as a named stage, for stages
+             that are generators consumed by a later stage (e.g. parsing feeding serialization)
+    IN:
+        - name: stage name
+        - items: iterable
+    OUT: generator of the same items
+    '''
+    it = iter(items)
+    while True:
+        metrics.enter(name)
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        finally:
+            metrics.exit()
+        yield item
+
+def add_count(name, n = 1):
+    '''
+    PURPOSE: add to a named count (files, annotations...) used for the throughput figures
+    '''
+    metrics.count(name, n)
@@ -0,0 +1,77 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def ordered_map(func, items, workers = 1, threads = False):
+    '''
+    PURPOSE: apply func to every item, fanned out across a pool, yielding results in the order of items
+    IN:
+        - func: function of one argument (must be defined at module level when using processes)
+        - items: list of inputs
+        - workers: number of pool workers, 1 or less runs serially in this process
+        - threads: use a thread pool (good for i/o bound work) instead of a process pool
+    OUT: generator of func(item) for each item, in input order
+    '''
+    if workers is None or workers <= 1 or len(items) <= 1:
+        for i in items:
+            yield func(i)
+        return
+
+    if threads:
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            for result in executor.map(func, items):
+                yield result
+    else:
+        # Hand out work in chunks so that lots of small files don't drown in ipc overhead
+        chunksize = max(1, len(items) // (workers * 4))
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            for result in executor.map(func, items, chunksize = chunksize):
+                yield result
+
+def budgeted_map(func, items, costs, budget, workers = 1):
+    '''
+    PURPOSE: like ordered_map over a process pool, but only keeps items in flight while their total cost
+             (e.g. decoded image bytes) fits in budget
+    IN:
+        - func: function of one argument, defined at module level
+        - items: list of inputs
+        - costs: cost of each item, same length as items
+        - budget: maximum total cost in flight at once (a single item over budget still runs, on its own)
+        - workers: number of pool workers, 1 or less runs serially in this process
+    OUT: generator of func(item) for each item, in input order
+    '''
+    if workers is None or workers <= 1 or len(items) <= 1:
+        for i in items:
+            yield func(i)
+        return
+
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        in_flight = deque()
+        spent = 0
+        for item, cost in zip(items, costs):
+            # Wait for the oldest items to finish until this one fits
+            while in_flight and spent + cost > budget:
+                future, done_cost = in_flight.popleft()
+                spent -= done_cost
+                yield future.result()
+            in_flight.append((executor.submit(func, item), cost))
+            spent += cost
+        while in_flight:
+            future, _ = in_flight.popleft()
+            yield future.result()
+
+def batched(items, n):
+    '''
+    IN:
+        - items: any iterable, e.g. a generator of annotations
+        - n: batch size
+    OUT: generator of lists of up to n consecutive items
+    '''
+    batch = []
+    for i in items:
+        batch.append(i)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
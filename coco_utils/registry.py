@@ -0,0 +1,68 @@
+class Registry:
+    '''
+    Name -> id lookup for coco style lists like 'categories' and 'licenses'
+
+    Ids are handed out in first-seen order starting from start_id, and the
+    entries can be exported back out as a coco list at any time
+    '''
+
+    def __init__(self, start_id = 1, defaults = None):
+        '''
+        IN:
+            - start_id: id given to the first new entry
+            - defaults: extra fields to put on every new entry, e.g. {"supercategory": "None"}
+        '''
+        self.next_id = start_id
+        self.defaults = defaults or {}
+        self.entries = []
+        self.ids = {}
+
+    @classmethod
+    def from_list(cls, coco_list, defaults = None):
+        '''
+        IN: an existing coco style list of dicts with 'id' and 'name' keys
+        OUT: registry holding those entries, new ones get ids after the largest existing id
+        '''
+        start_id = max([e['id'] for e in coco_list], default = 0) + 1
+        registry = cls(start_id, defaults)
+        for e in coco_list:
+            registry.entries.append(e)
+            registry.ids[e['name']] = e['id']
+        return registry
+
+    def lookup(self, name):
+        '''
+        OUT: id for name, or None if it has not been registered
+        '''
+        return self.ids.get(name)
+
+    def get_id(self, name, fields = None):
+        '''
+        IN:
+            - name: entry name
+            - fields: extra fields for the entry if it's new, on top of the defaults (e.g. a category's
+                      supercategory when merging datasets), ignored if name is already registered
+        OUT: id for name, registering it as a new entry if necessary
+        '''
+        entry_id = self.ids.get(name)
+        if entry_id is None:
+            entry_id = self.next_id
+            entry = {"id": entry_id, "name": name}
+            entry.update(self.defaults)
+            entry.update({k: v for k, v in (fields or {}).items() if k not in ('id', 'name')})
+            self.entries.append(entry)
+            self.ids[name] = entry_id
+            self.next_id += 1
+        return entry_id
+
+    def to_list(self):
+        '''
+        OUT: coco style list of every entry, in id assignment order
+        '''
+        return [e.copy() for e in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.ids
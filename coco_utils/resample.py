@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from coco_utils.chipping import check_chip_size, chip_windows, window_annotations, write_chip_coco
+from coco_utils.dataset import CocoDataset
+from coco_utils.file_cache import FileCache
+from coco_utils.geometry import format_segmentation, segmentation_polygons
+from coco_utils.image_io import open_image_array, read_window
+from coco_utils.pool import ordered_map
+
+
+def scale_annotations(annotations, scale):
+    '''
+    IN:
+        - annotations: coco annotations on one image
+        - scale: factor to resize the image by
+    OUT: copies of the annotations with boxes, polygons, rotated boxes and areas scaled to match
+    '''
+    scaled = []
+    for a in annotations:
+        new_a = a.copy()
+        new_a['bbox'] = [float(v) * scale for v in a['bbox']]
+        if a.get('area') is not None:
+            new_a['area'] = float(a['area']) * scale * scale
+        if a.get('segmentation'):
+            polygons, pairs = segmentation_polygons(a['segmentation'])
+            new_a['segmentation'] = format_segmentation([p * scale for p in polygons], pairs)
+        if a.get('rbox') is not None:
+            new_a['rbox'] = [float(v) * scale for v in a['rbox'][:4]] + [a['rbox'][4]]
+        scaled.append(new_a)
+    return scaled
+
+def resample_one_image(task):
+    '''
+    PURPOSE: resample one image to a new gsd and write it out as tiles, run in a worker process
+    IN: task tuple of (image, annotations, im_folder, tile_folder, scale, tile_size, overlap, min_visibility,
+        keep_empty, ext, tag)
+    OUT: list of (tile file name, window, tile annotations, extra tile image fields) for every tile written
+    '''
+    image, annotations, im_folder, tile_folder, scale, tile_size, overlap, min_visibility, keep_empty, ext, tag = task
+
+    # Work out the tiles in the resampled image's coordinates, without ever building that image
+    out_w = max(int(round(image['width'] * scale)), 1)
+    out_h = max(int(round(image['height'] * scale)), 1)
+    windows = chip_windows(out_w, out_h, tile_size, overlap)
+    tile_anns = window_annotations(scale_annotations(annotations, scale), windows, min_visibility)
+
+    arr = None
+    stem = os.path.splitext(image['file_name'])[0]
+    results = []
+    for window, anns in zip(windows.tolist(), tile_anns):
+        if not anns and not keep_empty:
+            continue
+        if arr is None:
+            arr = open_image_array(im_folder + image['file_name'])
+
+        # Read just the source pixels under this tile, then resize them to the tile
+        sx1, sy1, sx2, sy2 = [v / scale for v in window]
+        region = [int(np.floor(sx1)), int(np.floor(sy1)), int(np.ceil(sx2)), int(np.ceil(sy2))]
+        src = read_window(arr, region)
+        if src.shape[2] == 1:
+            src = src[:, :, 0]
+        box = (sx1 - region[0], sy1 - region[1], sx2 - region[0], sy2 - region[1])
+        tile = Image.fromarray(np.ascontiguousarray(src)).resize((tile_size, tile_size), Image.BILINEAR, box = box)
+
+        tile_name = '{}_{}_{}_{}{}'.format(stem, tag, window[0], window[1], ext)
+        tile.save(tile_folder + tile_name)
+        results.append((tile_name, window, anns, {"scale": scale}))
+
+    return results
+
+def annotations_key(annotations, params):
+    '''
+    OUT: hash identifying an image's annotations and the resampling parameters, for the cache
+    '''
+    content = json.dumps([annotations, params], sort_keys = True, default = str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def resample_coco(json_path, im_folder, tile_folder, out_json, target_gsd, tile_size = 512, overlap = 64,
+                  default_gsd = None, min_visibility = 0.5, keep_empty = False, workers = 1, ext = '.png',
+                  cache = True):
+    '''
+    PURPOSE: resample every image of a coco dataset to a common ground sample distance, writing the
+             result straight out as tiles with a new coco json (boxes and polygons rescaled and clipped)
+    IN:
+        - json_path: coco json, images should carry a 'gsd' (DOTA, FAIR1M after gsd estimation)
+        - im_folder: folder of the images
+        - tile_folder: folder to write the tiles to
+        - out_json: path for the tiles' coco json
+        - target_gsd: gsd, in meters per pixel, to resample everything to
+        - tile_size: side length of each square tile in the resampled image, in pixels
+        - overlap: number of pixels neighbouring tiles share
+        - default_gsd: gsd to assume for images without one (e.g. 0.3 for xView), None to skip them
+        - min_visibility: fraction of a box that must be on a tile for it to be kept there
+        - keep_empty: also write tiles with no annotations on them
+        - workers: number of processes to resample images with
+        - ext: tile image format
+        - cache: reuse the tiles from earlier runs for (image, target gsd) pairs that haven't changed
+    OUT: path to the tiles' coco json
+    '''
+    # Fail before any work rather than in the first worker
+    check_chip_size(tile_size, overlap)
+    if not target_gsd > 0:
+        raise ValueError('target_gsd must be positive, got {}'.format(target_gsd))
+
+    start = time.perf_counter()
+    os.makedirs(tile_folder, exist_ok = True)
+    gt = CocoDataset(json_path)
+
+    tag = 'gsd{:g}'.format(target_gsd)
+    params = [target_gsd, tile_size, overlap, min_visibility, keep_empty, ext]
+    images = []
+    gsds = []
+    tasks = []
+    skipped = 0
+    for i, anns in gt.iter_images():
+        gsd = i.get('gsd') or default_gsd
+        if not gsd:
+            skipped += 1
+            continue
+        images.append(i)
+        gsds.append(gsd)
+        tasks.append((i, anns, im_folder, tile_folder, gsd / target_gsd, tile_size,
+                      overlap, min_visibility, keep_empty, ext, tag))
+    if skipped:
+        print('Skipped {} images with no gsd'.format(skipped))
+
+    other_sections = dict(gt.sections, categories = gt.categories)
+    del gt
+
+    # Tiles already made for this target gsd are reused as long as the image, its annotations, its source
+    # gsd and the tiling haven't changed, keyed in the cache by (image, target gsd)
+    cache_func = 'resample_coco:' + tag
+    file_cache = FileCache(os.path.join(tile_folder, '.resample_cache')) if cache else None
+    results = [None] * len(tasks)
+    keys = [annotations_key(t[1], params + [gsd]) for t, gsd in zip(tasks, gsds)]
+    if file_cache is not None:
+        paths = [im_folder + i['file_name'] for i in images]
+        fresh = file_cache.fresh_paths(cache_func, paths)
+        for k, p in enumerate(paths):
+            if p in fresh:
+                stored = file_cache.get(cache_func, p)
+                if stored['key'] == keys[k] and all(os.path.exists(tile_folder + r[0]) for r in stored['tiles']):
+                    results[k] = stored['tiles']
+        print('{} of {} images already resampled'.format(sum(r is not None for r in results), len(tasks)))
+
+    todo = [k for k, r in enumerate(results) if r is None]
+    for k, tiles in zip(todo, ordered_map(resample_one_image, [tasks[k] for k in todo], workers)):
+        results[k] = tiles
+        if file_cache is not None:
+            file_cache.put(cache_func, im_folder + images[k]['file_name'], {'key': keys[k], 'tiles': tiles})
+    if file_cache is not None:
+        file_cache.close()
+
+    # Tiles are at the target gsd, whatever their source was
+    other_sections['info'] = dict(other_sections.get('info') or {}, gsd = target_gsd)
+    for image, gsd in zip(images, gsds):
+        image['source_gsd'] = gsd
+        image['gsd'] = target_gsd
+    n_tiles, n_anns = write_chip_coco(out_json, other_sections, images, results, tile_size)
+
+    elapsed = time.perf_counter() - start
+    print('Wrote {} tiles with {} annotations at {:g} m/px from {} images in {:.1f}s ({:.1f} tiles/sec)'.format(
+        n_tiles, n_anns, target_gsd, len(tasks), elapsed, n_tiles / elapsed if elapsed > 0 else 0))
+
+    return out_json
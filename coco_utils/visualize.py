@@ -0,0 +1,186 @@
+import colorsys
+import os
+import time
+
+import numpy as np
+from matplotlib.collections import PolyCollection
+from PIL import Image, ImageDraw
+
+from coco_utils.arrays import annotation_arrays
+from coco_utils.dataset import CocoDataset
+from coco_utils.geometry import segmentation_polygons
+from coco_utils.image_io import open_image_array
+from coco_utils.pool import ordered_map
+
+
+def category_colors(categories):
+    '''
+    IN: coco 'categories' section
+    OUT: dict of category id -> (r, g, b) colour, spread around the hue circle so neighbouring ids differ
+    '''
+    colors = {}
+    for k, c in enumerate(sorted(categories, key = lambda c: c['id'])):
+        r, g, b = colorsys.hsv_to_rgb((k * 0.618033988749895) % 1, 0.9, 1.0)
+        colors[c['id']] = (int(r * 255), int(g * 255), int(b * 255))
+    return colors
+
+def annotation_outlines(annotations):
+    '''
+    IN: coco annotations on one image
+    OUT: list of (K, 2) outline vertex arrays and a matching list of category ids - an annotation's polygons
+         when it has a segmentation, otherwise its box
+    '''
+    arrays = annotation_arrays(annotations)
+
+    # Every box's corners at once, (N, 4, 2)
+    x, y, w, h = arrays['bboxes'].T
+    corners = np.stack([np.stack([x, y], 1), np.stack([x + w, y], 1),
+                        np.stack([x + w, y + h], 1), np.stack([x, y + h], 1)], 1)
+
+    outlines = []
+    cat_ids = []
+    for a, box, cat_id in zip(annotations, corners, arrays['category_ids'].tolist()):
+        polygons, _ = segmentation_polygons(a.get('segmentation'))
+        polygons = [p for p in polygons if len(p) >= 3] or [box]
+        outlines.extend(polygons)
+        cat_ids.extend([cat_id] * len(polygons))
+    return outlines, cat_ids
+
+def overview_array(arr, max_size = None):
+    '''
+    PURPOSE: shrink an image for display, striding through it first so a memory-mapped tiff only has
+             the rows and columns that are kept read from disk
+    IN:
+        - arr: (h, w, c) image array from open_image_array
+        - max_size: longest side of the overview in pixels, None to keep full resolution
+    OUT: (h', w', 3) uint8 array, scaled to 8 bit if the image isn't already
+    '''
+    h, w = arr.shape[:2]
+    if max_size is not None and max(h, w) > max_size:
+        step = max(int(max(h, w) // max_size), 1)
+        arr = arr[::step, ::step]
+
+    arr = np.asarray(arr)
+    if arr.dtype != np.uint8:
+        top = float(arr.max()) if arr.size else 0.0
+        arr = (arr.astype(np.float32) * (255.0 / top if top > 0 else 1.0)).astype(np.uint8)
+    if arr.shape[2] == 1:
+        arr = np.repeat(arr, 3, axis = 2)
+    elif arr.shape[2] > 3:
+        arr = arr[:, :, :3]
+
+    im = Image.fromarray(np.ascontiguousarray(arr))
+    if max_size is not None and max(im.size) > max_size:
+        im.thumbnail((max_size, max_size), Image.BILINEAR)
+    return np.asarray(im)
+
+def draw_annotations(im, outlines, cat_ids, colors, scale = (1.0, 1.0), line_width = 2):
+    '''
+    PURPOSE: rasterize every outline straight onto an image
+    IN:
+        - im: PIL image to draw on
+        - outlines, cat_ids: from annotation_outlines
+        - colors: from category_colors
+        - scale: (x, y) factors from annotation coordinates to im's pixels
+        - line_width: outline width in pixels
+    OUT: im, drawn on
+    '''
+    draw = ImageDraw.Draw(im)
+    if not outlines:
+        return im
+
+    # Scale all the vertices in one go, then split them back into outlines
+    lengths = [len(o) for o in outlines]
+    points = np.concatenate(outlines) * np.asarray(scale, dtype = np.float64)
+    for pts, cat_id in zip(np.split(points, np.cumsum(lengths)[:-1]), cat_ids):
+        pts = pts.tolist()
+        draw.line(pts + pts[:1], fill = colors.get(cat_id, (255, 0, 0)), width = line_width, joint = 'curve')
+    return im
+
+def render_image(image, annotations, im_folder, colors, max_size = 2048, line_width = 2):
+    '''
+    IN:
+        - image: coco image
+        - annotations: coco annotations on the image
+        - im_folder: folder of the image
+        - colors: from category_colors
+        - max_size: longest side of the render in pixels, None for full resolution
+        - line_width: outline width in pixels
+    OUT: PIL image of the (downscaled) image with every annotation outlined
+    '''
+    arr = open_image_array(im_folder + image['file_name'])
+    h, w = arr.shape[:2]
+    im = Image.fromarray(overview_array(arr, max_size))
+    outlines, cat_ids = annotation_outlines(annotations)
+    return draw_annotations(im, outlines, cat_ids, colors, (im.width / w, im.height / h), line_width)
+
+def show_annotations(ax, image, annotations, im_folder, categories, max_size = 2048, line_width = 1):
+    '''
+    PURPOSE: plot an image with its annotations on a matplotlib axis, all the outlines as one collection
+    IN:
+        - ax: matplotlib axis
+        - image: coco image
+        - annotations: coco annotations on the image
+        - im_folder: folder of the image
+        - categories: coco 'categories' section
+        - max_size: longest side to show the image at, None for full resolution
+        - line_width: outline width
+    '''
+    arr = open_image_array(im_folder + image['file_name'])
+    h, w = arr.shape[:2]
+    ax.imshow(overview_array(arr, max_size), extent = (0, w, h, 0))
+
+    # One PolyCollection rather than a patch per object, so thousands of xView boxes draw quickly
+    colors = category_colors(categories)
+    outlines, cat_ids = annotation_outlines(annotations)
+    edge_colors = [tuple(v / 255 for v in colors.get(c, (255, 0, 0))) for c in cat_ids]
+    ax.add_collection(PolyCollection(outlines, closed = True, facecolors = 'none',
+                                     edgecolors = edge_colors, linewidths = line_width))
+    ax.set_xlim(0, w)
+    ax.set_ylim(h, 0)
+    ax.set_axis_off()
+
+def render_one_image(task):
+    '''
+    PURPOSE: render one image's annotations and save it, run in a worker process
+    IN: task tuple of (image, annotations, im_folder, out_folder, colors, max_size, line_width, ext)
+    OUT: path of the render
+    '''
+    image, annotations, im_folder, out_folder, colors, max_size, line_width, ext = task
+    out_path = os.path.join(out_folder, os.path.splitext(image['file_name'])[0] + ext)
+    render_image(image, annotations, im_folder, colors, max_size, line_width).save(out_path)
+    return out_path
+
+def render_coco(json_path, im_folder, out_folder, max_size = 2048, line_width = 2, image_ids = None,
+                workers = 1, ext = '.jpg'):
+    '''
+    PURPOSE: render every image of a coco dataset (from dota_to_coco, fair1m_json or make_json) with its
+             annotations outlined, for checking a whole dataset by eye
+    IN:
+        - json_path: coco json
+        - im_folder: folder of the images in the coco json
+        - out_folder: folder to write the renders to
+        - max_size: longest side of each render in pixels, None for full resolution
+        - line_width: outline width in pixels
+        - image_ids: only render these images, None for all of them
+        - workers: number of processes to render images with
+        - ext: render image format
+    OUT: list of paths of the renders
+    '''
+    start = time.perf_counter()
+    os.makedirs(out_folder, exist_ok = True)
+    gt = CocoDataset(json_path)
+    colors = category_colors(gt.categories)
+    if image_ids is not None:
+        gt = gt.subset(image_ids = image_ids)
+
+    tasks = [(i, anns, im_folder, out_folder, colors, max_size, line_width, ext) for i, anns in gt.iter_images()]
+    del gt
+
+    paths = list(ordered_map(render_one_image, tasks, workers))
+
+    elapsed = time.perf_counter() - start
+    print('Rendered {} images in {:.1f}s ({:.1f} images/sec)'.format(
+        len(paths), elapsed, len(paths) / elapsed if elapsed > 0 else 0))
+
+    return paths
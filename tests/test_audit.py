@@ -0,0 +1,68 @@
+import json
+
+import numpy as np
+
+from coco_utils.audit import audit_coco, box_ious, find_duplicates
+
+
+def write_coco(path, annotations):
+    coco = {'images': [{'id': 1, 'file_name': 'a.png', 'width': 100, 'height': 100}],
+            'categories': [{'id': 1, 'name': 'car'}, {'id': 2, 'name': 'truck'}],
+            'annotations': [dict({'id': k, 'image_id': 1, 'category_id': 1, 'area': 100.0}, **a)
+                            for k, a in enumerate(annotations)]}
+    with open(path, 'w') as f:
+        json.dump(coco, f)
+    return path
+
+def test_audit_flags_and_cleans(tmp_path):
+    json_path = write_coco(str(tmp_path / 'in.json'), [
+        {'bbox': [10, 10, 10, 10]},
+        {'bbox': [10, 10, 0, 5]},
+        {'bbox': [150, 10, 10, 10]},
+        {'bbox': [90, 90, 20, 20], 'area': 400.0},
+        {'bbox': [-10, 0, 20, 10], 'area': 200.0, 'segmentation': [[-10, 0, 10, 0, 10, 10, -10, 10]]},
+        {'bbox': [50, 50, 10, 10], 'area': None},
+        {'bbox': [10.5, 10, 10, 10]},
+        {'bbox': [10, 10, 10, 10], 'category_id': 2},
+        {'bbox': [10, 10, 10, 10], 'category_id': 9},
+    ])
+    clean_path = str(tmp_path / 'clean.json')
+    report = audit_coco(json_path, clean_path)
+
+    assert report['ids']['degenerate'] == [1]
+    assert report['ids']['outside_image'] == [2]
+    assert report['ids']['out_of_bounds'] == [3, 4]
+    assert report['ids']['missing_area'] == [5]
+    assert report['ids']['unknown_category'] == [8]
+    assert report['duplicate_of'] == {6: 0}
+
+    with open(clean_path, 'r') as f:
+        cleaned = {a['id']: a for a in json.load(f)['annotations']}
+    assert sorted(cleaned) == [0, 3, 4, 5, 7]
+    assert cleaned[3]['bbox'] == [90, 90, 10, 10]
+    assert cleaned[4]['bbox'] == [0, 0, 10, 10]
+    assert cleaned[4]['segmentation'][0] == [0, 0, 10, 0, 10, 10, 0, 10]
+    assert cleaned[5]['area'] == 100
+    # Clipped annotations get an area that agrees with their new box and polygons
+    for a in cleaned.values():
+        assert a['area'] == a['bbox'][2] * a['bbox'][3]
+
+def test_duplicates_match_brute_force():
+    rng = np.random.default_rng(0)
+    n = 1500
+    bboxes = np.c_[rng.uniform(0, 300, (n, 2)), rng.uniform(1, 30, (n, 2))]
+    groups = rng.integers(0, 3, n)
+    bboxes[:50] = bboxes[50:100] + 0.1
+    groups[:50] = groups[50:100]
+
+    for threshold in (0.3, 0.5, 0.8):
+        i, j = np.triu_indices(n, 1)
+        same = groups[i] == groups[j]
+        i, j = i[same], j[same]
+        match = box_ious(bboxes[i], bboxes[j]) >= threshold
+        expected = np.full(n, -1)
+        pairs = np.stack([i[match], j[match]], axis = 1)
+        for a, b in pairs[np.lexsort((pairs[:, 0], pairs[:, 1]))]:
+            if expected[a] < 0 and expected[b] < 0:
+                expected[b] = a
+        assert (find_duplicates(bboxes, groups, threshold) == expected).all()
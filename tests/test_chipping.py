@@ -0,0 +1,102 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from coco_utils.chipping import chip_coco, chip_windows, window_annotations
+
+
+def test_windows_sit_flush_with_the_edges():
+    windows = chip_windows(1000, 600, 512, 64)
+    assert sorted(set(windows[:, 0].tolist())) == [0, 448, 488]
+    assert sorted(set(windows[:, 1].tolist())) == [0, 88]
+    assert len(windows) == 6
+    assert (windows[:, 2] - windows[:, 0] == 512).all() and (windows[:, 3] - windows[:, 1] == 512).all()
+    assert windows[:, 2].max() == 1000 and windows[:, 3].max() == 600
+
+@pytest.mark.parametrize('chip_size, overlap', [(512, 512), (512, 600), (512, -1), (0, 0)])
+def test_bad_chip_size(chip_size, overlap):
+    with pytest.raises(ValueError):
+        chip_windows(1000, 1000, chip_size, overlap)
+
+def test_boxes_and_polygons_move_to_chip_coordinates():
+    ann = {'id': 3, 'image_id': 0, 'category_id': 1, 'bbox': [500, 100, 50, 40], 'area': 2000,
+           'segmentation': [[500, 100, 550, 100, 550, 140, 500, 140]]}
+    windows = np.array([[0, 0, 512, 512], [448, 0, 960, 512]])
+    first, second = window_annotations([ann], windows, min_visibility = 0.1)
+
+    # Fully inside the second window, just shifted
+    assert second[0]['bbox'] == [52, 100, 50, 40]
+    assert second[0]['segmentation'] == [[52, 100, 102, 100, 102, 140, 52, 140]]
+    assert second[0]['area'] == 2000
+
+    # Only the left 12 pixels are on the first
+    assert first[0]['bbox'] == [500, 100, 12, 40]
+    assert first[0]['segmentation'] == [[500, 100, 512, 100, 512, 140, 500, 140]]
+    assert first[0]['area'] == pytest.approx(12 * 40)
+
+    # The source annotation is left alone
+    assert ann['bbox'] == [500, 100, 50, 40] and ann['area'] == 2000
+
+def test_polygon_area_comes_from_the_clipped_polygon():
+    # Triangle whose box is half on the window but whose polygon is mostly off it
+    ann = {'id': 0, 'image_id': 0, 'category_id': 1, 'bbox': [0, 0, 20, 20],
+           'segmentation': [[0, 20, 20, 0, 20, 20]]}
+    chip, = window_annotations([ann], np.array([[0, 0, 10, 20]]), min_visibility = 0.5)
+    assert chip[0]['bbox'] == [0, 0, 10, 20]
+    # Trapezoid between x = 0 and 10 under the hypotenuse
+    assert chip[0]['area'] == pytest.approx(50)
+
+def test_min_visibility():
+    anns = [{'id': 0, 'image_id': 0, 'category_id': 1, 'bbox': [480, 0, 64, 10]},
+            {'id': 1, 'image_id': 0, 'category_id': 1, 'bbox': [490, 0, 64, 10]},
+            {'id': 2, 'image_id': 0, 'category_id': 1, 'bbox': [600, 0, 10, 10]}]
+    windows = np.array([[0, 0, 512, 512]])
+
+    # Half of the first box is on the window, about a third of the second and none of the third
+    kept, = window_annotations(anns, windows, min_visibility = 0.5)
+    assert [a['id'] for a in kept] == [0]
+    assert kept[0]['bbox'] == [480, 0, 32, 10]
+
+    kept, = window_annotations(anns, windows, min_visibility = 0.3)
+    assert [a['id'] for a in kept] == [0, 1]
+
+    kept, = window_annotations(anns, windows, min_visibility = 0.6)
+    assert kept == []
+
+def test_chip_coco(tmp_path):
+    im_folder = str(tmp_path / 'images') + '/'
+    os.makedirs(im_folder)
+    Image.new('RGB', (100, 60)).save(im_folder + 'a.png')
+    gt = {'images': [{'id': 7, 'file_name': 'a.png', 'width': 100, 'height': 60}],
+          'annotations': [{'id': 0, 'image_id': 7, 'category_id': 1, 'bbox': [70, 10, 20, 20], 'area': 400}],
+          'categories': [{'id': 1, 'name': 'plane'}]}
+    json_path = str(tmp_path / 'gt.json')
+    with open(json_path, 'w') as f:
+        json.dump(gt, f)
+
+    out_json = chip_coco(json_path, im_folder, str(tmp_path / 'chips') + '/', str(tmp_path / 'chips.json'),
+                         chip_size = 50, overlap = 10)
+    with open(out_json) as f:
+        chips = json.load(f)
+
+    # Windows start at x = 0, 40, 50 and y = 0, 10; the box is whole on the x = 50 chips and
+    # 10 / 20 on the x = 40 ones
+    windows = {tuple(i['window']) for i in chips['images']}
+    assert windows == {(40, 0, 90, 50), (50, 0, 100, 50), (40, 10, 90, 60), (50, 10, 100, 60)}
+    assert all(i['parent_id'] == 7 for i in chips['images'])
+    assert [a['id'] for a in chips['annotations']] == list(range(4))
+    by_window = {tuple(i['window']): i['id'] for i in chips['images']}
+    boxes = {a['image_id']: a['bbox'] for a in chips['annotations']}
+    assert boxes[by_window[(50, 0, 100, 50)]] == [20, 10, 20, 20]
+    assert boxes[by_window[(40, 10, 90, 60)]] == [30, 0, 20, 20]
+    for i in chips['images']:
+        assert Image.open(str(tmp_path / 'chips' / i['file_name'])).size == (50, 50)
+
+def test_chip_coco_checks_overlap_first(tmp_path):
+    with pytest.raises(ValueError):
+        chip_coco(str(tmp_path / 'missing.json'), str(tmp_path) + '/', str(tmp_path / 'chips') + '/',
+                  str(tmp_path / 'chips.json'), chip_size = 64, overlap = 64)
+    assert not os.path.exists(str(tmp_path / 'chips'))
@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+import xView.xview_coco as xview_coco
+from coco_utils.coco_writer import CocoWriter
+
+
+def existing_json(tmp_path):
+    path = str(tmp_path / 'gt.json')
+    coco = {'images': [{'id': 1, 'file_name': 'a.tif', 'width': 10, 'height': 10}],
+            'annotations': [{'id': 1, 'image_id': 1, 'category_id': 1, 'bbox': [-2, 0, 5, 5], 'area': 25}],
+            'categories': [{'id': 1, 'name': 'car'}]}
+    with open(path, 'w') as f:
+        json.dump(coco, f)
+    with open(path, 'r') as f:
+        return path, f.read()
+
+def test_streamed_write(tmp_path):
+    path = str(tmp_path / 'out.json')
+    with CocoWriter(path, info = {'year': 2018}) as writer:
+        writer.add_images(iter([{'id': 1}, {'id': 2}]))
+        writer.add_annotations(iter([]))
+        writer.close(categories = [{'id': 1, 'name': 'car'}])
+    with open(path, 'r') as f:
+        assert json.load(f) == {'info': {'year': 2018}, 'images': [{'id': 1}, {'id': 2}], 'annotations': [],
+                                'categories': [{'id': 1, 'name': 'car'}]}
+    assert not os.path.exists(path + '.tmp')
+
+def test_failed_write_leaves_existing_json(tmp_path):
+    path, before = existing_json(tmp_path)
+    with pytest.raises(TypeError):
+        with CocoWriter(path, info = {}) as writer:
+            writer.add_annotations([{'id': 1}, {'id': object()}])
+    with open(path, 'r') as f:
+        assert f.read() == before
+    assert not os.path.exists(path + '.tmp')
+
+def test_clip_bboxes_to_ims(tmp_path):
+    path, _ = existing_json(tmp_path)
+    xview_coco.clip_bboxes_to_ims(path)
+    with open(path, 'r') as f:
+        assert json.load(f)['annotations'][0]['bbox'] == [0, 0, 3, 5]
+    assert not os.path.exists(path + '.tmp')
+
+def test_clip_bboxes_to_ims_failing_partway(tmp_path, monkeypatch):
+    path, before = existing_json(tmp_path)
+    # An annotation that can't be serialized, so the write fails once the output is under way
+    monkeypatch.setattr(xview_coco, 'clip_annotations', lambda images, annotations: annotations + [{'id': object()}])
+    with pytest.raises(TypeError):
+        xview_coco.clip_bboxes_to_ims(path)
+    with open(path, 'r') as f:
+        assert f.read() == before
+    assert not os.path.exists(path + '.tmp')
@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+
+from coco_utils.columnar import load_columnar, open_coco_writer
+
+
+def make_images(n):
+    return [{'id': k, 'file_name': 'P{:04d}.png'.format(k), 'width': 100, 'height': 80} for k in range(n)]
+
+def make_annotations(n):
+    return [{'id': k, 'image_id': k % 2, 'category_id': 1, 'bbox': [1, 2, 3, 4], 'area': 12,
+             'segmentation': [[1, 2, 4, 2, 4, 6, 1, 6]]} for k in range(n)]
+
+def read_outputs(json_path):
+    with open(json_path, 'r') as f:
+        coco = json.load(f)
+    return coco, load_columnar(str(json_path).replace('.json', '.columns'))
+
+
+def test_both_streams_generators_to_every_writer(tmp_path):
+    # As dota_to_coco writes: images and annotations streamed from generators
+    json_path = str(tmp_path / 'out.json')
+    with open_coco_writer(json_path, 'both', info = {}) as writer:
+        writer.add_images(i for i in make_images(2))
+        writer.add_annotations(a for a in make_annotations(5))
+        writer.close(categories = [{'id': 1, 'name': 'plane'}])
+
+    coco, store = read_outputs(json_path)
+    assert len(coco['images']) == 2 and len(coco['annotations']) == 5
+    assert len(store['im_ids']) == 2 and len(store['ann_ids']) == 5
+    assert store['ring_offsets'][-1] == 5
+
+def test_images_passed_to_close_are_columns(tmp_path):
+    # As fair1m_json writes: annotations streamed, images only known at the end
+    json_path = str(tmp_path / 'out.json')
+    with open_coco_writer(json_path, 'both', info = {}) as writer:
+        writer.add_annotations(make_annotations(3))
+        writer.close(images = (i for i in make_images(2)))
+
+    coco, store = read_outputs(json_path)
+    assert len(coco['images']) == 2
+    assert store['im_ids'].tolist() == [0, 1]
+    assert store['im_widths'].tolist() == [100, 100]
+
+def test_empty_input_has_the_same_keys_in_every_format(tmp_path):
+    outputs = {}
+    for output_format in ('json', 'both'):
+        json_path = str(tmp_path / '{}.json'.format(output_format))
+        with open_coco_writer(json_path, output_format, info = {}) as writer:
+            writer.add_images(iter([]))
+            writer.add_annotations(iter([]))
+            writer.close(categories = [])
+        with open(json_path, 'r') as f:
+            outputs[output_format] = json.load(f)
+    assert outputs['json'] == outputs['both'] == {'info': {}, 'images': [], 'annotations': [], 'categories': []}
+
+def test_gsds(tmp_path):
+    json_path = str(tmp_path / 'out.json')
+    images = make_images(6)
+    for image, gsd in zip(images, [0.5, 0, 0.0, None, False, None]):
+        image['gsd'] = gsd
+    del images[-1]['gsd']
+    with open_coco_writer(json_path, 'columnar') as writer:
+        writer.close(images = images)
+
+    # A gsd of 0 is kept, only a missing one is nan
+    gsds = load_columnar(str(tmp_path / 'out.columns'))['im_gsds']
+    assert gsds[:3].tolist() == [0.5, 0, 0]
+    assert np.isnan(gsds[3:]).all()
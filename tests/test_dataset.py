@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+
+from coco_utils.dataset import CocoDataset
+
+
+def small_coco():
+    # Ids out of order and with gaps; image 30 has no annotations and annotation 9 is on an image that doesn't exist
+    images = [{'id': 20, 'file_name': 'b.png'}, {'id': 10, 'file_name': 'a.png'}, {'id': 30, 'file_name': 'c.png'}]
+    categories = [{'id': 3, 'name': 'ship'}, {'id': 1, 'name': 'plane'}]
+    annotations = [{'id': 7, 'image_id': 10, 'category_id': 1, 'bbox': [0, 0, 1, 1]},
+                   {'id': 2, 'image_id': 20, 'category_id': 3, 'bbox': [0, 0, 1, 1]},
+                   {'id': 5, 'image_id': 10, 'category_id': 3, 'bbox': [0, 0, 1, 1]},
+                   {'id': 4, 'image_id': 20, 'category_id': 3, 'bbox': [0, 0, 1, 1]},
+                   {'id': 9, 'image_id': 99, 'category_id': 1, 'bbox': [0, 0, 1, 1]}]
+    return {'info': {'description': 'test'}, 'images': images, 'annotations': annotations, 'categories': categories}
+
+def ids(items):
+    return [i['id'] for i in items]
+
+def test_lookups():
+    dataset = CocoDataset(small_coco())
+    assert len(dataset) == 3
+    assert dataset.sections == {'info': {'description': 'test'}}
+
+    assert dataset.get_image(10)['file_name'] == 'a.png'
+    assert dataset.get_image(30)['file_name'] == 'c.png'
+    assert dataset.get_image(15) is None and dataset.get_image(100) is None
+    assert dataset.get_annotation(5)['image_id'] == 10
+    assert dataset.get_annotation(1) is None and dataset.get_annotation(8) is None
+    assert dataset.get_category(3)['name'] == 'ship'
+    assert dataset.get_category(2) is None
+    assert dataset.category_id('plane') == 1 and dataset.category_id('car') is None
+
+    assert dataset.image_rows([30, 20, 11]).tolist() == [2, 0, -1]
+    assert dataset.annotation_rows([9, 7, 0]).tolist() == [4, 0, -1]
+    assert dataset.category_rows([1, 3]).tolist() == [1, 0]
+
+def test_per_image_and_category():
+    dataset = CocoDataset(small_coco())
+    # Each image's annotations come back in their original order
+    assert dataset.image_annotation_rows(10).tolist() == [0, 2]
+    assert ids(dataset.image_annotations(20)) == [2, 4]
+    assert ids(dataset.image_annotations(30)) == []
+    assert ids(dataset.image_annotations(99)) == []
+    assert ids(dataset.category_annotations(3)) == [2, 5, 4]
+    assert ids(dataset.category_annotations(1)) == [7, 9]
+    assert ids(dataset.category_annotations(2)) == []
+    assert dataset.images_with_category(3).tolist() == [10, 20]
+
+    assert dataset.annotation_counts().tolist() == [2, 2, 0]
+    assert [(i['id'], ids(anns)) for i, anns in dataset.iter_images()] == [(20, [2, 4]), (10, [7, 5]), (30, [])]
+
+def test_subset():
+    dataset = CocoDataset(small_coco())
+    sub = dataset.subset(image_ids = [10, 30])
+    assert ids(sub.images) == [10, 30] and ids(sub.annotations) == [7, 5]
+    assert ids(sub.categories) == [3, 1]
+
+    sub = dataset.subset(category_ids = [3], keep_empty = False)
+    assert ids(sub.images) == [20, 10] and ids(sub.annotations) == [2, 5, 4]
+    assert ids(sub.categories) == [3]
+    assert sub.sections == dataset.sections
+
+    sub = dataset.subset(image_ids = [10], category_ids = 1)
+    assert ids(sub.annotations) == [7] and ids(sub.categories) == [1]
+
+def test_empty_and_saved(tmp_path):
+    empty = CocoDataset({})
+    assert len(empty) == 0 and empty.get_image(1) is None and empty.get_annotation(1) is None
+    assert ids(empty.image_annotations(1)) == [] and list(empty.iter_images()) == []
+
+    dataset = CocoDataset(small_coco())
+    json_path = dataset.save(str(tmp_path / 'out.json'))
+    with open(json_path) as f:
+        assert json.load(f) == small_coco()
+    assert np.array_equal(CocoDataset(json_path).annotation_counts(), dataset.annotation_counts())
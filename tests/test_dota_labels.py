@@ -0,0 +1,52 @@
+import numpy as np
+
+from DOTA.dota_coco import read_dota_header, read_dota_labels
+
+OBJECTS = ('2753.0 2408.0 2861.0 2385.0 2888.0 2468.0 2805.0 2502.0 plane 0\n'
+           '3445.0 3391.0 3484.0 3409.0 3478.0 3422.0 3437.0 3402.0 large-vehicle 1\n')
+
+def write(tmp_path, text):
+    path = str(tmp_path / 'P0001.txt')
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+def test_header_and_objects(tmp_path):
+    path = write(tmp_path, 'imagesource:GoogleEarth\ngsd:0.146343590398\n' + OBJECTS)
+    labels = read_dota_labels(path)
+    assert labels['imagesource'] == 'GoogleEarth'
+    assert labels['gsd'] == 0.146343590398
+    assert labels['polygons'].shape == (2, 8)
+    assert labels['polygons'][0, :2].tolist() == [2753.0, 2408.0]
+    assert labels['categories'].tolist() == ['plane', 'large-vehicle']
+    assert labels['difficult'].tolist() == [0, 1]
+    assert read_dota_header(path) == {'imagesource': 'GoogleEarth', 'gsd': 0.146343590398}
+
+def test_header_only(tmp_path):
+    path = write(tmp_path, 'imagesource:GoogleEarth\ngsd:null\n')
+    labels = read_dota_labels(path)
+    assert labels['polygons'].shape == (0, 8)
+    assert len(labels['categories']) == 0 and len(labels['difficult']) == 0
+    assert labels['gsd'] is None and labels['imagesource'] == 'GoogleEarth'
+    assert read_dota_header(path) == {'imagesource': 'GoogleEarth', 'gsd': None}
+
+def test_headerless(tmp_path):
+    path = write(tmp_path, OBJECTS)
+    labels = read_dota_labels(path)
+    assert labels['imagesource'] is None and labels['gsd'] is None
+    assert len(labels['polygons']) == 2
+    assert read_dota_header(path) == {'imagesource': None, 'gsd': None}
+
+def test_no_difficult_column(tmp_path):
+    path = write(tmp_path, '\n'.join(' '.join(l.split()[:9]) for l in OBJECTS.splitlines()) + '\n\n')
+    labels = read_dota_labels(path)
+    assert labels['difficult'].tolist() == [0, 0]
+    assert labels['categories'].tolist() == ['plane', 'large-vehicle']
+
+def test_bad_gsd(tmp_path, capsys):
+    path = write(tmp_path, 'imagesource:GF2\ngsd:unknown\n' + OBJECTS)
+    labels = read_dota_labels(path)
+    assert labels['gsd'] is None and labels['imagesource'] == 'GF2'
+    assert np.isfinite(labels['polygons']).all() and len(labels['polygons']) == 2
+    assert read_dota_header(path) == {'imagesource': 'GF2', 'gsd': None}
+    assert path in capsys.readouterr().out
@@ -0,0 +1,77 @@
+import warnings
+
+from coco_utils.benchmark import make_fair1m_fixture
+from FAIR1M.fair1m_coco import read_fair1m_xml, read_fair1m_xml_bs4
+
+# Laid out like a real FAIR1M label, with an object that has extra fields and a polygon
+SAMPLE = '''<?xml version="1.0" encoding="utf-8"?>
+<annotation>
+	<source>
+		<filename>12.tif</filename>
+		<origin>GF2/GF3</origin>
+	</source>
+	<research>
+		<version>1.0</version>
+		<provider>Company/School of team</provider>
+	</research>
+	<size>
+		<width>1000</width>
+		<height>800</height>
+		<depth>3</depth>
+	</size>
+	<objects>
+		<object>
+			<coordinate>pixel</coordinate>
+			<type>rectangle</type>
+			<description>None</description>
+			<possibleresult>
+				<name>Boeing737</name>
+			</possibleresult>
+			<points>
+				<point>10.500000,20.250000</point>
+				<point>40.000000,20.000000</point>
+				<point>40.000000,60.900000</point>
+				<point>10.000000,60.000000</point>
+				<point>10.500000,20.250000</point>
+			</points>
+		</object>
+		<object>
+			<coordinate>pixel</coordinate>
+			<type>polygon</type>
+			<description>None</description>
+			<possibleresult>
+				<name>Small Car</name>
+				<probability>1.0</probability>
+			</possibleresult>
+			<points>
+				<point>500.000000,400.000000</point>
+				<point>520.000000,402.000000</point>
+				<point>519.000000,430.000000</point>
+			</points>
+		</object>
+	</objects>
+</annotation>
+'''
+
+def test_parsers_agree_on_sample(tmp_path):
+    path = str(tmp_path / '12.xml')
+    with open(path, 'w') as f:
+        f.write(SAMPLE)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        bs4_result = read_fair1m_xml_bs4(path)
+    lxml_result = read_fair1m_xml(path)
+
+    assert lxml_result == bs4_result
+    assert lxml_result == ('12.tif', 1000, 800, [
+        ('Boeing737', 'pixel', [(10, 20), (40, 20), (40, 60), (10, 60), (10, 20)]),
+        ('Small Car', 'pixel', [(500, 400), (520, 402), (519, 430)]),
+    ])
+
+def test_parsers_agree_on_fixture(tmp_path):
+    xml_folder = make_fair1m_fixture(str(tmp_path), n_images = 3, n_objects = 20, image_size = 64)
+    for i in range(3):
+        path = xml_folder + '{}.xml'.format(i)
+        assert read_fair1m_xml(path) == read_fair1m_xml_bs4(path)
+        assert len(read_fair1m_xml(path)[3]) == 20
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from coco_utils.geo_index import GeoIndex, haversine_m, split_lon_range
+
+
+def random_annotations(rng, n):
+    # Footprints up to about half a degree across, a third of them bunched up either side of the antimeridian
+    w, h = rng.uniform(0, 0.5, (2, n))
+    lon = np.where(rng.random(n) < 1 / 3, rng.choice([-180.0, 179.5], n) + rng.uniform(0, 0.5, n),
+                   rng.uniform(-180, 179.5, n))
+    lon = np.minimum(lon, 180 - w)
+    lat = rng.uniform(-60, 60, n)
+    return [{'id': k, 'image_id': k // 10, 'category_id': 1, 'bbox': [0, 0, 1, 1],
+             'bbox_geos': [float(lon[k]), float(lat[k]), float(w[k]), float(h[k])]} for k in range(n)]
+
+def footprint(a):
+    lon, lat, w, h = a['bbox_geos']
+    return lon, lat, lon + w, lat + h
+
+def brute_force_rect(annotations, min_lon, min_lat, max_lon, max_lat):
+    # Ranges running past 180 carry on from -180
+    if max_lon > 180:
+        max_lon -= 360
+    ids = []
+    for a in annotations:
+        a_min_lon, a_min_lat, a_max_lon, a_max_lat = footprint(a)
+        if a_min_lat > max_lat or a_max_lat < min_lat:
+            continue
+        if min_lon <= max_lon:
+            hit = a_min_lon <= max_lon and a_max_lon >= min_lon
+        else:
+            # Wraps round through 180
+            hit = a_max_lon >= min_lon or a_min_lon <= max_lon
+        if hit:
+            ids.append(a['id'])
+    return sorted(ids)
+
+def brute_force_radius(annotations, lon, lat, radius_m):
+    ids = np.array([a['id'] for a in annotations])
+    a_min_lon, a_min_lat, a_max_lon, a_max_lat = np.array([footprint(a) for a in annotations]).T
+    near_lat = np.clip(lat, a_min_lat, a_max_lat)
+    # Try the point a turn either way round too, to find the nearest edge across the antimeridian
+    d = np.min([haversine_m(l, lat, np.clip(l, a_min_lon, a_max_lon), near_lat) for l in (lon - 360, lon, lon + 360)],
+               axis = 0)
+    return sorted(ids[d <= radius_m].tolist())
+
+@pytest.fixture(scope = 'module')
+def index(tmp_path_factory):
+    annotations = random_annotations(np.random.default_rng(0), 3000)
+    index = GeoIndex(str(tmp_path_factory.mktemp('geo') / 'test.geoindex'))
+    index.add_annotations(annotations)
+    index.commit()
+    yield index, annotations
+    index.close()
+
+def test_split_lon_range():
+    assert split_lon_range(10, 20) == [(10, 20)]
+    assert split_lon_range(170, -170) == [(170, 180.0), (-180.0, -170)]
+    assert split_lon_range(-190, -170) == [(170, 180.0), (-180.0, -170)]
+    assert split_lon_range(170, 190) == [(170, 180.0), (-180.0, -170)]
+    assert split_lon_range(-200, 200) == [(-180.0, 180.0)]
+
+def test_rect_queries_match_brute_force(index):
+    index, annotations = index
+    rng = np.random.default_rng(1)
+    rects = [(179.7, -60, -179.7, 60), (179.9, 0, 180, 30), (-180, -60, -179.9, 60), (-10, -10, 10, 10)]
+    for _ in range(100):
+        min_lon, min_lat = rng.uniform(-180, 180), rng.uniform(-60, 60)
+        rects.append((min_lon, min_lat, min_lon + rng.uniform(0, 20), min_lat + rng.uniform(0, 20)))
+    for rect in rects:
+        assert index.query_ids(*rect).tolist() == brute_force_rect(annotations, *rect)
+
+def test_rect_query_crossing_the_antimeridian(index):
+    index, annotations = index
+    ids = index.query_ids(179.8, -60, -179.8, 60).tolist()
+    assert ids == brute_force_rect(annotations, 179.8, -60, -179.8, 60)
+    # Both sides are found
+    lons = [annotations[i]['bbox_geos'][0] for i in ids]
+    assert min(lons) < 0 < max(lons)
+
+def test_radius_queries_match_brute_force(index):
+    index, annotations = index
+    rng = np.random.default_rng(2)
+    points = [(179.95, 0, 50000), (-179.95, 10, 80000), (180, -20, 30000), (-180, 30, 100000)]
+    points += [(rng.uniform(-180, 180), rng.uniform(-60, 60), rng.uniform(1000, 200000)) for _ in range(100)]
+    points += [(rng.choice([-1, 1]) * rng.uniform(179.5, 180), rng.uniform(-60, 60), rng.uniform(1000, 200000))
+               for _ in range(100)]
+    for lon, lat, radius_m in points:
+        assert index.query_radius_ids(lon, lat, radius_m).tolist() == brute_force_radius(annotations, lon, lat, radius_m)
+
+def test_radius_finds_the_edge_across_the_antimeridian(tmp_path):
+    annotations = [{'id': 0, 'image_id': 0, 'bbox_geos': [170.0, 0.0, 9.9, 1.0]},
+                   {'id': 1, 'image_id': 1, 'bbox_geos': [-170.0, 0.0, 1.0, 1.0]}]
+    with GeoIndex(str(tmp_path / 'test.geoindex')) as index:
+        index.add_annotations(annotations)
+        # 0.2 degrees east of the first footprint's east edge, about 22km
+        assert index.query_radius_ids(-179.9, 0.5, 30000).tolist() == [0]
+        assert index.query_radius_ids(-179.9, 0.5, 15000).tolist() == []
+        assert index.query_images(179, 0, -169.5, 0.5) == [0, 1]
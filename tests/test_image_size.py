@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from coco_utils.image_size import get_image_size, pil_size
+
+
+def save(tmp_path, name, im, **kwargs):
+    path = str(tmp_path / name)
+    im.save(path, **kwargs)
+    return path
+
+def pil_expected(path):
+    # What PIL reports, with palette images counted as the RGB they expand to
+    with Image.open(path) as im:
+        return im.size + (3 if im.mode == 'P' else len(im.getbands()),)
+
+def rgb(w = 37, h = 23):
+    return Image.fromarray(np.random.default_rng(0).integers(0, 255, (h, w, 3), dtype = np.uint8))
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA', 'P', 'I;16'])
+def test_png(tmp_path, mode):
+    im = rgb().convert('RGBA').convert(mode) if mode != 'I;16' else Image.fromarray(np.zeros((23, 37), dtype = np.uint16))
+    path = save(tmp_path, 'a.png', im)
+    assert get_image_size(path) == pil_expected(path)
+
+@pytest.mark.parametrize('kwargs', [{}, {'progressive': True}])
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'CMYK'])
+def test_jpeg(tmp_path, mode, kwargs):
+    path = save(tmp_path, 'a.jpg', rgb().convert(mode), **kwargs)
+    assert get_image_size(path) == pil_expected(path)
+
+@pytest.mark.parametrize('make, kwargs', [
+    (lambda: rgb(), {}),
+    (lambda: rgb().convert('L'), {}),
+    (lambda: rgb(), {'compression': 'tiff_lzw'}),
+    (lambda: Image.fromarray(np.arange(23 * 37, dtype = np.uint16).reshape(23, 37)), {}),
+    (lambda: Image.fromarray(np.arange(23 * 37, dtype = np.uint16).reshape(23, 37)), {'compression': 'tiff_lzw'}),
+    # Big-endian
+    (lambda: Image.fromarray(np.arange(23 * 37, dtype = np.uint16).reshape(23, 37)).convert('I;16B'), {}),
+])
+def test_tiff(tmp_path, make, kwargs):
+    path = save(tmp_path, 'a.tif', make(), **kwargs)
+    assert get_image_size(path) == pil_expected(path) == (37, 23, pil_expected(path)[2])
+
+def test_big_endian_tiff_header(tmp_path):
+    im = Image.fromarray(np.zeros((23, 37), dtype = np.uint16)).convert('I;16B')
+    path = save(tmp_path, 'a.tif', im)
+    with open(path, 'rb') as f:
+        assert f.read(2) == b'MM'
+    assert get_image_size(path) == (37, 23, 1)
+
+@pytest.mark.parametrize('name, mode', [('a.bmp', 'RGB'), ('a.gif', 'P'), ('a.webp', 'RGBA')])
+def test_fallback(tmp_path, name, mode):
+    path = save(tmp_path, name, rgb().convert('RGBA').convert(mode))
+    assert get_image_size(path) == pil_expected(path)
+
+def test_palette_png_agrees_with_fallback(tmp_path):
+    path = save(tmp_path, 'a.png', rgb().convert('P'))
+    assert get_image_size(path) == pil_size(path) == (37, 23, 3)
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from coco_utils.json_stream import iter_json_array, read_json_sections
+
+# Strings with escapes and \u sequences, and numbers of every shape, so small chunks split them everywhere
+ITEMS = [
+    {'id': 1, 'name': 'plain', 'bbox': [0, 1.5, -2e-3, 12345678901234]},
+    {'id': 2, 'name': 'quote \" and backslash \\ and slash /', 'area': None, 'ok': True},
+    {'id': 3, 'name': 'unicode é中\U0001f600 and \\u0041', 'tab': '\t\n\r\b\f'},
+    {'id': 4, 'nested': {'a': [1, {'b': [[], {}]}], 'c': {'d': -0.0}}, 'e': 1e100, 'f': -7},
+    {'id': 5, 'empty': '', 'list': [], 'obj': {}, 'neg': -1.25E+3},
+]
+SECTIONS = {'info': {'description': 'a "quoted" ☃ description', 'year': 2018},
+            'licenses': [{'id': 0, 'name': 'x\\y'}],
+            'categories': []}
+
+def write(tmp_path, coco, ensure_ascii):
+    path = str(tmp_path / 'a.json')
+    with open(path, 'w') as f:
+        json.dump(coco, f, ensure_ascii = ensure_ascii)
+    return path
+
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 1 << 20])
+def test_items_and_sections_round_trip(tmp_path, chunk_size, ensure_ascii):
+    coco = dict(SECTIONS, images = [], annotations = ITEMS, features = [{'x': 1}])
+    path = write(tmp_path, coco, ensure_ascii)
+
+    assert list(iter_json_array(path, 'annotations', chunk_size)) == ITEMS
+    assert list(iter_json_array(path, 'images', chunk_size)) == []
+    assert list(iter_json_array(path, 'features', chunk_size)) == [{'x': 1}]
+    assert read_json_sections(path, chunk_size = chunk_size) == dict(SECTIONS, features = [{'x': 1}])
+    assert read_json_sections(path, skip_keys = (), chunk_size = chunk_size) == coco
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7])
+def test_missing_key_and_empty_object(tmp_path, chunk_size):
+    path = write(tmp_path, {'info': {}, 'images': [1, 2]}, True)
+    assert list(iter_json_array(path, 'annotations', chunk_size)) == []
+
+    path = write(tmp_path, {}, True)
+    assert list(iter_json_array(path, 'annotations', chunk_size)) == []
+    assert read_json_sections(path, chunk_size = chunk_size) == {}
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7])
+def test_whitespace_and_top_level_numbers(tmp_path, chunk_size):
+    path = str(tmp_path / 'a.json')
+    with open(path, 'w') as f:
+        f.write('{ "n" : 1234567 ,\n  "annotations" : [ 10 , 2.50 , -3e2 ,\n {"a" : "b"} ] , "m":7}')
+    assert list(iter_json_array(path, 'annotations', chunk_size)) == [10, 2.5, -300.0, {'a': 'b'}]
+    assert read_json_sections(path, chunk_size = chunk_size) == {'n': 1234567, 'm': 7}
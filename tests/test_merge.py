@@ -0,0 +1,65 @@
+import json
+
+from coco_utils.merge import merge_coco
+
+
+def write_coco(path, coco):
+    with open(path, 'w') as f:
+        json.dump(coco, f)
+    return str(path)
+
+def test_merge(tmp_path):
+    dota = {'info': {'description': 'DOTA'},
+            'licenses': [{'id': 0, 'name': 'GoogleEarth'}, {'id': 1, 'name': 'GF2'}],
+            'categories': [{'id': 0, 'name': 'small-vehicle'}, {'id': 1, 'name': 'plane'}, {'id': 2, 'name': 'harbor'}],
+            'images': [{'id': 5, 'file_name': 'P0005.png', 'license': 1},
+                       {'id': 9, 'file_name': 'P0009.png', 'license': False},
+                       {'id': 12, 'file_name': 'P0012.png', 'license': 0}],
+            'annotations': [{'id': 100, 'image_id': 9, 'category_id': 0, 'bbox': [0, 0, 1, 1]},
+                            {'id': 101, 'image_id': 5, 'category_id': 2, 'bbox': [0, 0, 1, 1]},
+                            {'id': 102, 'image_id': 5, 'category_id': 1, 'bbox': [0, 0, 1, 1]},
+                            {'id': 103, 'image_id': 77, 'category_id': 1, 'bbox': [0, 0, 1, 1]}]}
+    fair1m = {'license': {'id': 1, 'name': 'FAIR1M'},
+              'categories': [{'id': 1, 'name': 'Small Car'}, {'id': 2, 'name': 'Boeing737'}],
+              'images': [{'id': 5, 'file_name': '5.tif', 'license': 1}],
+              'annotations': [{'id': 100, 'image_id': 5, 'category_id': 1, 'bbox': [0, 0, 1, 1]},
+                              {'id': 101, 'image_id': 5, 'category_id': 2, 'bbox': [0, 0, 1, 1]}]}
+    mapping = {'dota': {'small-vehicle': 'Small Car', 'harbor': None}, '*': {'Boeing737': 'plane'}}
+
+    out_json = merge_coco([('dota', write_coco(tmp_path / 'dota.json', dota)),
+                           ('fair1m', write_coco(tmp_path / 'fair1m.json', fair1m))],
+                          str(tmp_path / 'merged.json'), mapping, image_prefixes = {'dota': 'DOTA/'})
+    with open(out_json) as f:
+        merged = json.load(f)
+
+    categories = {c['id']: c['name'] for c in merged['categories']}
+    assert sorted(categories.values()) == ['Small Car', 'plane']
+    licenses = {l['id']: l['name'] for l in merged['licenses']}
+    assert sorted(licenses.values()) == ['FAIR1M', 'GF2', 'GoogleEarth']
+
+    # Images are numbered in order across the inputs, keeping their old ids
+    images = merged['images']
+    assert [i['id'] for i in images] == [0, 1, 2, 3]
+    assert [(i['dataset'], i['source_id']) for i in images] == [('dota', 5), ('dota', 9), ('dota', 12), ('fair1m', 5)]
+    assert [i['file_name'] for i in images] == ['DOTA/P0005.png', 'DOTA/P0009.png', 'DOTA/P0012.png', '5.tif']
+    assert [licenses.get(i['license']) for i in images] == ['GF2', None, 'GoogleEarth', 'FAIR1M']
+    # An image without a license keeps False rather than picking up license 0's mapping
+    assert images[1]['license'] is False
+
+    # The harbor annotation and the one on a missing image are dropped, the rest re-keyed
+    anns = merged['annotations']
+    assert [a['id'] for a in anns] == [0, 1, 2, 3]
+    assert [(a['image_id'], categories[a['category_id']]) for a in anns] == \
+        [(1, 'Small Car'), (0, 'plane'), (3, 'Small Car'), (3, 'plane')]
+
+def test_merge_drop_unmapped(tmp_path):
+    coco = {'categories': [{'id': 1, 'name': 'plane'}, {'id': 2, 'name': 'ship'}],
+            'images': [{'id': 1, 'file_name': 'a.png'}],
+            'annotations': [{'id': 1, 'image_id': 1, 'category_id': 1, 'bbox': [0, 0, 1, 1]},
+                            {'id': 2, 'image_id': 1, 'category_id': 2, 'bbox': [0, 0, 1, 1]}]}
+    out_json = merge_coco([('a', write_coco(tmp_path / 'a.json', coco))], str(tmp_path / 'merged.json'),
+                          {'a': {'ship': 'Ship'}}, unmapped = 'drop')
+    with open(out_json) as f:
+        merged = json.load(f)
+    assert [c['name'] for c in merged['categories']] == ['Ship']
+    assert [a['category_id'] for a in merged['annotations']] == [merged['categories'][0]['id']]
@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+from coco_utils.resample import resample_coco
+
+
+@pytest.mark.parametrize('tile_size, overlap, target_gsd', [(64, 64, 0.5), (64, 100, 0.5), (64, -1, 0.5),
+                                                            (0, 0, 0.5), (64, 8, 0)])
+def test_bad_parameters_fail_before_any_work(tmp_path, tile_size, overlap, target_gsd):
+    # The json doesn't exist, so getting as far as reading it would raise something else
+    with pytest.raises(ValueError):
+        resample_coco(str(tmp_path / 'missing.json'), str(tmp_path) + '/', str(tmp_path / 'tiles') + '/',
+                      str(tmp_path / 'tiles.json'), target_gsd, tile_size = tile_size, overlap = overlap)
+    assert not os.path.exists(str(tmp_path / 'tiles'))
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from coco_utils.spatial_index import GridIndex, SpatialIndex
+
+
+def random_boxes(rng, n, extent = 1000):
+    # Mostly small boxes with a few large ones, some hanging off the top left
+    sides = np.where(rng.random((n, 2)) < 0.05, rng.uniform(100, 400, (n, 2)), rng.uniform(0, 30, (n, 2)))
+    return np.column_stack([rng.uniform(-50, extent, (n, 2)), sides])
+
+def brute_force(bboxes, window):
+    x1, y1, x2, y2 = window
+    b = np.asarray(bboxes, dtype = np.float64).reshape(-1, 4)
+    hit = (b[:, 0] < x2) & (b[:, 0] + b[:, 2] > x1) & (b[:, 1] < y2) & (b[:, 1] + b[:, 3] > y1)
+    return np.flatnonzero(hit)
+
+def random_windows(rng, n, extent = 1000):
+    # Includes windows partly and wholly outside the boxes' extent
+    x1, y1 = rng.uniform(-300, extent + 300, (2, n))
+    w, h = rng.uniform(0, 500, (2, n))
+    return np.column_stack([x1, y1, x1 + w, y1 + h])
+
+@pytest.mark.parametrize('cell_size', [None, 1, 7.5, 64, 5000])
+def test_grid_matches_brute_force(cell_size):
+    rng = np.random.default_rng(0)
+    bboxes = random_boxes(rng, 500)
+    grid = GridIndex(bboxes, cell_size)
+    for window in random_windows(rng, 200):
+        assert grid.query(window).tolist() == brute_force(bboxes, window).tolist()
+
+def test_grid_edges():
+    grid = GridIndex([[0, 0, 10, 10], [10, 0, 10, 10], [5, 5, 0, 0]], cell_size = 4)
+    # Boxes that only touch the window's edge don't intersect it
+    assert grid.query([10, 0, 20, 10]).tolist() == [1]
+    assert grid.query([-5, -5, 0, 0]).tolist() == []
+    # A zero sized box still counts when it's strictly inside the window
+    assert grid.query([4, 4, 6, 6]).tolist() == [0, 2]
+    assert grid.query([5, 5, 6, 6]).tolist() == [0]
+    assert GridIndex(np.zeros((0, 4))).query([0, 0, 100, 100]).tolist() == []
+
+def make_coco(rng, n_images = 4, n_anns = 600):
+    bboxes = random_boxes(rng, n_anns)
+    image_ids = rng.integers(0, n_images, n_anns) * 10
+    annotations = [{'id': k, 'image_id': int(i), 'category_id': 1, 'bbox': b.tolist()}
+                   for k, (i, b) in enumerate(zip(image_ids, bboxes))]
+    # The last image has no annotations
+    images = [{'id': i * 10, 'width': 1000, 'height': 1000} for i in range(n_images + 1)]
+    return {'images': images, 'annotations': annotations, 'categories': [{'id': 1, 'name': 'a'}]}
+
+def test_spatial_index_matches_brute_force():
+    rng = np.random.default_rng(1)
+    coco = make_coco(rng)
+    index = SpatialIndex(coco)
+    for im in coco['images']:
+        anns = [a for a in coco['annotations'] if a['image_id'] == im['id']]
+        bboxes = [a['bbox'] for a in anns]
+        for window in random_windows(rng, 50):
+            expected = sorted(anns[k]['id'] for k in brute_force(bboxes, window))
+            assert sorted(a['id'] for a in index.query(im['id'], window)) == expected
+
+def test_query_point_matches_brute_force():
+    rng = np.random.default_rng(2)
+    coco = make_coco(rng)
+    index = SpatialIndex(coco, cell_size = 50)
+    for image_id in (0, 10, 20, 30):
+        anns = [a for a in coco['annotations'] if a['image_id'] == image_id]
+        for x, y, r in zip(*rng.uniform(0, 1000, (2, 30)), rng.uniform(0, 100, 30)):
+            expected = []
+            for a in anns:
+                bx, by, bw, bh = a['bbox']
+                dx = max(bx - x, x - (bx + bw), 0)
+                dy = max(by - y, y - (by + bh), 0)
+                if dx * dx + dy * dy <= r * r:
+                    expected.append(a['id'])
+            assert sorted(a['id'] for a in index.query_point(image_id, x, y, r)) == sorted(expected)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from coco_utils.dataset import CocoDataset
+from coco_utils.split import iterative_stratification, split_image_ids, split_report
+
+
+def skewed_counts(n_images = 5000, n_categories = 20, seed = 0):
+    # Zipf-like category frequencies, about 16 annotations an image
+    rng = np.random.default_rng(seed)
+    p = 1 / np.arange(1, n_categories + 1) ** 1.2
+    image_rows = np.repeat(np.arange(n_images), rng.poisson(16, n_images))
+    categories = rng.choice(n_categories, len(image_rows), p = p / p.sum())
+    counts = np.zeros((n_images, n_categories), dtype = np.int64)
+    np.add.at(counts, (image_rows, categories), 1)
+    return counts
+
+def test_category_shares_are_near_target():
+    counts = skewed_counts()
+    fractions = [0.8, 0.1, 0.1]
+    assignment = iterative_stratification(counts, fractions, seed = 0)
+    assert (assignment >= 0).all()
+
+    totals = counts.sum(axis = 0)
+    for split, fraction in enumerate(fractions):
+        share = counts[assignment == split].sum(axis = 0) / totals
+        # Whole images move between splits, so shares are near the target but not exact
+        assert np.abs(share - fraction).max() < 0.025
+
+def test_groups_stay_in_one_split():
+    counts = skewed_counts(200, 5)
+    images = [{'id': k, 'source': k % 7} for k in range(len(counts))]
+    annotations = []
+    for im, cat in zip(*np.nonzero(counts)):
+        for _ in range(counts[im, cat]):
+            annotations.append({'id': len(annotations), 'image_id': int(im), 'category_id': int(cat) + 1, 'bbox': [0, 0, 1, 1]})
+    dataset = CocoDataset({'images': images, 'annotations': annotations,
+                           'categories': [{'id': c + 1, 'name': str(c)} for c in range(5)]})
+
+    splits = split_image_ids(dataset, {'train': 0.8, 'val': 0.1, 'test': 0.1}, group_key = 'source')
+    sources = [{k % 7 for k in ids.tolist()} for ids in splits.values()]
+    assert sum(len(s) for s in sources) == 7
+    assert sum(r['annotations'] for r in split_report(dataset, splits).values()) == len(annotations)
+
+def small_dataset(n_images, sources):
+    images = [{'id': k, 'source': sources[k]} for k in range(n_images)]
+    annotations = [{'id': k, 'image_id': k, 'category_id': 1, 'bbox': [0, 0, 1, 1]} for k in range(n_images)]
+    return CocoDataset({'images': images, 'annotations': annotations, 'categories': [{'id': 1, 'name': 'a'}]})
+
+def test_too_few_groups_warns(capsys):
+    dataset = small_dataset(6, [0, 0, 0, 1, 1, 1])
+    splits = split_image_ids(dataset, {'train': 0.8, 'val': 0.1, 'test': 0.1}, group_key = 'source')
+    assert sum(len(ids) for ids in splits.values()) == 6
+    out = capsys.readouterr().out
+    assert 'only 2 groups of images to share between 3 splits' in out
+    assert 'no images in split' in out
+
+def test_empty_split_warns(capsys):
+    # Enough groups, but two of them hold nearly all the images so both go to train
+    dataset = small_dataset(101, [0] * 50 + [1] * 50 + [2])
+    splits = split_image_ids(dataset, {'train': 0.8, 'val': 0.1, 'test': 0.1}, group_key = 'source')
+    assert len(splits['val']) == 0 or len(splits['test']) == 0
+    out = capsys.readouterr().out
+    assert 'no images in split' in out and 'only' not in out
+
+def test_no_warning_for_zero_fraction_splits(capsys):
+    splits = split_image_ids(small_dataset(4, [0, 1, 2, 3]), {'train': 0.5, 'val': 0.5, 'test': 0.0})
+    assert len(splits['test']) == 0
+    assert sorted(len(ids) for ids in splits.values()) == [0, 2, 2]
+    assert capsys.readouterr().out == ''
+
+def test_bad_fractions():
+    dataset = small_dataset(4, [0, 1, 2, 3])
+    for fractions in ({'train': 0.0, 'val': 0.0}, {'train': 1.2, 'val': -0.2}):
+        with pytest.raises(ValueError):
+            split_image_ids(dataset, fractions)
@@ -1,7 +1,19 @@
 import json
-import shutil
 import os
-from matplotlib import pyplot as plt
+import numpy as np
+from coco_utils.image_size import get_image_size
+from coco_utils.json_stream import iter_json_array
+from coco_utils.coco_writer import CocoWriter
+from coco_utils.columnar import columnar_path, open_coco_writer
+from coco_utils.file_cache import cached_ordered_map
+from coco_utils.geo_index import GeoIndex, geo_index_path
+from coco_utils.metrics import add_count, stage, timed_iter
+from coco_utils.pool import batched
+
+# Number of annotations clipped and written at a time by make_json
+CLIP_BATCH_SIZE = 100000
+# Number of features whose geo boxes are computed together
+FEATURE_BATCH_SIZE = 10000
 
 def get_bbox(feature):
     '''
@@ -47,32 +59,62 @@ def get_bbox_geos(feature):
     
     return [lat_1, long_1, w, h]
 
-def get_images(image_folder):
+def get_bbox_geos_batch(features):
+    '''
+    IN: list of features from xview geojson
+    OUT: (N, 4) float array of the same boxes as get_bbox_geos, computed for all the features at once
+    '''
+    # Stack every feature's ring into one array of points, then take the min and max of each ring's run
+    rings = [f['geometry']['coordinates'][0] for f in features]
+    if not rings:
+        return np.zeros((0, 4))
+    lengths = np.array([len(r) for r in rings], dtype = np.int64)
+    points = np.array([c[:2] for r in rings for c in r], dtype = np.float64).reshape(-1, 2)
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    mins = np.minimum.reduceat(points, starts, axis = 0)
+    maxs = np.maximum.reduceat(points, starts, axis = 0)
+    
+    return np.column_stack([mins, maxs - mins])
+
+def iter_features(geojson_path):
+    '''
+    IN: xview geojson
+    OUT: generator of the geojson's features, read from disk one at a time
+    '''
+    return iter_json_array(geojson_path, 'features')
+
+def get_images(image_folder, workers = 1, cache_path = None):
     '''
-    IN: image folder where images you want in your coco .json are stored
+    IN: 
+        - image_folder: image folder where images you want in your coco .json are stored
+        - workers: number of threads to read image sizes with
+        - cache_path: sqlite file to cache image sizes in between runs, None to disable
     OUT: coco style 'images' section
     '''
     
     images = []
     
-    imgs = os.listdir(image_folder)
-    # Check if this is a folder of images or a folder of folders of images
-    if '.' not in imgs[0]:
-        folders = [image_folder + a for a in imgs]
-        imgs = []
-        for folder in folders:
-            new_files = os.listdir(folder)
-            for f in new_files:
-                imgs.append(folder + '/' + f)
-    else:
-        imgs = [image_folder + i for i in imgs]
+    with stage('listing'):
+        imgs = os.listdir(image_folder)
+        # Check if this is a folder of images or a folder of folders of images
+        if '.' not in imgs[0]:
+            folders = [image_folder + a for a in imgs]
+            imgs = []
+            for folder in folders:
+                new_files = os.listdir(folder)
+                for f in new_files:
+                    imgs.append(folder + '/' + f)
+        else:
+            imgs = [image_folder + i for i in imgs]
+    add_count('images', len(imgs))
         
     print("Found {} images in folder".format(len(imgs)))
     count = 0
     
-    for i in imgs:
-        img = plt.imread(i)
-        (h, w, c) = img.shape
+    # Read the size from each image header, results come back in the same order as imgs
+    sizes = cached_ordered_map(get_image_size, imgs, workers, threads = True, cache_path = cache_path)
+    
+    for i, (w, h, c) in zip(imgs, timed_iter('image probing', sizes)):
         
         im_id = int(i.split('/')[-1].split('.')[0])
         
@@ -117,139 +159,166 @@ def get_categories(classes_path):
     
     return categories
 
-def get_annotations(geojson_path):
+def iter_annotations(geojson_path):
     '''
     IN: xview geojson
-    OUT: coco gt 'annotations' section
+    OUT: generator of coco gt annotations, one per feature
     '''
-    annotations = []
-    
-    # Open gejson
-    with open(geojson_path, 'r') as f:
-        xview = json.load(f)
-    
-    # Pull features section out
-    features = xview['features']
+    # Read the features one at a time rather than loading the whole geojson
+    features = iter_features(geojson_path)
     
     # int to assign to each new annotation sequentially
     id_count = 0
     
-    # Process each xview feature
-    for f in features:
-        # Get bounding box, pixels
-        bbox = get_bbox(f)
-        
-        # Calculate area in pixels
-        area = bbox[2] * bbox[3]
+    # Process the xview features a batch at a time, so the geo boxes can be computed together
+    for batch in batched(features, FEATURE_BATCH_SIZE):
         
         # Get bbox, geos
-        bbox_geos = get_bbox_geos(f)
-        
-        # Find the id of the category of this annotation
-        cat_id = f['properties']['type_id']
+        all_bbox_geos = get_bbox_geos_batch(batch).tolist()
         
-        # Assign an image id based on the image file name
-        im_id = int(f['properties']['image_id'].split('.')[0])
-        
-        # Populate new annotation and add it to the main variable 
-        ann = {
-            "id": id_count, 
-            "image_id": im_id, 
-            "category_id": cat_id, 
-            "area": area, 
-            "bbox": bbox, 
-            "bbox_geos" : bbox_geos,
-            "iscrowd": 0  
-        }
-        annotations.append(ann)
-        id_count += 1
-    
-    return annotations
+        for f, bbox_geos in zip(batch, all_bbox_geos):
+            # Get bounding box, pixels
+            bbox = get_bbox(f)
+            
+            # Calculate area in pixels
+            area = bbox[2] * bbox[3]
+            
+            # Find the id of the category of this annotation
+            cat_id = f['properties']['type_id']
+            
+            # Assign an image id based on the image file name
+            im_id = int(f['properties']['image_id'].split('.')[0])
+            
+            # Populate new annotation and add it to the main variable 
+            ann = {
+                "id": id_count, 
+                "image_id": im_id, 
+                "category_id": cat_id, 
+                "area": area, 
+                "bbox": bbox, 
+                "bbox_geos" : bbox_geos,
+                "iscrowd": 0  
+            }
+            yield ann
+            id_count += 1
 
-def clip_bboxes_to_ims(json_path):
+def get_annotations(geojson_path):
     '''
-    PURPOSE: Modify annotations with negative pixel coordinates or coordinates outside the imge they're on, since xview is a whole disaster of a dataset
-    IN: path to gt coco json
+    IN: xview geojson
+    OUT: coco gt 'annotations' section
     '''
-    # Open the file
-    with open(json_path, 'r') as f:
-        gt = json.load(f)
+    return list(iter_annotations(geojson_path))
+
+def image_size_lookup(images, im_ids):
+    '''
+    IN:
+        - images: coco 'images' section
+        - im_ids: array of image ids, one per annotation
+    OUT: arrays of image width, image height and a found mask, one entry per id in im_ids
+    '''
+    # Index images by id once, sorted so each annotation can be matched with a binary search
+    ids = np.array([i['id'] for i in images], dtype = np.int64)
+    sizes = np.array([(i['width'], i['height']) for i in images], dtype = np.int64).reshape(-1, 2)
+    order = np.argsort(ids)
+    ids = ids[order]
+    sizes = sizes[order]
 
-    images = gt['images']
+    if len(ids) == 0:
+        found = np.zeros(len(im_ids), dtype = bool)
+        return np.zeros(len(im_ids)), np.zeros(len(im_ids)), found
 
-    new_annotations = []
+    pos = np.clip(np.searchsorted(ids, im_ids), 0, len(ids) - 1)
+    found = ids[pos] == im_ids
+    return sizes[pos, 0], sizes[pos, 1], found
+
+def clip_boxes(images, annotations):
+    '''
+    PURPOSE: Modify annotations with negative pixel coordinates or coordinates outside the image they're on, since xview is a whole disaster of a dataset
+    IN:
+        - images: coco 'images' section
+        - annotations: list of coco annotations
+    OUT: new annotations list with boxes clipped to their images and totally off-image boxes removed,
+         plus the number of boxes corrected below 0, corrected above the image size, and removed
+    '''
+    # Pull every box into one array so the clipping is done all at once
+    im_ids = np.array([a['image_id'] for a in annotations], dtype = np.int64)
+    boxes = np.array([a['bbox'] for a in annotations]).reshape(-1, 4)
+    w, h, found = image_size_lookup(images, im_ids)
+
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = x1 + boxes[:, 2]
+    y2 = y1 + boxes[:, 3]
     
     #Tracking
-    low = 0
-    high = 0
-    removed = 0
+    low = (x1 < 0) | (y1 < 0)
+    # Annotations on images we don't know the size of can't be too large
+    high = found & ((x2 > w) | (y2 > h))
     
-    #Process each annotation one by one
-    for a in gt['annotations']:
-        
-        # Key annotation information
-        b = a['bbox']
-        new_b = b.copy()
-        im_id = a['image_id']
-        
-        # Process annotations with negative bbox values
-        if b[0] < 0 or b[1] < 0:
-            if b[0] < 0:
-                new_b[0] = 0
-                new_b[2] = b[2] + b[0]
-            if b[1] < 0:
-                new_b[1] = 0
-                new_b[3] = b[3] + b[1]
-            low += 1
-        
-        # Check for annotations with annotations too large for image
-        for i in images:
-            if i['id'] == im_id:
-                w = i['width']
-                h = i['height']
+    # Clip to the image, leaving the far edge alone when the image is unknown
+    new_x1 = np.maximum(x1, 0)
+    new_y1 = np.maximum(y1, 0)
+    new_x2 = np.where(found, np.minimum(x2, w), x2)
+    new_y2 = np.where(found, np.minimum(y2, h), y2)
+    new_boxes = np.stack([new_x1, new_y1, new_x2 - new_x1, new_y2 - new_y1], axis = 1).astype(boxes.dtype)
+    
+    # Check to see if the annotations that were off-image were totally off-image
+    keep = (new_boxes[:, 2] > 0) & (new_boxes[:, 3] > 0)
 
-                if (b[0] + b[2]) > w or (b[1] + b[3]) > h:
-                    if (b[0] + b[2]) > w:
-                        new_b[2] = w - b[0]
-                    if (b[1] + b[3]) > h:
-                        new_b[3] = h - b[1]
-                    high += 1
-        
-        # Check to see if the annotations that were off-image were totally off-image
-        if new_b[2] > 0 and new_b[3] > 0:
-            new_a = a.copy()
-            new_a['bbox'] = new_b
-            new_annotations.append(new_a)
-        else:
-            removed += 1
+    new_annotations = []
+    for i in np.flatnonzero(keep):
+        new_a = annotations[i].copy()
+        new_a['bbox'] = new_boxes[i].tolist()
+        new_annotations.append(new_a)
+
+    return new_annotations, int(low.sum()), int(high.sum()), int((~keep).sum())
+
+def clip_annotations(images, annotations):
+    '''
+    PURPOSE: Clip annotations to their images, see clip_boxes
+    IN:
+        - images: coco 'images' section
+        - annotations: coco 'annotations' section
+    OUT: new annotations list
+    '''
+    new_annotations, low, high, removed = clip_boxes(images, annotations)
+    print("Corrected {} boxes with coords below 0 and {} with coords larger than image".format(low, high))
+    print('Removed', removed, 'annotations')
+    return new_annotations
 
+def clip_bboxes_to_ims(json_path):
+    '''
+    PURPOSE: Clip the annotations in an existing coco json to their images, see clip_annotations
+    IN: path to gt coco json
+    '''
+    # Open the file
+    with open(json_path, 'r') as f:
+        gt = json.load(f)
 
     new_gt = gt.copy()
-    new_gt['annotations'] = new_annotations
+    new_gt['annotations'] = clip_annotations(gt['images'], gt['annotations'])
     
-    # Delete old json and save out new annotations
-    os.remove(json_path)
-
-    with open(json_path, 'w') as f:
-        json.dump(new_gt, f)
+    # Save out new annotations, replacing the old json only once the new one is complete
+    with CocoWriter(json_path) as writer:
+        for key, value in new_gt.items():
+            writer.add_section(key, value)
         
-    print("Corrected {} boxes with coords below 0 and {} with coords larger than image".format(low, high))
-    print('Removed', removed, 'annotations')
     return
 
-def make_json(geojson_path, classes_path, image_folder):
+def make_json(geojson_path, classes_path, image_folder, workers = 1, cache = False, output_format = 'json', geo_index = False):
     '''
     PURPOSE: translate xview geojson to coco gt file
     IN:
         - geojson_path: path to xview geojson
         - classes_path: path to .txt file with xview class nums/names
         - image_folder: folder of images for these annotations
-    OUT: path to new coco json
+        - workers: number of threads used to scan the image folder
+        - cache: keep a cache of image sizes next to the new json, so re-runs only read new or changed images
+        - output_format: 'json', 'columnar' (a folder of numpy arrays, see coco_utils.columnar) or 'both'
+        - geo_index: also build a geospatial index of the annotations' bbox_geos next to the new json,
+                     see coco_utils.geo_index
+    OUT: path to new coco json (or columnar store, if only that was written)
     '''
-    # Open geojson
-    with open(geojson_path, 'r') as f:
-        xview = json.load(f)
-    
     # Create new path to save to
     new_path = geojson_path.replace('.geojson', '.json')
     
@@ -258,34 +327,56 @@ def make_json(geojson_path, classes_path, image_folder):
     licenses = [{"id": 1, "name": "xView"}]
     info = {"year": '2018', "version": '1', "description": 'xView', "contributor": 'DIUx', "date_created": "03/17/2020"}
     # Refer to functions above
-    images = get_images(image_folder)
+    cache_path = new_path + '.cache' if cache else None
+    images = get_images(image_folder, workers, cache_path)
     print('All images processed')
     categories = get_categories(classes_path)
-    annotations = get_annotations(geojson_path)
-    print('JSON sections complete')
     
-    # Create final structure 
-    coco_json = {
-        'info' : info,
-        'licenses' : licenses,
-        'images' : images,
-        'categories' : categories,
-        'annotations' : annotations
-    }
+    # Optionally index the geo boxes as they go past, swapped into place once the json is written
+    index = None
+    if geo_index:
+        index_tmp = geo_index_path(new_path) + '.tmp'
+        if os.path.exists(index_tmp):
+            os.remove(index_tmp)
+        index = GeoIndex(index_tmp)
     
-    # Ensure no funny business with save
-    if os.path.exists(new_path):
-        os.remove(new_path)
+    # Stream the file out section by section, in the order
+    # info, licenses, images, categories, annotations
+    with stage('serialization'), open_coco_writer(new_path, output_format, info = info, licenses = licenses) as writer:
+        writer.add_images(images)
+        writer.add_section('categories', categories)
+        
+        # Fix up boxes hanging off their images a batch at a time, so only one
+        # batch of annotations is ever held in memory
+        low = 0
+        high = 0
+        removed = 0
+        writer.start_array('annotations')
+        for batch in timed_iter('label parsing', batched(iter_annotations(geojson_path), CLIP_BATCH_SIZE)):
+            with stage('clipping'):
+                new_batch, b_low, b_high, b_removed = clip_boxes(images, batch)
+            writer.add_annotations(new_batch)
+            add_count('annotations', len(new_batch))
+            if index is not None:
+                with stage('geo indexing'):
+                    index.add_annotations(new_batch)
+            low += b_low
+            high += b_high
+            removed += b_removed
     
-    # Save file
-    with open(new_path, 'w') as f:
-        json.dump(coco_json, f)
+    print('JSON sections complete')
+    print("Corrected {} boxes with coords below 0 and {} with coords larger than image".format(low, high))
+    print('Removed', removed, 'annotations')
     
-    print('Part 1 complete')
+    if index is not None:
+        index.close()
+        os.replace(index_tmp, geo_index_path(new_path))
+        print('Geo index', geo_index_path(new_path))
     
-    clip_bboxes_to_ims(new_path)
+    if output_format == 'columnar':
+        new_path = columnar_path(new_path)
     
     # Feedback
     print('New json', new_path)
     
-    return new_path
\ No newline at end of file
+    return new_path